@@ -5,11 +5,16 @@ Jeff Kennedy, USGS
 1/23/2015
 """
 
+import os
+import sys
 from operator import sub
 from dateutil import parser
 
-stations = []
-data_file = "SanPedro_qaqc.txt"
+# measurement_store is in sgp-utils
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'sgp-utils'))
+from measurement_store import read_columns
+
+data_file = "SanPedro_qaqc.txt"  # fg5_parse output file, or a measurement store directory
 filesavename = "A10diff.csv"
 
 # Look for measurements between the respective date ranges for each campaign
@@ -21,18 +26,9 @@ date2_end   = parser.parse("1/30/2015")
 # Often there's stations in a project folder that we don't want to include in the comparison - instead of using all stations, specify a list of the stations we want.
 plot_stations = ["CDF","DORA","EOP","MW3","MW4","MW5","MW6","TW9","MDBLDG","GATE","FIRE","RIST","NEVA"]
 
-# Get station list and column numbers
-with open(data_file) as fp:
-    a = fp.readline()
-    tags = a.split("\t")
-    date_col = tags.index("Date")
-    sta_col = tags.index("Station Name")
-    grav_col = tags.index("Gravity")
-    for line in fp:
-        a = line.split("\t")
-        stations.append(a[sta_col])
-        
-stations = list(set(stations))
+# Get station list
+columns = read_columns(data_file, ('stationname', 'date', 'gravity'))
+stations = list(set(columns['stationname']))
         
 # Initialize blank array to hold data. First array of each list element is date, second is gravity.
 data = [[[],[]]]
@@ -40,15 +36,10 @@ for i in range(len(stations)-1):
     data.append([[],[]])
 
 # Compile measured gravity     
-with open(data_file) as fp:
-    a = fp.readline()
-    for line in fp:
-        a = line.split("\t")
-        sta = a[sta_col]
-        sta_index = stations.index(sta)
-        # using the dateutil parser we can plot dates directly
-        data[sta_index][0].append(parser.parse(a[date_col]))
-        data[sta_index][1].append(float(a[grav_col]))
+for sta, date, grav in zip(columns['stationname'], columns['date'], columns['gravity']):
+    sta_index = stations.index(sta)
+    data[sta_index][0].append(date)
+    data[sta_index][1].append(grav)
 
 # Setup output array. Bad values are ID'd by -9999. If there's one good and one missing value, a number slightly different than -9999 will be written to ouput.
 date1_data = []
@@ -68,9 +59,9 @@ for idx,station in enumerate(plot_stations):
                 date2_data[idx] = data[i][1][date_idx]
                     
 # Calculate difference and print results
-diff = map(sub,date2_data,date1_data)
+diff = list(map(sub,date2_data,date1_data))
 for s,d in zip(plot_stations,diff):
-    print s,d
+    print(s,d)
 
 #write output
 fout = open(filesavename,"w")
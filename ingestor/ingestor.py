@@ -64,6 +64,9 @@ from shutil import copy, copyfile
 import configparser
 
 from fg5 import FG5
+from parse_cache import ParseCache  # fg5 adds sgp-utils to the path
+from project_txt import ProjectRecord
+from dir_scan import scan_tree
 from cosmos import CR_data
 import gps
 
@@ -86,6 +89,7 @@ G_PHOTO_TIME_DIFF_THRESHOLD = 30 * 60
 PICTURE_SIZE = 200  # For preview, in pixels
 
 START_DATE_OFFSET = -60  # in days before present to start looking for project files
+DATE_FILTER_FIELDS = {'stationname', 'date', 'time'}  # read from each project file to check the date range
 
 alphabet = 'abcdefghijklmnopqrstuvwxyz'  # For sequential photo renaming
 
@@ -523,7 +527,7 @@ class MyApp(QMainWindow):
                 text = QTableWidgetItem('Copy ' +
                                         os.path.basename(fg5.filename) +
                                         ' (' +
-                                        fg5.collected +
+                                        str(fg5.collected) +
                                         ' sets)')
                 self.preview_window.ui.previewTableWidget.setItem(row, 1, text)
 
@@ -568,39 +572,49 @@ class MyApp(QMainWindow):
         self.preview_window.ui.previewTableWidget.setItem(row, 0, cb)
         return row
 
+    def in_date_range(self, record):
+        """
+        :param record: dict with at least 'date' and 'time' (see project_txt.parse_project_lines())
+        """
+        return self.ui.startDateEdit.date() < ProjectRecord(record).dtime < self.ui.endDateEdit.date()
+
     def get_g_data(self, g_dir):
         data = list()
         self.ui.progressBar.setRange(0, 1000)
         i = 0
-        for dirname, dirnames, filenames in os.walk(g_dir):
-            for filename in filenames:
-                # Progress bar kludge
-                i += 1
-                if i >= 990:
-                    i = 0
-                self.ui.progressBar.setValue(i)
-                self.ui.progressBar.update()
-                fname = os.path.join(dirname, filename)
-                # If the file name ends in "project.txt"
-                if fname.find('project.txt') != -1:
-                    station_name_temp = filename.split('_')
-                    station_name = '_'.join(station_name_temp[:-1])
-                    self.ui.statusbar.showMessage('Searching for .fg5 files in {}'.format(station_name))
-                    self.ui.statusbar.update()
-                    fg5 = FG5(fname)
-                    if self.ui.startDateEdit.date() < fg5.dtime < self.ui.endDateEdit.date():
-                        if fg5.stationname == '':
-                            text1 = 'Error! The station name in file {} is blank. Ignoring this station; unxepected ' \
-                                'results may happen. Suggest fixing it in laptop_gdata_backup and re-running Ingestor.'\
-                                .format(fname)
-                            MessageBox(text1, '')
-                        elif fg5.stationname != station_name:
-                            text1 = 'Warning! The station name {} in the project.txt file {} does not match the name ' \
-                                    'of the file. Suggest fixing it in laptop_gdata_backup and re-running Ingestor.'\
-                                .format(fg5.stationname, fname)
-                            MessageBox(text1, '')
-                        else:
-                            data.append(FG5(fname))
+        cache = ParseCache()
+        for fname in scan_tree(g_dir, ('*project.txt',), skip_unpublished=False):
+            filename = os.path.basename(fname)
+            # Progress bar kludge
+            i += 1
+            if i >= 990:
+                i = 0
+            self.ui.progressBar.setValue(i)
+            self.ui.progressBar.update()
+            station_name_temp = filename.split('_')
+            station_name = '_'.join(station_name_temp[:-1])
+            self.ui.statusbar.showMessage('Searching for .fg5 files in {}'.format(station_name))
+            self.ui.statusbar.update()
+            print('Reading {}'.format(fname))
+            # Only the fields needed for filtering are read, unless the occupation is in the date
+            # range; then the rest of the file is read in the same pass (and stored in the cache)
+            record = cache.read_if(fname, DATE_FILTER_FIELDS, self.in_date_range)
+            if record is not None:
+                fg5 = FG5()
+                fg5.set_record(fname, record)
+                if fg5.stationname == '':
+                    text1 = 'Error! The station name in file {} is blank. Ignoring this station; unxepected ' \
+                        'results may happen. Suggest fixing it in laptop_gdata_backup and re-running Ingestor.'\
+                        .format(fname)
+                    MessageBox(text1, '')
+                elif fg5.stationname != station_name:
+                    text1 = 'Warning! The station name {} in the project.txt file {} does not match the name ' \
+                            'of the file. Suggest fixing it in laptop_gdata_backup and re-running Ingestor.'\
+                        .format(fg5.stationname, fname)
+                    MessageBox(text1, '')
+                else:
+                    data.append(fg5)
+        cache.close()
         self.ui.statusbar.showMessage('')
         return data
 
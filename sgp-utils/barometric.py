@@ -0,0 +1,154 @@
+"""
+Recomputes the barometric-pressure correction for every occupation in a parsed
+measurement table (a file written by fg5_parse.py or a measurement store; see
+measurement_store.py), with a different admittance and (or) nominal pressure.
+
+g corrects gravity for air pressure with
+
+    barometric correction = admittance * (observed pressure - nominal pressure)
+
+where the admittance is in microGal/hPa (0.30 by default) and the nominal
+pressure, in hPa, is from a standard atmosphere at the station elevation. The
+observed pressure isn't written to project.txt files, but it's recovered from the
+correction, admittance, and nominal pressure that are. The correction is then
+recomputed and gravity adjusted, for all occupations in one NumPy pass; project
+files aren't changed.
+
+Passing several admittances to sensitivity() returns one gravity vector per
+admittance (a 2-D array) from the same single call.
+
+Usage:
+    python barometric.py <data file> [--admittance 0.3 [0.35 ...]] [--standard-pressure]
+        [--output barometric.txt]
+
+Jeff Kennedy
+USGS
+"""
+import sys
+import argparse
+import numpy as np
+from measurement_store import read_columns, float_array
+
+COLUMNS = ('stationname', 'date', 'gravity', 'elev', 'nominalAP', 'barprescorr', 'admittance')
+DEFAULT_ADMITTANCE = 0.3  # microGal/hPa; g default, used if a file (or an older parsed table) doesn't have it
+
+
+def read_table(data_file):
+    """
+    Reads the columns needed to recompute the barometric correction.
+
+    :param data_file: file written by fg5_parse.py, or a measurement store
+    :return: dict of arrays, keyed by field (see COLUMNS); numeric fields are float arrays
+    """
+    data = read_columns(data_file, COLUMNS)
+    table = {'stationname': np.array(data['stationname'], dtype=object),
+             'date': np.array(data['date'], dtype=object)}
+    for column in COLUMNS[2:]:
+        table[column] = float_array(data[column])
+    table['admittance'] = np.where(np.isnan(table['admittance']), DEFAULT_ADMITTANCE, table['admittance'])
+    return table
+
+
+def standard_pressure(elev):
+    """
+    Nominal air pressure from the standard atmosphere (DIN 5450), as computed by g.
+
+    :param elev: station elevation, m (scalar or array)
+    :return: pressure, hPa
+    """
+    return 1013.25 * (1 - 0.0065 * np.asarray(elev, dtype=float) / 288.15) ** 5.2559
+
+
+def observed_pressure(table):
+    """
+    :param table: dict of arrays (see read_table())
+    :return: air pressure during each occupation, hPa; NaN if the admittance was zero
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        difference = np.where(table['admittance'] != 0, table['barprescorr'] / table['admittance'], np.nan)
+    return table['nominalAP'] + difference
+
+
+def recompute(table, admittance=None, nominal_pressure=None):
+    """
+    Recomputes the barometric correction and gravity.
+
+    :param table: dict of arrays (see read_table())
+    :param admittance: microGal/hPa; a scalar or one value per occupation. Any shape that broadcasts
+        against the occupations works, e.g. a column of admittances (see sensitivity()). Default is
+        the admittance in each file.
+    :param nominal_pressure: hPa; a scalar, one value per occupation, or 'standard' for the
+        standard atmosphere at the station elevation. Default is the nominal pressure in each file.
+    :return: dict of arrays 'gravity', 'barprescorr', 'delta' (change in gravity), 'pressure'
+        (observed), 'nominalAP', and 'admittance'
+    """
+    pressure = observed_pressure(table)
+    if admittance is None:
+        admittance = table['admittance']
+    if nominal_pressure is None:
+        nominal_pressure = table['nominalAP']
+    elif isinstance(nominal_pressure, str) and nominal_pressure == 'standard':
+        nominal_pressure = standard_pressure(table['elev'])
+    admittance = np.asarray(admittance, dtype=float)
+    nominal_pressure = np.asarray(nominal_pressure, dtype=float)
+
+    barprescorr = admittance * (pressure - nominal_pressure)
+    # Keep gravity where the pressure can't be recovered (zero admittance, or missing values)
+    delta = np.where(np.isnan(barprescorr), 0.0, barprescorr - table['barprescorr'])
+    barprescorr = np.where(np.isnan(barprescorr), table['barprescorr'], barprescorr)
+    shape = delta.shape
+    return {'gravity': table['gravity'] + delta, 'barprescorr': barprescorr, 'delta': delta,
+            'pressure': pressure, 'nominalAP': np.broadcast_to(nominal_pressure, shape),
+            'admittance': np.broadcast_to(admittance, shape)}
+
+
+def sensitivity(table, admittances, nominal_pressure=None):
+    """
+    Gravity for each of several admittances, in one vectorized call.
+
+    :param table: dict of arrays (see read_table())
+    :param admittances: sequence of admittances, microGal/hPa
+    :param nominal_pressure: see recompute()
+    :return: dict of 2-D arrays (see recompute()), one row per admittance and one column per occupation
+    """
+    return recompute(table, np.asarray(admittances, dtype=float)[:, np.newaxis], nominal_pressure)
+
+
+def write_table(fout, table, admittances, result):
+    """
+    Writes recomputed gravity, tab-delimited, with one gravity column per admittance.
+    """
+    fout.write('Station Name\tDate\tPressure\tOriginal Gravity\t' +
+               '\t'.join('Gravity ({})'.format(label) for label in admittances) + '\n')
+    gravity = np.atleast_2d(result['gravity'])
+    for idx in range(gravity.shape[1]):
+        fout.write('{}\t{}\t{:0.2f}\t{:0.2f}\t{}\n'.format(
+            table['stationname'][idx], table['date'][idx].strftime('%Y-%m-%d'), result['pressure'][idx],
+            table['gravity'][idx], '\t'.join('{:0.2f}'.format(g) for g in gravity[:, idx])))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Recompute barometric corrections with a different '
+                                                     'admittance and (or) nominal pressure.')
+    arg_parser.add_argument('data_file', help='fg5_parse.py output file, or a measurement store directory')
+    arg_parser.add_argument('--admittance', type=float, nargs='+',
+                            help='one or more admittances, microGal/hPa (default: the value in each file)')
+    arg_parser.add_argument('--standard-pressure', action='store_true',
+                            help='use the standard-atmosphere nominal pressure at each station elevation')
+    arg_parser.add_argument('--output', help='output file (default: standard output)')
+    args = arg_parser.parse_args()
+
+    table = read_table(args.data_file)
+    nominal = 'standard' if args.standard_pressure else None
+    if args.admittance:
+        result = sensitivity(table, args.admittance, nominal)
+        labels = ['{:0.3f}'.format(admittance) for admittance in args.admittance]
+    else:
+        result = recompute(table, nominal_pressure=nominal)
+        labels = ['file admittance']
+    if args.output:
+        with open(args.output, 'w') as fout:
+            write_table(fout, table, labels, result)
+        print('Output file written: {}'.format(args.output))
+    else:
+        write_table(sys.stdout, table, labels, result)
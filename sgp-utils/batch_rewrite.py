@@ -0,0 +1,203 @@
+"""
+Atomic, journaled rewriting of many files at once (e.g., project.txt files updated
+by fg5_update.py or restored by fg5_reset_directory.py).
+
+Each file is written to a temporary file in the same directory, which then
+replaces the target with os.replace(), so a file is never seen half-written, even
+if the run is interrupted. Files are written in a bounded thread pool (most of the
+time is spent waiting on the network share), with an advisory lock per file (a
+'<file>.lock' file) so that two runs can't update the same file at the same time.
+
+Before a file is replaced, its previous content is saved in a journal directory,
+and the journal records every file written. A run can be undone with rollback():
+
+    python batch_rewrite.py rollback <journal directory>
+
+Jeff Kennedy
+USGS
+"""
+import os
+import json
+import argparse
+import threading
+from time import strftime
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_JOURNAL_DIR = os.path.join(os.path.expanduser('~'), '.sgp-utils', 'journal')
+JOURNAL_FILE = 'journal.jsonl'
+DEFAULT_JOBS = 8
+
+
+class FileLockedError(Exception):
+    pass
+
+
+class FileLock(object):
+    """
+    Advisory lock on a file: a '<path>.lock' file, created exclusively.
+
+    :param path: file to lock
+    """
+
+    def __init__(self, path):
+        self.lock_file = path + '.lock'
+
+    def __enter__(self):
+        try:
+            fd = os.open(self.lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            raise FileLockedError('{} is locked (delete {} if no update is running)'.format(
+                self.lock_file[:-len('.lock')], self.lock_file))
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        os.remove(self.lock_file)
+
+
+def write_atomic(path, data):
+    """
+    Writes a file through a temporary file in the same directory and os.replace().
+
+    :param path: file to write
+    :param data: str (written in text mode, as open(path, 'w') would) or bytes
+    """
+    tmp_file = '{}.tmp{}-{}'.format(path, os.getpid(), threading.get_ident())
+    try:
+        with open(tmp_file, 'w' if isinstance(data, str) else 'wb') as fout:
+            fout.write(data)
+            fout.flush()
+            os.fsync(fout.fileno())
+        os.replace(tmp_file, path)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def _read(path):
+    """
+    :return: content of a file as bytes, or None if it doesn't exist
+    """
+    try:
+        with open(path, 'rb') as fin:
+            return fin.read()
+    except FileNotFoundError:
+        return None
+
+
+class BatchRewriter(object):
+    """
+    Rewrites files atomically in a thread pool, keeping a journal of the previous content.
+
+    :param journal_dir: directory for the journal; default is a new, time-stamped directory in
+        DEFAULT_JOURNAL_DIR
+    :param jobs: number of threads
+    :param journal: if False, previous content isn't saved (no rollback)
+    """
+
+    def __init__(self, journal_dir=None, jobs=DEFAULT_JOBS, journal=True):
+        if journal and not journal_dir:
+            journal_dir = os.path.join(DEFAULT_JOURNAL_DIR, strftime("%Y%m%d-%H%M%S") + '-' + str(os.getpid()))
+        self.journal_dir = journal_dir if journal else None
+        self.jobs = jobs
+        self._lock = threading.Lock()
+        self._n = 0
+        if self.journal_dir and not os.path.exists(self.journal_dir):
+            os.makedirs(self.journal_dir)
+
+    def _journal(self, path, previous):
+        """
+        Saves the previous content of a file and records it in the journal (before the file is
+        replaced, so an interrupted write can be rolled back too).
+        """
+        if not self.journal_dir:
+            return
+        with self._lock:
+            self._n += 1
+            saved = None
+            if previous is not None:
+                saved = '{:06d}.bak'.format(self._n)
+                with open(os.path.join(self.journal_dir, saved), 'wb') as fout:
+                    fout.write(previous)
+            with open(os.path.join(self.journal_dir, JOURNAL_FILE), 'a') as fout:
+                fout.write(json.dumps({'path': os.path.abspath(path), 'saved': saved}) + '\n')
+
+    def _write(self, path, data):
+        self._journal(path, _read(path))
+        write_atomic(path, data)
+
+    def _rewrite_one(self, change):
+        """
+        :param change: (path, content, copy_to) tuple; see rewrite()
+        """
+        path, content, copy_to = change
+        with FileLock(path):
+            if copy_to:
+                self._write(copy_to, _read(path))
+            if content is None:
+                self._journal(path, _read(path))
+                os.remove(path)
+            else:
+                self._write(path, content)
+
+    def rewrite(self, changes):
+        """
+        Rewrites files.
+
+        :param changes: iterable of (path, content, copy_to) tuples. content is str (written as
+            open(path, 'w') would) or bytes, or None to delete the file; if copy_to isn't None, the
+            current file is first copied there (e.g., to *.original.txt).
+        :return: (list of paths written, list of (path, error message) for files that weren't)
+        """
+        written, failed = [], []
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = [(change[0], executor.submit(self._rewrite_one, change)) for change in changes]
+            for path, future in futures:
+                try:
+                    future.result()
+                    written.append(path)
+                except (OSError, FileLockedError) as e:
+                    failed.append((path, str(e)))
+        if failed:
+            print('{} files not written:'.format(len(failed)))
+            for path, error in failed:
+                print('  {}: {}'.format(path, error))
+        return written, failed
+
+
+def rollback(journal_dir, jobs=DEFAULT_JOBS):
+    """
+    Restores the files recorded in a journal to their content before the run (files that didn't
+    exist are deleted, and deleted files are written back). A file written more than once is restored to its first saved content.
+
+    :param journal_dir: journal directory of a BatchRewriter run
+    :return: number of files restored
+    """
+    with open(os.path.join(journal_dir, JOURNAL_FILE)) as fin:
+        entries = [json.loads(line) for line in fin if line.strip()]
+    # Oldest entry per file = content before the run
+    first = {}
+    for entry in entries:
+        first.setdefault(entry['path'], entry)
+
+    def restore(entry):
+        with FileLock(entry['path']):
+            if entry['saved'] is None:
+                if os.path.exists(entry['path']):
+                    os.remove(entry['path'])
+            else:
+                write_atomic(entry['path'], _read(os.path.join(journal_dir, entry['saved'])))
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        list(executor.map(restore, first.values()))
+    return len(first)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Undo a batch of file updates.')
+    subparsers = arg_parser.add_subparsers(dest='command', required=True)
+    rollback_parser = subparsers.add_parser('rollback', help='restore the files recorded in a journal')
+    rollback_parser.add_argument('journal_dir', help='journal directory (printed when the update ran)')
+    args = arg_parser.parse_args()
+    print('{} files restored'.format(rollback(args.journal_dir)))
@@ -0,0 +1,179 @@
+"""
+Registry of laser and clock calibrations, keyed by instrument serial number.
+
+Calibrations (performed at Micro-g LaCoste) are recorded in one workbook per
+instrument, e.g. 'A10-008 clock and laser calibrations.xlsx', with two worksheets:
+
+    calibrations         one row per calibration, sorted by date:
+                         date | accepted clock | clock | blue laser | red laser
+    DRIFT LOOKUP TABLE   one row per interval between calibrations:
+                         BEGIN | END | MPD (laser drift rate, microGal/day)
+
+Each workbook is read once into sorted NumPy arrays, through a local cache of the
+worksheets (see workbook_cache.py), so the network share is only read when the
+workbook changes. Lookups for any number of dates are done in one call with
+np.searchsorted: a calibration lookup returns the most recent calibration on or
+before each date (as Excel's VLOOKUP(..., TRUE)), and a drift lookup returns the
+drift interval that contains each date.
+
+Example:
+    cal = CalibrationRegistry().get('A10-008')
+    drift_rate, elapsed_days, laser_corr = cal.drift(dates)
+
+Jeff Kennedy
+USGS
+"""
+import hashlib
+import datetime as dt
+import numpy as np
+import pandas as pd
+from workbook_cache import read_sheets
+
+CALIBRATION_DIR = "\\\\Igswztwwgszona\\Gravity Data Archive\\Absolute Data\\A-10\\" + \
+                  "Instrument Maintenance\\Calibrations"
+
+# Calibration workbook for each instrument
+WORKBOOKS = {
+    'A10-008': CALIBRATION_DIR + "\\A10-008 clock and laser calibrations.xlsx",
+}
+DEFAULT_SERIAL = 'A10-008'
+
+CALIBRATION_WORKSHEET = 'calibrations'
+DRIFT_WORKSHEET = 'DRIFT LOOKUP TABLE'
+
+
+def to_datetime64(dates):
+    """
+    :param dates: sequence of datetime.datetime, or of project.txt date strings (mm/dd/yy)
+    :return: numpy datetime64[s] array; dates that can't be read are NaT
+    """
+    if isinstance(dates, np.ndarray) and np.issubdtype(dates.dtype, np.datetime64):
+        return dates.astype('datetime64[s]')
+    values = []
+    for date in dates:
+        if isinstance(date, str):
+            try:
+                date = dt.datetime.strptime(date, '%m/%d/%y')
+            except ValueError:
+                date = None
+        values.append(date)
+    return np.array(values, dtype='datetime64[s]')
+
+
+class InstrumentCalibration(object):
+    """
+    Laser and clock calibrations for one instrument, as sorted arrays.
+
+    :param calibrations: DataFrame of the calibrations worksheet (first five columns: date,
+        accepted clock, clock, blue, red)
+    :param drift: DataFrame of the drift lookup table (columns BEGIN, END, MPD)
+    """
+
+    def __init__(self, calibrations, drift):
+        calibrations = calibrations.iloc[:, :5].dropna(subset=[calibrations.columns[0]])
+        cal_date = pd.to_datetime(calibrations.iloc[:, 0]).values.astype('datetime64[s]')
+        order = np.argsort(cal_date, kind='stable')
+        self.cal_date = cal_date[order]
+        self.clock_accepted = calibrations.iloc[:, 1].values.astype(float)[order]
+        self.clock = calibrations.iloc[:, 2].values.astype(float)[order]
+        self.blue = calibrations.iloc[:, 3].values.astype(float)[order]
+        self.red = calibrations.iloc[:, 4].values.astype(float)[order]
+
+        drift = drift.dropna(subset=['BEGIN', 'END'])
+        begin = pd.to_datetime(drift['BEGIN']).values.astype('datetime64[s]')
+        order = np.argsort(begin, kind='stable')
+        self.begin = begin[order]
+        self.end = pd.to_datetime(drift['END']).values.astype('datetime64[s]')[order]
+        self.mpd = drift['MPD'].values.astype(float)[order]
+
+    @property
+    def version(self):
+        """
+        :return: short hash of the calibrations and drift intervals; changes when the workbook is
+            updated (e.g., a drift rate is revised)
+        """
+        digest = hashlib.sha1()
+        for values in (self.cal_date, self.clock_accepted, self.clock, self.blue, self.red, self.begin,
+                       self.end, self.mpd):
+            digest.update(values.tobytes())
+        return digest.hexdigest()[:12]
+
+    @classmethod
+    def from_workbook(cls, workbook):
+        """
+        :param workbook: path to a calibration workbook; read through the local cache (see
+            workbook_cache.py)
+        """
+        sheets = read_sheets(workbook, [CALIBRATION_WORKSHEET, DRIFT_WORKSHEET])
+        return cls(sheets[CALIBRATION_WORKSHEET], sheets[DRIFT_WORKSHEET])
+
+    def calibration(self, dates):
+        """
+        Most recent calibration on or before each date.
+
+        :param dates: sequence of dates (see to_datetime64())
+        :return: dict of arrays 'clock_accepted', 'clock', 'blue', 'red'; NaN for dates before
+            the first calibration (or that can't be read)
+        """
+        dates = to_datetime64(dates)
+        idx = np.searchsorted(self.cal_date, dates, side='right') - 1
+        valid = (idx >= 0) & ~np.isnat(dates)
+        idx = np.where(valid, idx, 0)
+        result = {}
+        for name in ('clock_accepted', 'clock', 'blue', 'red'):
+            values = getattr(self, name)
+            result[name] = np.where(valid, values[idx], np.nan) if len(values) else np.full(len(dates), np.nan)
+        return result
+
+    def drift_index(self, dates):
+        """
+        :param dates: sequence of dates (see to_datetime64())
+        :return: index of the drift interval with BEGIN < date < END for each date, or -1
+        """
+        dates = to_datetime64(dates)
+        idx = np.searchsorted(self.begin, dates, side='left') - 1
+        valid = (idx >= 0) & ~np.isnat(dates)
+        if len(self.begin):
+            valid &= dates < self.end[np.where(valid, idx, 0)]
+        return np.where(valid, idx, -1)
+
+    def drift(self, dates):
+        """
+        Laser drift correction for each date: the drift interval with BEGIN < date < END.
+
+        :param dates: sequence of dates (see to_datetime64())
+        :return: (drift rate, elapsed days since BEGIN, laser correction) arrays; all three are 0
+            for dates that aren't in an interval
+        """
+        dates = to_datetime64(dates)
+        idx = self.drift_index(dates)
+        valid = idx >= 0
+        elapsed = np.zeros(len(dates))
+        rate = np.zeros(len(dates))
+        # Whole days, as timedelta.days
+        elapsed[valid] = (dates[valid] - self.begin[idx[valid]]).astype('timedelta64[D]').astype(float)
+        rate[valid] = self.mpd[idx[valid]]
+        return rate, elapsed, elapsed * rate
+
+
+class CalibrationRegistry(object):
+    """
+    Calibrations for each instrument, loaded from its workbook on first use.
+
+    :param workbooks: dict of {serial number: workbook path}; default WORKBOOKS
+    """
+
+    def __init__(self, workbooks=None):
+        self.workbooks = dict(WORKBOOKS if workbooks is None else workbooks)
+        self.instruments = {}
+
+    def get(self, serial=DEFAULT_SERIAL):
+        """
+        :param serial: instrument serial number, e.g. 'A10-008'
+        :return: InstrumentCalibration
+        """
+        if serial not in self.instruments:
+            if serial not in self.workbooks:
+                raise KeyError('No calibration workbook for instrument {}'.format(serial))
+            self.instruments[serial] = InstrumentCalibration.from_workbook(self.workbooks[serial])
+        return self.instruments[serial]
@@ -0,0 +1,264 @@
+"""
+Persistent inverted index of the Comments in project.txt files.
+
+Operators note laser trouble, wind, bad setups, and reprocessing in the Comments
+section of each project.txt file. This index maps each comment word, station,
+and date to the files that contain it, in an SQLite database, so a search of the
+whole archive doesn't require re-parsing it. The index is updated incrementally:
+only new or modified files (by modification time and size) are re-indexed, and
+deleted files are removed.
+
+Queries:
+    laser                  comments containing 'laser'
+    laser AND 2019         ... measured in 2019 (AND is optional: 'laser 2019' is the same)
+    wind station:RM109     comments containing 'wind', at station RM109 (spaces in
+                           station names are ignored: RM109 matches 'RM 109')
+    drift OR laser         either word
+    laser NOT drift        'laser' but not 'drift' (also: laser -drift)
+    reprocess*             words starting with 'reprocess' (otherwise words match exactly,
+                           so 'wind' doesn't match 'windy')
+    date:2019-10           measured in October 2019 (date:YYYY, date:YYYY-MM, or date:YYYY-MM-DD)
+
+Usage:
+    python comment_index.py update <directory> [--jobs N]
+    python comment_index.py query "laser AND 2019"
+
+Jeff Kennedy
+USGS
+"""
+import os
+import re
+import sqlite3
+import argparse
+import datetime as dt
+from dir_scan import scan_tree
+from parse_cache import ParseCache
+
+DEFAULT_INDEX_FILE = os.path.join(os.path.expanduser('~'), '.sgp-utils', 'comment_index.sqlite')
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+(?:\.[0-9]+)?')
+_YEAR_RE = re.compile(r'(19|20)\d\d$')
+
+
+def tokenize(text):
+    """
+    :return: list of lower-case words and numbers in text
+    """
+    return _TOKEN_RE.findall(text.lower())
+
+
+def station_token(station):
+    return 'station:' + re.sub(r'[^a-z0-9]', '', station.lower())
+
+
+def _iso_date(date):
+    """
+    :param date: date from a project.txt file (mm/dd/yy)
+    :return: YYYY-MM-DD, or '' if the date can't be read
+    """
+    try:
+        return dt.datetime.strptime(date, '%m/%d/%y').strftime('%Y-%m-%d')
+    except ValueError:
+        return ''
+
+
+def document_tokens(record):
+    """
+    :param record: dict returned by project_txt.read_project_txt()
+    :return: set of index tokens for a project.txt file: comment words, the station, and the
+        date (at year, month, and day resolution)
+    """
+    tokens = set(tokenize(record['comments']))
+    tokens.add(station_token(record['stationname']))
+    date = _iso_date(record['date'])
+    if date:
+        tokens.update(('date:' + date[:4], 'date:' + date[:7], 'date:' + date))
+    return tokens
+
+
+class CommentIndex(object):
+    """
+    SQLite inverted index of project.txt comments.
+
+    :param index_file: path to the SQLite database; created if it doesn't exist
+    """
+
+    def __init__(self, index_file=DEFAULT_INDEX_FILE):
+        index_dir = os.path.dirname(index_file)
+        if index_dir and not os.path.exists(index_dir):
+            os.makedirs(index_dir)
+        self.conn = sqlite3.connect(index_file)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS documents ('
+                          'id INTEGER PRIMARY KEY, '
+                          'path TEXT UNIQUE, '
+                          'mtime INTEGER, '
+                          'size INTEGER, '
+                          'station TEXT, '
+                          'date TEXT, '
+                          'comments TEXT)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS postings ('
+                          'token TEXT, '
+                          'document INTEGER, '
+                          'PRIMARY KEY (token, document)) WITHOUT ROWID')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS postings_document ON postings (document)')
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def _remove(self, doc_id):
+        self.conn.execute('DELETE FROM postings WHERE document = ?', (doc_id,))
+        self.conn.execute('DELETE FROM documents WHERE id = ?', (doc_id,))
+
+    def add(self, fname, record, key=None):
+        """
+        Adds (or replaces) one project.txt file in the index.
+
+        :param fname: path to the project.txt file
+        :param record: dict returned by project_txt.read_project_txt() or ParseCache.read()
+        :param key: (mtime_ns, size) of the file, if already known
+        """
+        if key is None:
+            st = os.stat(fname)
+            key = (st.st_mtime_ns, st.st_size)
+        path = os.path.abspath(fname)
+        row = self.conn.execute('SELECT id FROM documents WHERE path = ?', (path,)).fetchone()
+        if row:
+            self._remove(row[0])
+        cursor = self.conn.execute('INSERT INTO documents (path, mtime, size, station, date, comments) '
+                                   'VALUES (?, ?, ?, ?, ?, ?)',
+                                   (path, key[0], key[1], record['stationname'], _iso_date(record['date']),
+                                    record['comments']))
+        self.conn.executemany('INSERT INTO postings VALUES (?, ?)',
+                              ((token, cursor.lastrowid) for token in document_tokens(record)))
+
+    def update(self, directory, jobs=1, skip_unpublished=False):
+        """
+        Brings the index up to date with the project.txt files below a directory: new and modified
+        files are (re-)indexed, and files that no longer exist are removed.
+
+        :param directory: directory to index
+        :param jobs: number of worker processes used to parse new or modified files
+        :param skip_unpublished: if True, directories named 'unpublished' aren't indexed
+        :return: (number of files indexed, number of files removed)
+        """
+        top = os.path.join(os.path.abspath(directory), '')
+        indexed = {path: (doc_id, (mtime, size)) for doc_id, path, mtime, size in
+                   self.conn.execute('SELECT id, path, mtime, size FROM documents WHERE substr(path, 1, ?) = ?',
+                                     (len(top), top))}
+        changed, keys, seen = [], [], set()
+        for fname in scan_tree(directory, ('*project.txt',), skip_unpublished=skip_unpublished):
+            path = os.path.abspath(fname)
+            seen.add(path)
+            st = os.stat(fname)
+            key = (st.st_mtime_ns, st.st_size)
+            if path not in indexed or indexed[path][1] != key:
+                changed.append(fname)
+                keys.append(key)
+        if changed:
+            with ParseCache() as cache:
+                records = cache.read_many(changed, jobs)
+            for fname, record, key in zip(changed, records, keys):
+                self.add(fname, record, key)
+        removed = [doc_id for path, (doc_id, key) in indexed.items() if path not in seen]
+        for doc_id in removed:
+            self._remove(doc_id)
+        self.conn.commit()
+        return len(changed), len(removed)
+
+    def _term_documents(self, term):
+        """
+        :return: set of document ids matching one query term
+        """
+        term = term.lower()
+        if term.startswith('station:'):
+            tokens = [station_token(term[len('station:'):])]
+        elif term.startswith('date:'):
+            tokens = [term]
+        else:
+            tokens = tokenize(term.rstrip('*'))
+            if not tokens:
+                return set()
+            if term.endswith('*'):
+                # Comment words only; field tokens (station:, date:) contain a colon
+                rows = self.conn.execute('SELECT document FROM postings WHERE token >= ? AND token < ? '
+                                         "AND instr(token, ':') = 0", (tokens[-1], tokens[-1] + '\uffff'))
+                return {row[0] for row in rows}
+            if len(tokens) == 1 and _YEAR_RE.match(tokens[0]):
+                # A bare year matches the measurement date as well as the comments
+                return self._token_documents(tokens[0]) | self._token_documents('date:' + tokens[0])
+        # A term that tokenizes to several words (e.g. 'RM-109') needs all of them
+        docs = self._token_documents(tokens[0])
+        for token in tokens[1:]:
+            docs &= self._token_documents(token)
+        return docs
+
+    def _token_documents(self, token):
+        return {row[0] for row in self.conn.execute('SELECT document FROM postings WHERE token = ?', (token,))}
+
+    def query(self, query):
+        """
+        Searches the index. See the module docstring for the query syntax.
+
+        :param query: query string, e.g. 'laser AND 2019' or 'wind station:RM109'
+        :return: list of dicts with keys 'path', 'station', 'date' (YYYY-MM-DD), and 'comments',
+            sorted by date
+        """
+        matches = set()
+        for clause in re.split(r'\s+OR\s+', query.strip()):
+            include, exclude = None, set()
+            negate = False
+            for term in clause.split():
+                if term == 'AND':
+                    continue
+                if term == 'NOT':
+                    negate = True
+                    continue
+                if term.startswith('-') and len(term) > 1:
+                    negate, term = True, term[1:]
+                docs = self._term_documents(term)
+                if negate:
+                    exclude |= docs
+                    negate = False
+                else:
+                    include = docs if include is None else include & docs
+            if include:
+                matches |= include - exclude
+        if not matches:
+            return []
+        results = []
+        ids = sorted(matches)
+        for start in range(0, len(ids), 500):  # SQLite limits the number of parameters
+            chunk = ids[start:start + 500]
+            results += self.conn.execute('SELECT path, station, date, comments FROM documents WHERE id IN ({})'
+                                         .format(','.join('?' * len(chunk))), chunk).fetchall()
+        results.sort(key=lambda row: (row[2], row[0]))
+        return [dict(zip(('path', 'station', 'date', 'comments'), row)) for row in results]
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Search the Comments of project.txt files.')
+    arg_parser.add_argument('--index', default=DEFAULT_INDEX_FILE, help='index database')
+    subparsers = arg_parser.add_subparsers(dest='command', required=True)
+    update_parser = subparsers.add_parser('update', help='index new or modified files below a directory')
+    update_parser.add_argument('directory')
+    update_parser.add_argument('--jobs', type=int, default=1, help='number of processes used to parse files')
+    query_parser = subparsers.add_parser('query', help='search the index')
+    query_parser.add_argument('query', help='e.g. "laser AND 2019" or "wind station:RM109"')
+    args = arg_parser.parse_args()
+
+    with CommentIndex(args.index) as index:
+        if args.command == 'update':
+            n_indexed, n_removed = index.update(args.directory, jobs=args.jobs)
+            print('{} files indexed, {} removed'.format(n_indexed, n_removed))
+        else:
+            for result in index.query(args.query):
+                print('{}\t{}\t{}\t{}'.format(result['date'], result['station'], result['comments'],
+                                              result['path']))
@@ -0,0 +1,168 @@
+"""
+Ledger of the corrections applied to project.txt files by fg5_update.py and
+fg5_update_laser.py (see corrections.py).
+
+For each file, the ledger keeps the state the pipeline last saw or wrote
+(modification time, size, content hash, station, date, and the delta-g of each
+correction in the file), and it keeps a history of every correction applied
+(file, content hash, station, date, delta-g, drift rate and other details, and
+the version of the calibration or soil-moisture series it was computed from).
+
+On a re-run, a file whose modification time and size match the ledger isn't
+opened: its corrections are recomputed from the date in the ledger and compared to
+the ones already applied. After a recalibration of one instrument period, only the
+files whose correction changed are read and rewritten.
+
+Usage:
+    python correction_ledger.py history [--station RM109] [--path <project.txt file>]
+
+Jeff Kennedy
+USGS
+"""
+import os
+import json
+import sqlite3
+import argparse
+from time import strftime
+
+DEFAULT_LEDGER_FILE = os.path.join(os.path.expanduser('~'), '.sgp-utils', 'correction_ledger.sqlite')
+
+
+class CorrectionLedger(object):
+    """
+    SQLite ledger of applied corrections.
+
+    :param ledger_file: path to the SQLite database; created if it doesn't exist
+    """
+
+    def __init__(self, ledger_file=DEFAULT_LEDGER_FILE):
+        ledger_dir = os.path.dirname(ledger_file)
+        if ledger_dir and not os.path.exists(ledger_dir):
+            os.makedirs(ledger_dir)
+        self.conn = sqlite3.connect(ledger_file)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS files ('
+                          'path TEXT PRIMARY KEY, '
+                          'mtime INTEGER, '
+                          'size INTEGER, '
+                          'hash TEXT, '
+                          'station TEXT, '
+                          'date TEXT, '
+                          'time TEXT)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS applied ('
+                          'path TEXT, '
+                          'correction TEXT, '
+                          'delta_g REAL, '
+                          'PRIMARY KEY (path, correction))')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS history ('
+                          'id INTEGER PRIMARY KEY, '
+                          'path TEXT, '
+                          'hash TEXT, '
+                          'station TEXT, '
+                          'date TEXT, '
+                          'correction TEXT, '
+                          'delta_g REAL, '
+                          'previous REAL, '
+                          'details TEXT, '
+                          'version TEXT, '
+                          'applied TEXT)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS history_path ON history (path)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS history_station ON history (station)')
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def known(self, fnames):
+        """
+        :param fnames: paths to project.txt files
+        :return: dict of {filename: (key, record, applied)} for the files in the ledger. key is
+            (mtime_ns, size) when the ledger entry was made, record is a dict with 'stationname',
+            'date', and 'time', and applied is a dict of {correction name: delta-g in the file}.
+        """
+        paths = {os.path.abspath(fname): fname for fname in fnames}
+        known = {}
+        for path, mtime, size, station, date, time in self.conn.execute(
+                'SELECT path, mtime, size, station, date, time FROM files'):
+            if path in paths:
+                known[paths[path]] = ((mtime, size), {'stationname': station, 'date': date, 'time': time}, {})
+        for path, correction, delta_g in self.conn.execute('SELECT path, correction, delta_g FROM applied'):
+            if path in paths and paths[path] in known:
+                known[paths[path]][2][correction] = delta_g
+        return known
+
+    def set_state(self, fname, key, text_hash, record, applied):
+        """
+        Records the state of a file.
+
+        :param fname: path to the project.txt file
+        :param key: (mtime_ns, size) of the file
+        :param text_hash: hash of the content of the file (see project_document.content_hash())
+        :param record: dict with 'stationname', 'date', and 'time'
+        :param applied: dict of {correction name: delta-g in the file}
+        """
+        path = os.path.abspath(fname)
+        self.conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)',
+                          (path, key[0], key[1], text_hash, record['stationname'], record['date'],
+                           record['time']))
+        self.conn.execute('DELETE FROM applied WHERE path = ?', (path,))
+        self.conn.executemany('INSERT INTO applied VALUES (?, ?, ?)',
+                              ((path, name, delta_g) for name, delta_g in applied.items()))
+
+    def log(self, fname, text_hash, station, date, correction, delta_g, previous, details, version):
+        """
+        Adds a correction to the history.
+
+        :param details: dict of values that describe the correction (e.g., drift rate)
+        :param version: version of the data the correction was computed from (e.g., calibration)
+        """
+        self.conn.execute('INSERT INTO history (path, hash, station, date, correction, delta_g, previous, '
+                          'details, version, applied) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                          (os.path.abspath(fname), text_hash, station, date, correction, delta_g, previous,
+                           json.dumps(details), version, strftime("%Y-%m-%d %H:%M:%S")))
+
+    def commit(self):
+        self.conn.commit()
+
+    def history(self, station=None, path=None):
+        """
+        :param station: only corrections at this station
+        :param path: only corrections of this file
+        :return: list of dicts, oldest first
+        """
+        columns = ('applied', 'path', 'station', 'date', 'correction', 'delta_g', 'previous', 'details',
+                   'version', 'hash')
+        query = 'SELECT {} FROM history'.format(', '.join(columns))
+        conditions, params = [], []
+        if station is not None:
+            conditions.append('station = ?')
+            params.append(station)
+        if path is not None:
+            conditions.append('path = ?')
+            params.append(os.path.abspath(path))
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        rows = self.conn.execute(query + ' ORDER BY id', params)
+        return [dict(zip(columns, row)) for row in rows]
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Show the corrections applied to project.txt files.')
+    arg_parser.add_argument('--ledger', default=DEFAULT_LEDGER_FILE, help='ledger database')
+    subparsers = arg_parser.add_subparsers(dest='command', required=True)
+    history_parser = subparsers.add_parser('history', help='list applied corrections')
+    history_parser.add_argument('--station', help='only this station')
+    history_parser.add_argument('--path', help='only this project.txt file')
+    args = arg_parser.parse_args()
+
+    with CorrectionLedger(args.ledger) as ledger:
+        print('Applied\tStation\tDate\tCorrection\tDelta-g\tPrevious\tVersion\tDetails\tFile')
+        for entry in ledger.history(args.station, args.path):
+            print('{applied}\t{station}\t{date}\t{correction}\t{delta_g:0.2f}\t{previous:0.2f}\t{version}\t'
+                  '{details}\t{path}'.format(**entry))
@@ -0,0 +1,404 @@
+"""
+Correction pipeline for the gravity value in project.txt files.
+
+Each correction (laser drift, soil moisture, ...) is a plugin that computes, for
+all files at once, the change to the gravity value (delta-g, microGal) and the
+comment block that documents it:
+
+    Gravity value adjusted by 1.23 uGal for laser drift correction
+    Drift rate was 0.1000 microGal/day
+    Previous calibration was 12 days prior to measurement
+
+Each file is read once into a ProjectDocument (see project_document.py). The
+pipeline evaluates every correction for every file, combines them with any
+corrections already in the file (their comment blocks are replaced, and their
+delta-g removed from the gravity value), and rewrites each file once (atomically,
+with a journal for rollback; see batch_rewrite.py). Files that already have the
+same corrections aren't touched. Before a file is first corrected, it's copied to
+*.original.txt. With a correction ledger (see correction_ledger.py), files that are
+unchanged since the last run and whose corrections are up to date aren't opened.
+
+Example:
+    pipeline = CorrectionPipeline([LaserDriftCorrection(calibration)])
+    updates = pipeline.plan(fnames)
+    print(plan_report(updates))   # dry run
+    pipeline.apply(updates)
+
+Jeff Kennedy
+USGS
+"""
+import os
+import datetime
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from project_document import ProjectDocument, ADJUSTED_PREFIX, content_hash
+from batch_rewrite import BatchRewriter, DEFAULT_JOBS
+from soil_moisture import SoilMoistureSeries, ADMITTANCE
+
+# Corrections that differ from the applied value by less than this (microGal) aren't re-applied
+TOLERANCE = 0.02
+
+
+def _stat_key(fname):
+    st = os.stat(fname)
+    return st.st_mtime_ns, st.st_size
+
+
+class Adjustment(object):
+    """
+    One correction for one file.
+
+    :param delta_g: change to the gravity value, microGal
+    :param comment: list of comment lines (without line endings) that document the correction
+    :param values: tuple of strings for the correction's columns in the corrections csv file
+    """
+
+    __slots__ = ('delta_g', 'comment', 'values')
+
+    def __init__(self, delta_g, comment, values=()):
+        self.delta_g = delta_g
+        self.comment = comment
+        self.values = values
+
+
+class Correction(object):
+    """
+    Base class for corrections. Subclasses set name, description (the end of the 'Gravity value
+    adjusted by' comment line), csv_columns, and comment_prefixes, and implement compute().
+    """
+
+    name = ''
+    description = ''
+    version = ''  # of the data the correction is computed from; recorded in the correction ledger
+    csv_columns = ()
+    # Starts of the comment lines written by this correction (in addition to the adjusted-by line)
+    comment_prefixes = ()
+
+    def compute(self, records):
+        """
+        :param records: list of dicts returned by project_txt.read_project_txt()
+        :return: list with an Adjustment for each record, or None where the correction isn't
+            available (any existing correction in the file is kept)
+        """
+        raise NotImplementedError
+
+    def adjusted_comment(self, delta_g):
+        return '{} {:0.2f} uGal for {}'.format(ADJUSTED_PREFIX, delta_g, self.description)
+
+    def is_comment(self, line):
+        """
+        :return: True if line is part of a comment block written by this correction
+        """
+        line = line.strip()
+        if line.startswith(ADJUSTED_PREFIX) and line.endswith(self.description):
+            return True
+        return any(line.startswith(prefix) for prefix in self.comment_prefixes)
+
+    def previous(self, lines):
+        """
+        :param lines: comment lines of this correction found in a file
+        :return: delta-g of the correction already applied, or 0.0 if none
+        """
+        for line in lines:
+            if line.startswith(ADJUSTED_PREFIX):
+                return float(line.split()[4])
+        return 0.0
+
+
+class LaserDriftCorrection(Correction):
+    """
+    Laser drift since the previous calibration (see calibration.py).
+
+    :param calibration: calibration.InstrumentCalibration
+    """
+
+    name = 'laser'
+    description = 'laser drift correction'
+    csv_columns = ('Drift_corr', 'Drift_rate', 'Elapsed_days_since_cal')
+    comment_prefixes = ('Drift rate was', 'Previous calibration was', 'Gravity value not adjusted')
+
+    def __init__(self, calibration):
+        self.calibration = calibration
+        self.version = calibration.version
+
+    def compute(self, records):
+        drift_rates, elapsed, laser_corr = self.calibration.drift([record['date'] for record in records])
+        adjustments = []
+        for drift_rate, elapsed_days, corr in zip(drift_rates, elapsed, laser_corr):
+            values = ('{:0.2f}'.format(corr * -1), '{:0.4f}'.format(drift_rate), '{:.0f}'.format(elapsed_days))
+            if elapsed_days == 0 or abs(corr) < 0.0001:
+                comment = ['Gravity value not adjusted (no valid calibration data for the time period)']
+                adjustments.append(Adjustment(0.0, comment, values))
+            else:
+                # Typically laser_corr is negative, so this makes g larger
+                comment = [self.adjusted_comment(corr * -1),
+                           'Drift rate was {:0.4f} microGal/day'.format(drift_rate),
+                           'Previous calibration was {:.0f} days prior to measurement'.format(elapsed_days),
+                           '']
+                adjustments.append(Adjustment(corr * -1, comment, values))
+        return adjustments
+
+
+class SoilMoistureCorrection(Correction):
+    """
+    Root-zone soil moisture relative to its mean (see soil_moisture.py).
+
+    :param sm_file: SMAP csv file from the ORNL DAAC Soil Moisture Visualizer
+    :param admittance: microGal per unit of soil moisture
+    """
+
+    name = 'soil moisture'
+    description = 'soil moisture correction'
+    csv_columns = ('SM_corr', 'SM', 'SM_mean')
+    comment_prefixes = ('Soil moisture in the root zone',)
+
+    def __init__(self, sm_file, admittance=ADMITTANCE):
+        self.series = SoilMoistureSeries.from_smap_file(sm_file)
+        self.admittance = admittance
+        self.version = os.path.basename(sm_file)
+
+    def compute(self, records):
+        sm_mean = self.series.mean
+        sm, sm_corr = self.series.correction([record['date'] for record in records], self.admittance)
+        adjustments = []
+        for sm_at_time_of_g, corr in zip(sm, sm_corr):
+            if np.isnan(corr):
+                adjustments.append(None)
+                continue
+            comment = [self.adjusted_comment(corr * -1),
+                       'Soil moisture in the root zone (0-100 cm) was {:0.2f}; the mean value was {:0.2f}'.format(
+                           sm_at_time_of_g, sm_mean),
+                       '']
+            values = ('{:0.2f}'.format(corr * -1), '{:0.2f}'.format(sm_at_time_of_g), '{:0.2f}'.format(sm_mean))
+            adjustments.append(Adjustment(corr * -1, comment, values))
+        return adjustments
+
+
+class FileUpdate(object):
+    """
+    Planned update of one project.txt file.
+
+    :param doc: project_document.ProjectDocument of the file, before the update
+    """
+
+    def __init__(self, doc):
+        self.doc = doc
+        self.fname = doc.fname
+        self.station = doc.station
+        self.date = doc.date
+        self.gravity = doc.gravity  # value in the file
+        self.new_gravity = None
+        self.previous = {}  # {correction name: delta-g already applied}
+        self.adjustments = {}  # {correction name: Adjustment}
+        self.in_file = {}  # {correction name: delta-g} for the corrections in the file
+        self.changed = False
+        # No correction of any kind in the file yet (not only this pipeline's corrections)
+        self.first_correction = doc.status == 'update'
+
+    @property
+    def original_fname(self):
+        return self.fname.replace('project.txt', 'original.txt')
+
+    def applied(self):
+        """
+        :return: dict of {correction name: delta-g} for the corrections in the file after the update
+        """
+        applied = dict(self.in_file)
+        applied.update((name, adjustment.delta_g) for name, adjustment in self.adjustments.items())
+        return applied
+
+
+class CorrectionPipeline(object):
+    """
+    Applies a set of corrections to project.txt files, rewriting each file once.
+
+    :param corrections: list of Correction instances, in the order their comment blocks are written
+    :param ledger: correction_ledger.CorrectionLedger; if given, files that haven't changed since
+        the ledger entry and whose corrections are up to date aren't read
+    """
+
+    def __init__(self, corrections, ledger=None):
+        self.corrections = corrections
+        self.ledger = ledger
+
+    def plan(self, fnames, jobs=DEFAULT_JOBS):
+        """
+        Evaluates all corrections for all files. Each file is read once (in a thread pool); no
+        project.txt files are written.
+
+        :param fnames: paths to project.txt files
+        :param jobs: number of threads used to read files
+        :return: list of FileUpdate, for the files whose gravity value or comments change
+        """
+        fnames = list(fnames)
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            keys = dict(zip(fnames, executor.map(_stat_key, fnames)))
+            if self.ledger is not None:
+                fnames = self._unsettled(fnames, keys)
+            docs = list(executor.map(ProjectDocument.from_file, fnames))
+        records = [doc.record for doc in docs]
+        adjustments = [correction.compute(records) for correction in self.corrections]
+        updates = []
+        for idx, doc in enumerate(docs):
+            update = self._plan_file(doc, [adjustment[idx] for adjustment in adjustments])
+            if update is None:
+                continue
+            if update.changed:
+                updates.append(update)
+            elif self.ledger is not None:
+                self.ledger.set_state(doc.fname, keys[doc.fname], doc.hash, doc.record, update.in_file)
+        if self.ledger is not None:
+            self.ledger.commit()
+        return updates
+
+    def _unsettled(self, fnames, keys):
+        """
+        :return: the files that need to be read: files that aren't in the ledger or have changed
+            since, and files whose corrections differ from the ones recorded as applied
+        """
+        known = self.ledger.known(fnames)
+        settled = [fname for fname in fnames if fname in known and known[fname][0] == keys[fname]]
+        records = [known[fname][1] for fname in settled]
+        adjustments = [correction.compute(records) for correction in self.corrections]
+        skip = set()
+        for idx, fname in enumerate(settled):
+            applied = known[fname][2]
+            if all(adjustment[idx] is None or (correction.name in applied and
+                                               abs(applied[correction.name] - adjustment[idx].delta_g) < TOLERANCE)
+                   for correction, adjustment in zip(self.corrections, adjustments)):
+                skip.add(fname)
+        if skip:
+            print('{} files are up to date in the correction ledger'.format(len(skip)))
+        return [fname for fname in fnames if fname not in skip]
+
+    def _plan_file(self, doc, adjustments):
+        """
+        Edits a document in memory.
+
+        :param doc: project_document.ProjectDocument
+        :param adjustments: Adjustment (or None) for each correction
+        :return: FileUpdate (with changed = False if the file doesn't change), or None if the file
+            has no gravity value
+        """
+        if doc.gravity_index is None:
+            print('No gravity value in {}'.format(doc.fname))
+            return None
+        update = FileUpdate(doc)
+        remove = set()
+        for correction, adjustment in zip(self.corrections, adjustments):
+            block = doc.find(correction.is_comment)
+            previous = correction.previous([doc.lines[idx].strip() for idx in block])
+            if block:
+                update.in_file[correction.name] = previous
+            if adjustment is None:
+                continue
+            update.adjustments[correction.name] = adjustment
+            update.previous[correction.name] = previous
+            if not block or abs(previous - adjustment.delta_g) >= TOLERANCE:
+                update.changed = True
+            remove.update(block)
+        if not update.changed:
+            return update
+
+        delta_g = sum(adjustment.delta_g - update.previous[name] for name, adjustment in update.adjustments.items())
+        update.new_gravity = update.gravity + delta_g
+        # Comment lines of corrections that are re-applied are replaced
+        doc.remove(remove)
+        doc.set_gravity(update.new_gravity)
+        for correction in self.corrections:
+            if correction.name in update.adjustments:
+                doc.append(update.adjustments[correction.name].comment)
+        return update
+
+    def apply(self, updates, rewriter=None):
+        """
+        Writes planned updates (see batch_rewrite.py). Before a file is first corrected, it's copied
+        to *.original.txt; an existing *.original.txt is never overwritten. The corrections are
+        recorded in the ledger, if there is one.
+
+        :param updates: list of FileUpdate returned by plan()
+        :param rewriter: batch_rewrite.BatchRewriter; default is one with a new journal
+        :return: list of the FileUpdates that were written
+        """
+        if rewriter is None:
+            rewriter = BatchRewriter()
+        changes = []
+        for update in updates:
+            copy_to = None
+            if update.first_correction and not os.path.exists(update.original_fname):
+                copy_to = update.original_fname
+            changes.append((update.fname, update.doc.text(), copy_to))
+        written, failed = rewriter.rewrite(changes)
+        if rewriter.journal_dir:
+            print('Journal: {} (undo with: python batch_rewrite.py rollback "{}")'.format(
+                rewriter.journal_dir, rewriter.journal_dir))
+        written = set(written)
+        updates = [update for update in updates if update.fname in written]
+        if self.ledger is not None:
+            self._record(updates)
+        return updates
+
+    def _record(self, updates):
+        """
+        Records written updates in the ledger.
+        """
+        for update in updates:
+            text_hash = content_hash(update.doc.text())
+            self.ledger.set_state(update.fname, _stat_key(update.fname), text_hash, update.doc.record,
+                                  update.applied())
+            for correction in self.corrections:
+                adjustment = update.adjustments.get(correction.name)
+                if adjustment is None:
+                    continue
+                self.ledger.log(update.fname, text_hash, update.station, update.date, correction.name,
+                                adjustment.delta_g, update.previous[correction.name],
+                                dict(zip(correction.csv_columns, adjustment.values)), correction.version)
+        self.ledger.commit()
+
+    def csv_header(self):
+        columns = ['Station', 'Date']
+        for correction in self.corrections:
+            columns += correction.csv_columns
+        return ','.join(columns) + '\n'
+
+    def write_csv(self, fid, updates):
+        """
+        Writes a summary of the corrections, one line per file. Dates that can't be parsed (e.g., a
+        missing Date field) are written as they are in the file.
+
+        :param fid: open file
+        :param updates: list of FileUpdate returned by plan()
+        """
+        fid.write(self.csv_header())
+        for update in updates:
+            values = [update.station, _csv_date(update.date)]
+            for correction in self.corrections:
+                adjustment = update.adjustments.get(correction.name)
+                values += adjustment.values if adjustment else [''] * len(correction.csv_columns)
+            fid.write(','.join(values) + '\n')
+
+
+def _csv_date(date):
+    """
+    :param date: Date field of a project.txt file (MM/DD/YY)
+    :return: YYYY-MM-DD, or the value as it is if it isn't a date (e.g., the missing-value placeholder)
+    """
+    try:
+        return datetime.datetime.strptime(date, "%m/%d/%y").strftime("%Y-%m-%d")
+    except (TypeError, ValueError):
+        return date
+
+
+def plan_report(updates):
+    """
+    :param updates: list of FileUpdate returned by CorrectionPipeline.plan()
+    :return: tab-separated table of the planned changes, one line per file
+    """
+    lines = ['File\tStation\tDate\tGravity\tNew gravity\tChange\tCorrections']
+    for update in updates:
+        corrections = ', '.join('{}: {:0.2f} (was {:0.2f})'.format(name, adjustment.delta_g, update.previous[name])
+                                for name, adjustment in update.adjustments.items())
+        lines.append('{}\t{}\t{}\t{:0.2f}\t{:0.2f}\t{:0.2f}\t{}'.format(
+            update.fname, update.station, update.date, update.gravity, update.new_gravity,
+            update.new_gravity - update.gravity, corrections))
+    return '\n'.join(lines)
@@ -0,0 +1,76 @@
+"""
+Directory scanner for the Gravity Data Archive.
+
+Over an SMB/UNC share (e.g., \\Igswztwwgszona\Gravity Data Archive) each directory
+listing is a network round trip, and os.walk lists one directory at a time. This
+scanner lists directories with os.scandir in a bounded thread pool: as soon as a
+directory is listed, its subdirectories are queued for listing, so several requests
+are in flight at once. Paths are still returned in the same (top-down) order as
+os.walk, so output that depends on file order doesn't change.
+
+Jeff Kennedy
+USGS
+"""
+import os
+from fnmatch import fnmatch
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_WORKERS = 8
+
+
+def _list_dir(dirname, skip_unpublished):
+    """
+    :return: (dirname, list of filenames, list of subdirectory paths); lists are empty if the
+        directory can't be read
+    """
+    filenames, subdirs = [], []
+    try:
+        with os.scandir(dirname) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if entry.is_symlink():  # as os.walk, don't follow links to directories
+                        continue
+                    if skip_unpublished and entry.name == 'unpublished':
+                        continue
+                    subdirs.append(entry.path)
+                else:
+                    filenames.append(entry.name)
+    except OSError:
+        pass
+    return dirname, filenames, subdirs
+
+
+def scan_tree(directory, patterns=('*.project.txt',), skip_unpublished=True, max_workers=MAX_WORKERS):
+    """
+    Finds files below a directory.
+
+    :param directory: top directory
+    :param patterns: fnmatch-style filename patterns, e.g. ('*.project.txt', '*.gsf', '*.fg5')
+    :param skip_unpublished: if True, directories named 'unpublished' are not descended into
+    :param max_workers: number of directories listed concurrently
+    :return: generator of paths to matching files, in os.walk order
+    """
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def list_dir(dirname):
+        # Subdirectories are queued as soon as a directory is listed, independent of the caller
+        dirname, filenames, subdirs = _list_dir(dirname, skip_unpublished)
+        return dirname, filenames, [executor.submit(list_dir, subdir) for subdir in subdirs]
+
+    stack = [executor.submit(list_dir, directory)]
+    try:
+        while stack:
+            dirname, filenames, futures = stack.pop().result()
+            stack.extend(reversed(futures))
+            for filename in filenames:
+                if any(fnmatch(filename, pattern) for pattern in patterns):
+                    yield os.path.join(dirname, filename)
+    finally:
+        # If the caller stops early, don't list the directories that are still queued. Futures are
+        # cancelled one by one (shutdown(cancel_futures=True) needs Python 3.9); the subdirectories of
+        # directories that were already listed are cancelled too.
+        while stack:
+            future = stack.pop()
+            if not future.cancel() and future.done() and future.exception() is None:
+                stack.extend(future.result()[2])
+        executor.shutdown(wait=True)
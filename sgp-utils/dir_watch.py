@@ -0,0 +1,196 @@
+"""
+Watches a directory tree for new, modified, and deleted files (e.g., project.txt
+files copied into Working Data by Ingestor).
+
+File-system notifications (inotify on Linux, ReadDirectoryChangesW on Windows)
+are used if the watchdog package is installed. Notifications aren't reliable on
+SMB/network shares, so the tree can also be polled (poll=True), and polling is
+used if watchdog isn't installed. Either way, bursts of writes are debounced:
+changes are reported once no more have arrived for a few seconds, so a file that
+is still being copied is reported once, after the copy.
+
+Example:
+    for changed, deleted in watch_tree(directory):
+        ...
+
+Jeff Kennedy
+USGS
+"""
+import os
+import time
+import queue
+from fnmatch import fnmatch
+from dir_scan import scan_tree
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+POLL_INTERVAL = 5.0  # seconds between scans when polling
+DEBOUNCE = 2.0  # seconds without changes before a batch of changes is reported
+
+
+def _stat_key(fname):
+    try:
+        st = os.stat(fname)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def snapshot(directory, patterns, skip_unpublished):
+    """
+    :return: dict of {path: (mtime_ns, size)} for the matching files below directory
+    """
+    snap = {}
+    for fname in scan_tree(directory, patterns, skip_unpublished=skip_unpublished):
+        key = _stat_key(fname)
+        if key is not None:
+            snap[fname] = key
+    return snap
+
+
+class _EventHandler(FileSystemEventHandler):
+    """
+    Puts the paths of file-system events on a queue.
+    """
+
+    def __init__(self, paths):
+        super(_EventHandler, self).__init__()
+        self.paths = paths
+
+    def on_any_event(self, event):
+        self.paths.put(event.src_path)
+        dest_path = getattr(event, 'dest_path', '')
+        if dest_path:
+            self.paths.put(dest_path)
+
+
+class TreeWatcher(object):
+    """
+    Keeps a snapshot of the matching files below a directory and reports how it changes.
+
+    :param directory: top directory
+    :param patterns: fnmatch-style filename patterns
+    :param skip_unpublished: if True, directories named 'unpublished' are ignored
+    :param poll: if True, poll the tree instead of using file-system notifications (use on
+        network shares). Always True if watchdog isn't installed.
+    :param interval: seconds between scans when polling
+    :param debounce: seconds without changes before changes are reported
+    """
+
+    def __init__(self, directory, patterns=('*project.txt',), skip_unpublished=True, poll=False,
+                 interval=POLL_INTERVAL, debounce=DEBOUNCE):
+        self.directory = directory
+        self.patterns = patterns
+        self.skip_unpublished = skip_unpublished
+        self.poll = poll or Observer is None
+        self.interval = interval
+        self.debounce = debounce
+        self.known = snapshot(directory, patterns, skip_unpublished)
+
+    def _matches(self, path):
+        if not any(fnmatch(os.path.basename(path), pattern) for pattern in self.patterns):
+            return False
+        if self.skip_unpublished:
+            relative = os.path.relpath(os.path.dirname(path), self.directory)
+            return 'unpublished' not in relative.split(os.path.sep)
+        return True
+
+    def _diff(self, current, candidates):
+        """
+        Compares candidate paths to the snapshot and updates it.
+
+        :param current: dict of {path: key} for the candidates that exist
+        :param candidates: paths to check
+        :return: (set of new or modified paths, set of deleted paths)
+        """
+        changed, deleted = set(), set()
+        for path in candidates:
+            if path in current:
+                if self.known.get(path) != current[path]:
+                    changed.add(path)
+                    self.known[path] = current[path]
+            elif path in self.known:
+                deleted.add(path)
+                del self.known[path]
+        return changed, deleted
+
+    def _candidates(self, event_paths):
+        """
+        Expands the paths of file-system events to the matching files they may affect: the file
+        itself, the files in a created or moved-in directory, and known files below a deleted or
+        moved-away directory.
+
+        :return: dict of {path: key} for candidates that exist, set of all candidates
+        """
+        current, candidates = {}, set()
+        for path in event_paths:
+            if os.path.isdir(path):
+                current.update(snapshot(path, self.patterns, self.skip_unpublished))
+            elif self._matches(path):
+                key = _stat_key(path)
+                if key is not None:
+                    current[path] = key
+                candidates.add(path)
+            prefix = os.path.join(path, '')
+            candidates.update(known for known in self.known if known.startswith(prefix))
+        candidates.update(current)
+        return current, candidates
+
+    def _poll_batches(self):
+        while True:
+            time.sleep(self.interval)
+            current = snapshot(self.directory, self.patterns, self.skip_unpublished)
+            if current == self.known:
+                continue
+            # Wait for the tree to stop changing
+            while True:
+                time.sleep(self.debounce)
+                latest = snapshot(self.directory, self.patterns, self.skip_unpublished)
+                if latest == current:
+                    break
+                current = latest
+            yield self._diff(current, set(current) | set(self.known))
+
+    def _event_batches(self):
+        paths = queue.Queue()
+        observer = Observer()
+        observer.schedule(_EventHandler(paths), self.directory, recursive=True)
+        observer.start()
+        try:
+            while True:
+                event_paths = {paths.get()}
+                # Collect events until none arrive for self.debounce seconds
+                while True:
+                    try:
+                        event_paths.add(paths.get(timeout=self.debounce))
+                    except queue.Empty:
+                        break
+                changed, deleted = self._diff(*self._candidates(event_paths))
+                if changed or deleted:
+                    yield changed, deleted
+        finally:
+            observer.stop()
+            observer.join()
+
+    def batches(self):
+        """
+        Waits for changes and yields them, one batch per burst of writes. Runs until interrupted.
+
+        :return: generator of (set of new or modified paths, set of deleted paths)
+        """
+        return self._poll_batches() if self.poll else self._event_batches()
+
+
+def watch_tree(directory, patterns=('*project.txt',), skip_unpublished=True, poll=False,
+               interval=POLL_INTERVAL, debounce=DEBOUNCE):
+    """
+    Watches a directory tree; see TreeWatcher.
+
+    :return: generator of (set of new or modified paths, set of deleted paths)
+    """
+    return TreeWatcher(directory, patterns, skip_unpublished, poll, interval, debounce).batches()
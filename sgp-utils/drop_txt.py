@@ -0,0 +1,134 @@
+"""
+Loader for the .set.txt and .drop.txt files written by Micro-g LaCoste 'g' software.
+
+Each occupation has a .drop.txt file (one line per drop: set number, drop number,
+..., gravity) and a .set.txt file with one line per set that was used in the
+final gravity value. Drop files are read into NumPy arrays in one call, and set
+statistics are computed with grouped reductions (np.bincount) instead of a
+Python loop per set:
+
+    set mean and standard deviation (population, as np.std) of the drop gravity
+    accepted sets (in the .set.txt file) and rejected sets (only in the .drop.txt file)
+    drop residuals, relative to the mean of the drop's set
+
+The sigmas written by g aren't reproduced exactly (the formula isn't known), so
+all of them are recalculated from the drops for consistency.
+
+Usage:
+    python drop_txt.py <directory> [--jobs N]
+
+prints a one-line summary for each occupation below directory.
+
+Jeff Kennedy
+USGS
+"""
+import os
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from dir_scan import scan_tree
+
+# Columns (0-based) in the data lines of .drop.txt and .set.txt files
+DROP_SET_COL, DROP_DROP_COL, DROP_GRAVITY_COL = 0, 1, 5
+SET_SET_COL, SET_GRAVITY_COL, SET_SIGMA_COL = 0, 4, 5
+
+
+def _read_columns(filename, usecols):
+    """
+    Reads numeric columns from the data lines (lines starting with a digit) of a g output file.
+
+    :return: 2-D float array, one row per data line
+    """
+    with open(filename) as fp:
+        lines = [line for line in fp if line.lstrip()[:1].isdigit()]
+    if not lines:
+        return np.empty((0, len(usecols)))
+    return np.loadtxt(lines, usecols=usecols, ndmin=2)
+
+
+def read_drop_txt(filename):
+    """
+    Reads a .drop.txt file.
+
+    :param filename: path to a *.drop.txt file
+    :return: (set numbers, drop numbers, gravity) arrays, one element per drop
+    """
+    data = _read_columns(filename, (DROP_SET_COL, DROP_DROP_COL, DROP_GRAVITY_COL))
+    return data[:, 0].astype(int), data[:, 1].astype(int), data[:, 2]
+
+
+def read_set_txt(filename):
+    """
+    Reads a .set.txt file.
+
+    :param filename: path to a *.set.txt file
+    :return: (set numbers, gravity, sigma) arrays, one element per accepted set
+    """
+    data = _read_columns(filename, (SET_SET_COL, SET_GRAVITY_COL, SET_SIGMA_COL))
+    return data[:, 0].astype(int), data[:, 1], data[:, 2]
+
+
+def set_statistics(drop_sets, drop_gravity):
+    """
+    Computes per-set statistics of drop gravity with grouped reductions.
+
+    :param drop_sets: set number of each drop
+    :param drop_gravity: gravity of each drop
+    :return: dict with 'sets' (unique set numbers), 'count', 'mean', 'std' (one element per set),
+        and 'residual' (drop gravity minus the mean of its set, one element per drop)
+    """
+    sets, set_idx, count = np.unique(drop_sets, return_inverse=True, return_counts=True)
+    mean = np.bincount(set_idx, weights=drop_gravity, minlength=len(sets)) / count
+    residual = drop_gravity - mean[set_idx]
+    std = np.sqrt(np.bincount(set_idx, weights=residual ** 2, minlength=len(sets)) / count)
+    return {'sets': sets, 'count': count, 'mean': mean, 'std': std, 'residual': residual}
+
+
+def read_occupation(set_file):
+    """
+    Reads the .set.txt file of an occupation and its .drop.txt file.
+
+    :param set_file: path to a *.set.txt file; the .drop.txt file is in the same directory
+    :return: dict with the set_statistics() keys plus 'set_file', 'drop_set', 'drop_gravity',
+        'accepted' (bool, one element per set), and 'g_accepted' (mean of the accepted set means)
+    """
+    drop_sets, drops, drop_gravity = read_drop_txt(set_file.replace('.set.txt', '.drop.txt'))
+    accepted_sets, set_gravity, set_sigma = read_set_txt(set_file)
+    occupation = set_statistics(drop_sets, drop_gravity)
+    accepted = np.isin(occupation['sets'], accepted_sets)
+    occupation.update({'set_file': set_file,
+                       'drop_set': drop_sets,
+                       'drop_gravity': drop_gravity,
+                       'accepted': accepted,
+                       'g_accepted': occupation['mean'][accepted].mean() if accepted.any() else np.nan})
+    return occupation
+
+
+def read_occupations(directory, jobs=1, skip_unpublished=True):
+    """
+    Reads every occupation (.set.txt/.drop.txt pair) below a directory, e.g. a station or a
+    season of data.
+
+    :param directory: directory to search
+    :param jobs: number of worker processes; if > 1, occupations are read in a process pool
+    :param skip_unpublished: if True, directories named 'unpublished' are skipped
+    :return: list of dicts (see read_occupation()), in os.walk order
+    """
+    set_files = list(scan_tree(directory, ('*.set.txt',), skip_unpublished=skip_unpublished))
+    if jobs > 1 and len(set_files) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            return list(executor.map(read_occupation, set_files, chunksize=4))
+    return [read_occupation(set_file) for set_file in set_files]
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Summarize the sets in .drop.txt/.set.txt files.')
+    arg_parser.add_argument('directory', help='directory to search (e.g., a station or season)')
+    arg_parser.add_argument('--jobs', type=int, default=1, help='number of processes used to read files')
+    args = arg_parser.parse_args()
+    print('File\tSets\tAccepted\tRejected sets\tg (accepted)\tMean set std')
+    for occ in read_occupations(args.directory, jobs=args.jobs):
+        rejected = occ['sets'][~occ['accepted']]
+        print('{}\t{}\t{}\t{}\t{:.2f}\t{:.2f}'.format(os.path.basename(occ['set_file']), len(occ['sets']),
+                                                     occ['accepted'].sum(), ','.join(map(str, rejected)),
+                                                     occ['g_accepted'], occ['std'].mean()))
@@ -9,7 +9,8 @@
 #     Date  |  Station Name  |  Gravity
 #
 # A file with the appropriate format is created by A10_parse.py. Alternatively, the file can be created by hand as
-# long as it has the above columns (in any order, and with or without additional columns).
+# long as it has the above columns (in any order, and with or without additional columns). A Parquet file from a
+# measurement store (fg5_parse.py --store) can also be used.
 #
 # Groundwater levels corresponding to gravity measurements are retrieved from NWIS. A file (cross_ref_file) serves as a
 # lookup table between gravity station IDs and NWIS 15-digit IDs. If there is a gw level within a certain period of time
@@ -48,8 +49,8 @@ import matplotlib.dates as mdates
 import matplotlib.ticker as tkr
 import csv
 import os
-from nwis import nwis_get_data
-from dateutil import parser
+from nwis import nwis_get_batch
+from measurement_store import read_columns
 
 # # When saved, this exports fonts as fonts instead of paths:
 plt.rcParams['svg.fonttype'] = 'none'
@@ -84,47 +85,28 @@ if write_output_to_file:
 
 # Matplotlibn interactive mode
 plt.ion()
-stations = []
 myFmt = mdates.DateFormatter('%Y')
 y_format = tkr.FuncFormatter(func)
 
-# Get station list and column numbers from input file header
-with open(data_file) as fp:
-    a = fp.readline()
-    a = a.strip()
-    tags = a.split("\t")
-    date_col = tags.index("Date")
-    sta_col = tags.index("Station Name")
-    grav_col = tags.index("Gravity")
-    for line in fp:
-        a = line.split("\t")
-        stations.append(a[sta_col])
+# Get station list (from a fg5_parse output file or a measurement store)
+columns = read_columns(data_file, ('stationname', 'date', 'gravity'))
 # Remove duplicates
-stations = list(set(stations))
+stations = list(set(columns['stationname']))
 
 # Initialize blank array to hold data. First array of each list element is date, second is gravity.
 grav_data = [[[], []]]
-nwis_data = ['']*len(stations)
 for i in range(len(stations)-1):
     grav_data.append([[], []])
 
-# Retrieve data from nwis (will return both discrete and continuous data)
-for station in stations:
-    sta_index = stations.index(station)
-    nwis_data[sta_index] = (nwis_get_data(cross_ref_file, station))
-    if nwis_data[sta_index] != 0:
-        nwis_data[sta_index]['station'] = station
+# Retrieve data from nwis (will return both discrete and continuous data), all stations in a few requests
+nwis_by_station = nwis_get_batch(cross_ref_file, stations)
+nwis_data = [nwis_by_station[station] for station in stations]
 
 # Get gravity data from input file
-with open(data_file) as fp:
-    a = fp.readline()
-    for line in fp:
-        a = line.split("\t")
-        sta = a[sta_col]
-        sta_index = stations.index(sta)
-        # using the dateutil parser we can plot dates directly
-        grav_data[sta_index][0].append(parser.parse(a[date_col]))
-        grav_data[sta_index][1].append(float(a[grav_col]))
+for sta, date, grav in zip(columns['stationname'], columns['date'], columns['gravity']):
+    sta_index = stations.index(sta)
+    grav_data[sta_index][0].append(date)
+    grav_data[sta_index][1].append(grav)
 
 for idx, sta in enumerate(nwis_data):
     if sta != 0:  # Could be blank station names?
@@ -17,13 +17,13 @@
 
 from numpy import mod, ceil
 import matplotlib.pylab as plt
-from dateutil import parser
 import datetime
 from tkinter import filedialog
 from tkinter import Tk
 import matplotlib.dates as mdates
 import matplotlib.ticker as tkr
-from nwis import nwis_get_data
+from nwis import nwis_get_batch
+from measurement_store import read_columns
 
 # Parameters and default values:
 a10_sd = 5				              # Default A-10 standard deviation, for error bars
@@ -49,48 +49,31 @@ def func(x, pos):
 offset = 978990000
 
 # Open dialog to specify input file. Alternatively, specify file directly.
-data_file = filedialog.askopenfilename(title="Select text file to plot (from A10_parse.py)")
+data_file = filedialog.askopenfilename(title="Select text file to plot (from A10_parse.py) or a measurement store .parquet file")
 # data_file = "SanPedro_qaqc.txt"
 
 # Matplotlib interactive mode
 plt.ioff()
-stations = []
 myFmt = mdates.DateFormatter('%Y')
 y_format = tkr.FuncFormatter(func)
 
-# Get station list and column numbers
-with open(data_file) as fp:
-    a = fp.readline()
-    a = a.strip()
-    tags = a.split("\t")
-    date_col = tags.index("Date")
-    sta_col = tags.index("Station Name")
-    grav_col = tags.index("Gravity")
-    for line in fp:
-        a = line.split("\t")
-        stations.append(a[sta_col])
-stations = list(set(stations))
+# Get station list (from a fg5_parse output file or a measurement store)
+columns = read_columns(data_file, ('stationname', 'date', 'gravity'))
+stations = list(set(columns['stationname']))
 
 # Initialize blank array to hold data. First array of each list element is date, second is gravity.
 grav_data = [[[], []]]
-nwis_data = ['']*len(stations)
 for i in range(len(stations)-1):
     grav_data.append([[], []])
 
-for station in stations:
-    sta_index = stations.index(station)
-    nwis_data[sta_index] = (nwis_get_data(cross_ref_file, station))
+nwis_by_station = nwis_get_batch(cross_ref_file, stations)
+nwis_data = [nwis_by_station[station] for station in stations]
 
 # Get gravity data from input file
-with open(data_file) as fp:
-    a = fp.readline()
-    for line in fp:
-        a = line.split("\t")
-        sta = a[sta_col]
-        sta_index = stations.index(sta)
-        # using the dateutil parser we can plot dates directly
-        grav_data[sta_index][0].append(parser.parse(a[date_col]))
-        grav_data[sta_index][1].append(float(a[grav_col]) - offset)
+for sta, date, grav in zip(columns['stationname'], columns['date'], columns['gravity']):
+    sta_index = stations.index(sta)
+    grav_data[sta_index][0].append(date)
+    grav_data[sta_index][1].append(grav - offset)
 
 figidx = 1
 i = 0
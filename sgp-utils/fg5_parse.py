@@ -7,19 +7,39 @@ Reads parameters from fg5_parse.ini:
 SKIP_UNPUBLISHED: ignores files with "unpublished' in the directory path
 QC_MODE: adds extra columns; for copy/pasting into Excel QA worksheet
 
+With --delta, only occupations that were added, modified, or deleted since the
+last export of the same directory are written, with a Change column.
+
+With --watch, the output file is written once and then kept up to date as
+project.txt files are created, modified, or deleted (use --poll on network shares).
+
+Polar motion, laser, and clock columns are computed from finals.data (see
+polar_motion.py) and the instrument calibrations (see calibration.py). If either
+can't be read, spreadsheet lookup formulas are written for those columns instead.
+
 Should work with g8 and g9.
 
 Jeff Kennedy
 USGS
 """
 
-import re
 import os
 import sys
+import csv
+import argparse
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
 from tkinter import filedialog
 from tkinter import Tk
 from time import strftime
 import configparser
+import numpy as np
+from project_txt import MISSING, FIELDS, APPENDED_FIELDS, read_project_txts, to_number
+from parse_cache import ParseCache, record_hash
+from dir_scan import scan_tree
+from dir_watch import TreeWatcher
+from calibration import CalibrationRegistry
+from polar_motion import PolarMotion, mjd
 
 config = configparser.ConfigParser()
 config.read('fg5_parse.ini')
@@ -28,10 +48,21 @@ if QC_MODE := config.getboolean('Parameters', 'QC_MODE'):
     print("Running in QC mode (edit parse_fg5.ini to change).")
 pd = os.getcwd()
 gravity_data_archive = r"\\Igswztwwgszona\Gravity Data Archive"
+finals_data = f"{gravity_data_archive}\\QAQC\\finals.data"
 polar_motion_spreadsheet = f"'{gravity_data_archive}\\QAQC\\[finals.data.xlsx]Sheet1'"
 calibration_spreadsheet = f"'{gravity_data_archive}\\Absolute Data" + \
                           r"\A-10\Instrument Maintenance\Calibrations" + \
                           r"\[A10-008 clock and laser calibrations.xlsx]calibrations'"
+# Laser and clock columns are computed from this instrument's calibrations (see calibration.py)
+CALIBRATION_INSTRUMENT = 'A10-008'
+
+# Output columns (a StudyArea column is prepended in QC_MODE)
+HEADER = ['Created', 'Project', 'Station Name', 'Lat', 'Long', 'Elev', 'Setup Height',
+          'Transfer Height', 'Actual Height', 'Gradient', 'NominalAP', 'Polar(x)', 'Polar(y)',
+          'DF File', 'OL File', 'Clock', 'Blue', 'Red', 'Date', 'Time', 'Time Offset', 'Gravity',
+          'Set Scatter', 'Precision', 'Uncertainty', 'Collected', 'Processed', 'Baro corr',
+          'Transfer ht corr', 'Polar(x) error', 'Polar(y) error', 'Red laser error', 'Blue laser err',
+          'clock error', 'Comments', 'Admittance']
 
 
 def launch_gui():
@@ -43,13 +74,16 @@ def launch_gui():
     return data_directory
 
 
-def parse_data(data_directory, output_dir=None):
+def output_filename(data_directory, output_dir=None, csv_format=False, tag=''):
+    """
+    :return: path of the output file for a directory: directory name, Working/Final, tag, and the
+        date and time
+    """
     # For testing
     # data_directory = "E:\\Shared\\current\\python\\AZWSC_Gravity\\TAMA"
     # a = data_directory.split('/')
     a = os.path.split(data_directory)
     # File save name is directory plus time and date
-    print(str(data_directory))
     if output_dir:
         od = output_dir
     elif os.getcwd() == os.path.normpath('X:\sgp-utils\sgp-utils'):
@@ -63,298 +97,538 @@ def parse_data(data_directory, output_dir=None):
         dd = '_Final_'
     else:
         dd = '_'
+    dd += tag
 
-    filesavename = os.path.join(od, a[-1] + dd + strftime("%Y%m%d-%H%M") + '.txt')
-    print(f'Saving {filesavename}')
-    # open file for overwrite (change to "r" to append)
-    fout = open(filesavename, "w")
-
-    # write data descriptor file header
-    fout_string = "Created\tProject\tStation Name\tLat\tLong\tElev\tSetup Height\
-    \tTransfer Height\tActual Height\tGradient\tNominalAP\tPolar(x)\tPolar(y)\
-    \tDF File\tOL File\tClock\tBlue\tRed\tDate\tTime\tTime Offset\tGravity\tSet Scatter\
-    \tPrecision\tUncertainty\tCollected\tProcessed\tBaro corr\tTransfer ht corr\
-    \tPolar(x) error\tPolar(y) error\tRed laser error\tBlue laser err\
-    \tclock error\tComments\n"
-    if QC_MODE:
-        fout_string = "StudyArea\t" + fout_string
-    fout.write(fout_string)
+    ext = '.csv' if csv_format else '.txt'
+    return os.path.join(od, a[-1] + dd + strftime("%Y%m%d-%H%M") + ext)
 
-    all_data = parse(data_directory)
 
-    # Write data_array to file
-    for measurement in all_data:
-        for each_element in measurement:
-            fout.write(each_element + "\t")
-        fout.write('\n')
-    fout.close()
+def parse_data(data_directory, output_dir=None, jobs=1, use_cache=True, csv_format=False, store_dir=None,
+               delta=False):
+    print(str(data_directory))
+    filesavename = output_filename(data_directory, output_dir, csv_format, 'Delta_' if delta else '')
+    print(f'Saving {filesavename}')
+    # open file for overwrite (change to "r" to append). Line-buffered, so rows are on disk as
+    # soon as they're parsed.
+    store = None
+    if store_dir:
+        from measurement_store import MeasurementStore  # requires pyarrow
+        store = MeasurementStore(store_dir)
+    with open(filesavename, "w", buffering=1) as fout:
+        if delta:
+            write_rows(fout, iter_delta_rows(data_directory, jobs=jobs, use_cache=use_cache, store=store),
+                       csv_format, header() + ['Change'])
+        else:
+            write_rows(fout, iter_rows(data_directory, jobs=jobs, use_cache=use_cache, store=store), csv_format)
     print(f'Output file written: {filesavename}')
+    if store:
+        print(f'Measurement store updated: {store_dir}')
 
 
-def parse(data_directory):
-    all_data = []
-    output_line = 0
-
-    # For each file in the data_directory
-    for dirname, dirnames, filenames in os.walk(data_directory):
-        if SKIP_UNPUBLISHED:
-            if 'unpublished' in dirnames:
-                dirnames.remove('unpublished')
-        for filename in filenames:
-            fname = os.path.join(dirname, filename)
-            inComments = 0
-            # If the file name ends in "project.txt"
-            if str.find(fname, 'project.txt') == -1:
-                continue
-            study_area = (os.path.normpath(dirname).split(os.path.sep)[4])
-            print(filename)
-            dtf = False
-            olf = False
-            skip_grad = False
-            with open(fname) as project_file:
-                data_array = []
-                if QC_MODE:
-                    data_array.append(study_area)
-
-                # Look for these words in the g file
-                tags = re.compile(r'Created|Setup' +
-                                  r'|Transfer|Actual|Date|Time|TimeOffset|Nominal|Red' +
-                                  r'|Blue|Scatter|SetsColl|SetsProc|Precision|BarPresCorr|Total_unc')
-
-                # 'Lat' is special because there are three data on the same line:
-                # (Lat, Long, Elev)
-                Lat_tag = re.compile(r'Lat')
-
-                # 'Polar' is also special, for the same reason
-                Pol_tag = re.compile(r'Polar')
-
-                version = 0
-                Version_tag = re.compile(r'Version')
-
-                # Need this to accommodate station names with spaces
-                Project_tag = re.compile(r'Project')
-                Name_tag = re.compile(r'Name')
-
-                # Apparently using a delta file is optional, it's not always written
-                # to the .project file
-                Delta_tag = re.compile(r'DFFile')
-                OL_tag = re.compile(r'OLFile')
-                Rub_tag = re.compile(r'RubFrequency')
-                Grav_tag = re.compile(r'Grv')
-                Grad_tag = re.compile(r'Gradient')
-
-                # This one, because "Gradient:" is repeated exactly in this section
-                Unc_tag = re.compile(r'Uncertainties')
-
-                # This deals with multi-line comments
-                Comment_tag = re.compile(r'Comments')
-                comments = ''
-
-                for line in project_file:
-                    # Change up some text in the g file to make it easier to parse
-                    # (remove duplicates, etc.)
-                    line = str.strip(line)
-                    line = str.replace(line, '\n\n', '\n')
-
-                    Comment_tag_found = re.search(Comment_tag, line)
-                    if inComments:
-                        if comments == '':
-                            comments = line
-                        else:
-                            comments += ' | '
-                            comments += line
-                        continue
-                    elif Comment_tag_found is not None:
-                        inComments = True
-                        continue
-
-                    line = str.replace(line, ":  ", ": ")
-                    # Repeat to take care of ":   " (three spaces)
-                    line = str.replace(line, ":  ", ": ")
-                    line = str.replace(line, ":  ", ": ")
-                    line = str.replace(line, "g Acquisition Version", "Acq")
-                    line = str.replace(line, "g Processing ", "")
-                    line = str.replace(line, "Project Name:", "Project")
-                    line = str.replace(line, "File Created:", "Created")
-                    line = str.replace(line, 'Gravity Corrections', 'grvcorr')
-                    line = str.replace(line, " Height:", ":")
-                    line = str.replace(line, "Delta Factor Filename:", "DFFile")
-                    line = str.replace(line, "Ocean Load ON, Filename:", "OLFile")
-                    line = str.replace(line, "Nominal Air Pressure:", "Nominal")
-                    line = str.replace(line, "Barometric Admittance Factor:",
-                                       "Admittance")
-                    line = str.replace(line, " Motion Coord:", "")
-                    line = str.replace(line, "Set Scatter:", "Scatter")
-                    line = str.replace(line, "Offset:", "ofst")
-                    line = str.replace(line, "Time Offset (D h:m:s):", "TimeOffset")
-                    line = str.replace(line, "Ocean Load:", "OLC")
-                    line = str.replace(line, "Rubidium Frequency:", "RubFrequency")
-                    line = str.replace(line, "Blue Lock:", "Blue")
-                    line = str.replace(line, "Red Lock:", "Red")
-                    line = str.replace(line, "Red/Blue Separation:", "Separation")
-                    line = str.replace(line, "Red/Blue Interval:", "Interval")
-                    line = str.replace(line, "Gravity Corrections", "Corrections")
-                    line = str.replace(line, "Gravity:", "Grv:")
-                    line = str.replace(line, "Number of Sets Collected:", "SetsColl")
-                    line = str.replace(line, "Number of Sets Processed:", "SetsProc")
-                    # This is the PM error, not the values
-                    line = str.replace(line, "Polar Motion:", "PolMotC")
-                    line = str.replace(line, "Barometric Pressure:", "BarPresCorr")
-                    line = str.replace(line, "System Setup:", "")
-                    line = str.replace(line, "Total Uncertainty:", "Total_unc")
-                    line = str.replace(line, "Measurement Precision:", "Precision")
-                    line = str.replace(line, ":", "", 1)
-                    line = str.replace(line, ",", "")
-                    line_elements = str.split(line, " ")
-
-                    # Look for tags
-                    tags_found = re.search(tags, line)
-                    Lat_tag_found = re.search(Lat_tag, line)
-                    Pol_tag_found = re.search(Pol_tag, line)
-                    Version_tag_found = re.search(Version_tag, line)
-                    Delta_tag_found = re.search(Delta_tag, line)
-                    OL_tag_found = re.search(OL_tag, line)
-                    Grav_tag_found = re.search(Grav_tag, line)
-                    Unc_tag_found = re.search(Unc_tag, line)
-                    Grad_tag_found = re.search(Grad_tag, line)
-                    Rub_tag_found = re.search(Rub_tag, line)
-                    Name_tag_found = re.search(Name_tag, line)
-                    Project_tag_found = re.search(Project_tag, line)
-
-                    if Unc_tag_found is not None:
-                        skip_grad = True
-
-                    if Grad_tag_found is not None:
-                        if not skip_grad:
-                            data_array.append(line_elements[1])
-
-                    # Old g versions don't output Time Offset, which comes right
-                    # before gravity
-                    if Grav_tag_found is not None:
-                        if version < 5:
-                            data_array.append('-999')
-                        data_array.append(line_elements[1])
-
-                    if Delta_tag_found is not None:
-                        dtf = True
-                        df = " ".join(line_elements[1:])
-
-                    if OL_tag_found is not None:
-                        olf = True
-                        of = " ".join(line_elements[1:])
-
-                    if Rub_tag_found is not None:
-                        if dtf:
-                            data_array.append(df)
-                        else:
-                            data_array.append('-999')
-                        if olf:
-                            data_array.append(of)
-                        else:
-                            data_array.append('-999')
-                        data_array.append(line_elements[1])
-
-                    if Version_tag_found is not None:
-                        version = float(line_elements[1])
-
-                    if Name_tag_found is not None or Project_tag_found is not None:
-                        try:
-                            name = " ".join(line_elements[1:])
-                            data_array.append(name)
-                        except:
-                            data_array.append('-999')
-
-                    if tags_found is not None:
-                        try:
-                            data_array.append(line_elements[1])
-                        except:
-                            data_array.append('-999')
-
-                    if Lat_tag_found is not None:
-                        data_array.append(line_elements[1])
-                        data_array.append(line_elements[3])
-                        data_array.append(line_elements[5])
-                        # This accommodates old versions of g. If these data are to
-                        # be published, though, they should be reprocessed in a more
-                        # recent version.
-                        if version < 5:
-                            data_array.append('-999')  # Setup Height
-                            data_array.append('-999')  # Transfer Height
-                            data_array.append('-999')  # Actual Height
-
-                    if Pol_tag_found is not None:
-                        data_array.append(line_elements[1])
-                        data_array.append(line_elements[3])
-                        # if version < 5:
-                        #     data_array.append('-999') # delta factor filename
-
-                    if inComments > 0:
-                        comments = comments + line
-                        if inComments > 1:
-                            comments = comments + ' | '
-                        inComments += inComments
-
-                    if Comment_tag_found is not None:
-                        inComments = 1
-                        comments = ''
-
-                # Old g versions don't output transfer height correction
-                if version < 5:
-                    data_array.append('-999')
-
-                # This adds an Excel formula that looks up the correct polar motion
-                if not QC_MODE:
-                    # In non-QC_MODE, write the difference between the value used
-                    # and the true value
-                    data_array.append(
-                        r"=VLOOKUP(S{0},{1}!$F$1:$G$20000,2,FALSE)-L{2}".format(
-                            str(output_line + 2), polar_motion_spreadsheet,
-                            str(output_line + 2)))
-                    data_array.append(
-                        "=VLOOKUP(S{0},{1}!$F$1:$I$20000,4,FALSE)-M{2}".format(
-                            str(output_line + 2), polar_motion_spreadsheet,
-                            str(output_line + 2)))
-                    # Lookup red and blue laser calibrations
-                    data_array.append(
-                        "=VLOOKUP(S{0},{1}!$A$2:$E$200,5,TRUE)-R{2}".format(
-                            str(output_line + 2), calibration_spreadsheet,
-                            str(output_line + 2)))
-                    data_array.append(
-                        "=VLOOKUP(S{0},{1}!$A$2:$E$200,4,TRUE)-Q{2}".format(
-                            str(output_line + 2), calibration_spreadsheet,
-                            str(output_line + 2)))
-                    data_array.append(
-                        "=IF(ABS(VLOOKUP(S{0},{1}!$A$2:$E$200,2,TRUE)-P{2}) < 0.00001, 0, VLOOKUP(S{3},{4}!$A$2:$E$200,3,TRUE)-P{5})".format(
-                            output_line + 2, calibration_spreadsheet,
-                            output_line + 2, output_line + 2,
-                            calibration_spreadsheet, output_line + 2))
-                else:
-                    # In QC_MODE, write the true value
-                    data_array.append(
-                        r"=VLOOKUP(T{0},{1}!$F$1:$G$20000,2,FALSE)".format(
-                            output_line + 2, polar_motion_spreadsheet))
-                    data_array.append(
-                        "=VLOOKUP(T{0},{1}!$F$1:$I$20000,4,FALSE)".format(
-                            output_line + 2, polar_motion_spreadsheet))
-                    # Lookup red and blue laser calibrations
-                    data_array.append("=VLOOKUP(T{0},{1}!$A$2:$E$200,5,TRUE)".format(
-                        output_line + 2, calibration_spreadsheet))
-                    data_array.append("=VLOOKUP(T{0},{1}!$A$2:$E$200,4,TRUE)".format(
-                        output_line + 2, calibration_spreadsheet))
-                    # Lookup clock calibration
-                    data_array.append("=VLOOKUP(T{0},{1}!$A$2:$E$200,3,TRUE)".format(
-                        output_line + 2, calibration_spreadsheet))
-
-                data_array.append(comments)
-                output_line += 1
-                all_data.append(data_array)
-    return all_data
+def header():
+    """
+    :return: list of column names for the rows returned by make_row
+    """
+    columns = list(HEADER)
+    if QC_MODE:
+        columns.insert(0, 'StudyArea')
+    return columns
+
+
+def write_rows(fout, rows, csv_format=False, columns=None):
+    """
+    Writes the header and rows to an open file, one row at a time.
+
+    :param fout: open file (or sys.stdout)
+    :param rows: iterable of rows, e.g. from iter_rows()
+    :param csv_format: if True, write comma-separated values; otherwise tab-delimited
+    :param columns: column names for the header; default is header()
+    """
+    if columns is None:
+        columns = header()
+    if csv_format:
+        writer = csv.writer(fout, lineterminator='\n')
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+    else:
+        fout.write('\t'.join(columns) + '\n')
+        for row in rows:
+            for each_element in row:
+                fout.write(each_element + "\t")
+            fout.write('\n')
+
+
+def project_files(data_directory):
+    """
+    Finds the project.txt files in a directory and its subdirectories.
+
+    :param data_directory: directory to search
+    :return: generator of paths, in os.walk order
+    """
+    return scan_tree(data_directory, ('*project.txt',), skip_unpublished=SKIP_UNPUBLISHED)
+
+
+def _format_value(value):
+    if value is None or np.isnan(value):
+        return MISSING
+    return '{:.6f}'.format(value).rstrip('0').rstrip('.')
+
+
+def load_calibration():
+    """
+    :return: calibration.InstrumentCalibration for CALIBRATION_INSTRUMENT, or None if the
+        calibration workbook can't be read (lookup formulas are written instead)
+    """
+    try:
+        return CalibrationRegistry().get(CALIBRATION_INSTRUMENT)
+    except Exception as e:
+        print(f'Calibration workbook not read ({e}); writing lookup formulas instead')
+        return None
+
+
+def load_polar_motion():
+    """
+    :return: polar_motion.PolarMotion from finals_data, or None if it can't be read (lookup
+        formulas are written instead)
+    """
+    try:
+        return PolarMotion.from_finals(finals_data)
+    except Exception as e:
+        print(f'finals.data not read ({e}); writing polar motion lookup formulas instead')
+        return None
+
+
+def polar_motion_lookup(polar_motion, records):
+    """
+    Interpolates the pole coordinates for several records at once.
+
+    :param polar_motion: polar_motion.PolarMotion, or None
+    :param records: list of dicts returned by project_txt.read_project_txt
+    :return: list with a dict of 'x' and 'y' (arcsec) at each record's date and time, or a list
+        of None if polar_motion is None
+    """
+    if polar_motion is None:
+        return [None] * len(records)
+    x, y = polar_motion.interpolate(mjd([record['date'] for record in records],
+                                        [record['time'] for record in records]))
+    return [{'x': x[idx], 'y': y[idx]} for idx in range(len(records))]
+
+
+def polar_motion_columns(record, polar):
+    """
+    Polar(x) and Polar(y) columns, interpolated from finals.data: the difference between the
+    true value and the value in the file, or in QC_MODE the true value.
+
+    :param record: dict returned by project_txt.read_project_txt
+    :param polar: dict of pole coordinates (see polar_motion_lookup())
+    :return: list of strings
+    """
+    if QC_MODE:
+        return [_format_value(polar['x']), _format_value(polar['y'])]
+    columns = []
+    for axis, field in (('x', 'polarx'), ('y', 'polary')):
+        used = to_number(record[field], float)
+        columns.append(_format_value(polar[axis] - used if used is not None else None))
+    return columns
+
+
+def calibration_lookup(calibration, records):
+    """
+    Looks up the calibration for several records at once.
+
+    :param calibration: calibration.InstrumentCalibration, or None
+    :param records: list of dicts returned by project_txt.read_project_txt
+    :return: list with a dict of calibration values for each record (see
+        InstrumentCalibration.calibration()), or a list of None if calibration is None
+    """
+    if calibration is None:
+        return [None] * len(records)
+    values = calibration.calibration([record['date'] for record in records])
+    return [{name: values[name][idx] for name in values} for idx in range(len(records))]
+
+
+def calibration_columns(record, calibration):
+    """
+    Red laser, blue laser, and clock columns, computed from the calibration for the record's
+    date: the difference between the calibration and the value in the file, or in QC_MODE the
+    calibration value.
+
+    :param record: dict returned by project_txt.read_project_txt
+    :param calibration: dict of calibration values (see calibration_lookup())
+    :return: list of strings
+    """
+    if QC_MODE:
+        return [_format_value(calibration['red']), _format_value(calibration['blue']),
+                _format_value(calibration['clock'])]
+    red, blue, clock = (to_number(record[field], float) for field in ('red', 'blue', 'clock'))
+    red_error = calibration['red'] - red if red is not None else None
+    blue_error = calibration['blue'] - blue if blue is not None else None
+    if clock is None:
+        clock_error = None
+    elif abs(calibration['clock_accepted'] - clock) < 0.00001:
+        clock_error = 0.
+    else:
+        clock_error = calibration['clock'] - clock
+    return [_format_value(red_error), _format_value(blue_error), _format_value(clock_error)]
+
+
+def make_row(fname, record, output_line, calibration=None, polar=None):
+    """
+    Creates one output row from a parsed project.txt file.
+
+    :param fname: path to the project.txt file
+    :param record: dict returned by project_txt.read_project_txt
+    :param output_line: 0-based row number in the output file, used in the spreadsheet formulas
+    :param calibration: dict of calibration values for the record (see calibration_lookup()); if
+        None, lookup formulas into the calibration workbook are written instead of values
+    :param polar: dict of pole coordinates for the record (see polar_motion_lookup()); if None,
+        lookup formulas into finals.data.xlsx are written instead of values
+    :return: list of strings
+    """
+    data_array = []
+    if QC_MODE:
+        study_area = (os.path.normpath(os.path.dirname(fname)).split(os.path.sep)[4])
+        data_array.append(study_area)
+    data_array += [record[field] for field in FIELDS if field not in APPENDED_FIELDS]
+
+    if polar is not None:
+        data_array += polar_motion_columns(record, polar)
+    # This adds an Excel formula that looks up the correct polar motion
+    elif not QC_MODE:
+        # In non-QC_MODE, write the difference between the value used
+        # and the true value
+        data_array.append(
+            r"=VLOOKUP(S{0},{1}!$F$1:$G$20000,2,FALSE)-L{2}".format(
+                str(output_line + 2), polar_motion_spreadsheet,
+                str(output_line + 2)))
+        data_array.append(
+            "=VLOOKUP(S{0},{1}!$F$1:$I$20000,4,FALSE)-M{2}".format(
+                str(output_line + 2), polar_motion_spreadsheet,
+                str(output_line + 2)))
+    else:
+        # In QC_MODE, write the true value
+        data_array.append(
+            r"=VLOOKUP(T{0},{1}!$F$1:$G$20000,2,FALSE)".format(
+                output_line + 2, polar_motion_spreadsheet))
+        data_array.append(
+            "=VLOOKUP(T{0},{1}!$F$1:$I$20000,4,FALSE)".format(
+                output_line + 2, polar_motion_spreadsheet))
+
+    if calibration is not None:
+        data_array += calibration_columns(record, calibration)
+    elif not QC_MODE:
+        # Lookup red and blue laser calibrations
+        data_array.append(
+            "=VLOOKUP(S{0},{1}!$A$2:$E$200,5,TRUE)-R{2}".format(
+                str(output_line + 2), calibration_spreadsheet,
+                str(output_line + 2)))
+        data_array.append(
+            "=VLOOKUP(S{0},{1}!$A$2:$E$200,4,TRUE)-Q{2}".format(
+                str(output_line + 2), calibration_spreadsheet,
+                str(output_line + 2)))
+        data_array.append(
+            "=IF(ABS(VLOOKUP(S{0},{1}!$A$2:$E$200,2,TRUE)-P{2}) < 0.00001, 0, VLOOKUP(S{3},{4}!$A$2:$E$200,3,TRUE)-P{5})".format(
+                output_line + 2, calibration_spreadsheet,
+                output_line + 2, output_line + 2,
+                calibration_spreadsheet, output_line + 2))
+    else:
+        # Lookup red and blue laser calibrations
+        data_array.append("=VLOOKUP(T{0},{1}!$A$2:$E$200,5,TRUE)".format(
+            output_line + 2, calibration_spreadsheet))
+        data_array.append("=VLOOKUP(T{0},{1}!$A$2:$E$200,4,TRUE)".format(
+            output_line + 2, calibration_spreadsheet))
+        # Lookup clock calibration
+        data_array.append("=VLOOKUP(T{0},{1}!$A$2:$E$200,3,TRUE)".format(
+            output_line + 2, calibration_spreadsheet))
+
+    data_array.append(record['comments'])
+    data_array += [record[field] for field in APPENDED_FIELDS]
+    return data_array
+
+
+def iter_projects(data_directory, jobs=1, use_cache=True, chunk_size=64):
+    """
+    Parses the project.txt files in a directory tree lazily.
+
+    Files are read in chunks of chunk_size (per worker process), so memory use doesn't depend on
+    the size of the archive and the first records are available right away.
+
+    :param data_directory: directory to parse
+    :param jobs: number of worker processes
+    :param use_cache: if True, only files that are new or modified since the last run are parsed
+        (see parse_cache.py)
+    :param chunk_size: number of files read per worker before records are yielded
+    :return: generator of (filename, record) tuples, in os.walk order
+    """
+    cache = ParseCache() if use_cache else None
+    executor = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    fnames = project_files(data_directory)
+    try:
+        while True:
+            chunk = list(islice(fnames, chunk_size * max(jobs, 1)))
+            if not chunk:
+                break
+            if cache:
+                records = cache.read_many(chunk, executor=executor)
+            else:
+                records = read_project_txts(chunk, executor=executor)
+            for fname, record in zip(chunk, records):
+                yield fname, record
+    finally:
+        if executor:
+            executor.shutdown()
+        if cache:
+            cache.close()
+
+
+def with_lookups(items, calibration, polar_motion, batch_size=256):
+    """
+    Adds the calibration values and pole coordinates to each item, looking up batch_size items
+    at a time.
+
+    :param items: iterable of tuples whose last element is a record, e.g. (filename, record)
+    :param calibration: calibration.InstrumentCalibration, or None
+    :param polar_motion: polar_motion.PolarMotion, or None
+    :return: generator of the items with the calibration values (see calibration_lookup()) and
+        pole coordinates (see polar_motion_lookup()) appended
+    """
+    items = iter(items)
+    while True:
+        batch = list(islice(items, batch_size))
+        if not batch:
+            break
+        records = [item[-1] for item in batch]
+        for item, cal_values, polar in zip(batch, calibration_lookup(calibration, records),
+                                           polar_motion_lookup(polar_motion, records)):
+            yield item + (cal_values, polar)
+
+
+def iter_rows(data_directory, jobs=1, use_cache=True, store=None):
+    """
+    Same as iter_projects(), but yields output rows (see make_row).
+
+    :param store: measurement_store.MeasurementStore; if given, the parsed records are added to
+        the store (replacing earlier versions of the same files) after the last row
+    """
+    parsed = []
+    projects = with_lookups(iter_projects(data_directory, jobs, use_cache), load_calibration(),
+                            load_polar_motion())
+    # Row numbers for the spreadsheet formulas are assigned in output order
+    for output_line, (fname, record, cal_values, polar) in enumerate(projects):
+        print(os.path.basename(fname))
+        if store is not None:
+            parsed.append((fname, record))
+        yield make_row(fname, record, output_line, cal_values, polar)
+    if store is not None:
+        store.upsert(parsed)
+
+
+def iter_changes(data_directory, jobs=1, use_cache=True):
+    """
+    Compares the project.txt files in a directory tree to the last export of the same directory
+    (a hash of each parsed record is kept in the parse-cache database).
+
+    The record of what was exported is updated once the generator is exhausted, so if a run is
+    interrupted the next run reports the same changes again.
+
+    :param data_directory: directory to parse
+    :param jobs: number of worker processes
+    :param use_cache: if True, only files that are new or modified since the last run are parsed
+    :return: generator of (change, filename, record) tuples; change is 'added', 'modified', or
+        'deleted' (for deleted files, record is the one that was last exported)
+    """
+    with ParseCache() as state:
+        exported = state.exported(data_directory)
+        current = {}
+        for fname, record in iter_projects(data_directory, jobs, use_cache):
+            path = os.path.abspath(fname)
+            current[path] = record
+            if path not in exported:
+                yield 'added', fname, record
+            # Only the fields in the exported record are compared, so a parser upgrade that adds
+            # fields doesn't report every file as modified
+            elif exported[path][0] != record_hash(record, exported[path][1]):
+                yield 'modified', fname, record
+        for path in exported:
+            if path not in current:
+                yield 'deleted', path, exported[path][1]
+        state.set_exported(data_directory, current)
+
+
+def iter_delta_rows(data_directory, jobs=1, use_cache=True, store=None):
+    """
+    Same as iter_changes(), but yields output rows (see make_row) with the change type appended.
+
+    :param store: measurement_store.MeasurementStore; if given, added and modified occupations are
+        added to the store and deleted ones removed, after the last row
+    """
+    changed, deleted = [], []
+    changes = with_lookups(iter_changes(data_directory, jobs, use_cache), load_calibration(),
+                           load_polar_motion())
+    for output_line, (change, fname, record, cal_values, polar) in enumerate(changes):
+        print(change + ': ' + os.path.basename(fname))
+        if change == 'deleted':
+            deleted.append(fname)
+        else:
+            changed.append((fname, record))
+        yield make_row(fname, record, output_line, cal_values, polar) + [change]
+    if store is not None:
+        store.upsert(changed)
+        store.delete(deleted)
+
+
+def parse(data_directory, jobs=1, use_cache=True):
+    """
+    Parses every project.txt file in a directory tree.
+
+    :param data_directory: directory to parse
+    :param jobs: number of worker processes. Files are parsed in a process pool and the results
+        are merged in os.walk order, so the output is the same as with jobs=1.
+    :param use_cache: if True, only files that are new or modified since the last run are parsed
+        (see parse_cache.py)
+    :return: list of rows (lists of strings)
+    """
+    return list(iter_rows(data_directory, jobs, use_cache))
+
+
+class ProjectTable(object):
+    """
+    Parsed project.txt files and their output rows, kept in memory by watch().
+
+    :param calibration: calibration.InstrumentCalibration, or None to write lookup formulas
+    :param polar_motion: polar_motion.PolarMotion, or None to write lookup formulas
+    """
+
+    def __init__(self, calibration=None, polar_motion=None):
+        self.calibration = calibration
+        self.polar_motion = polar_motion
+        self.fnames = []  # in output order
+        self.records = {}
+        self.rows = []
+
+    def _make_rows(self, indexes):
+        records = [self.records[self.fnames[idx]] for idx in indexes]
+        for idx, record, cal_values, polar in zip(indexes, records, calibration_lookup(self.calibration, records),
+                                                  polar_motion_lookup(self.polar_motion, records)):
+            self.rows[idx] = make_row(self.fnames[idx], record, idx, cal_values, polar)
+
+    def load(self, projects):
+        """
+        :param projects: iterable of (filename, record) tuples, e.g. from iter_projects()
+        """
+        for fname, record in projects:
+            self.fnames.append(fname)
+            self.records[fname] = record
+        self.rows = [None] * len(self.fnames)
+        self._make_rows(range(len(self.fnames)))
+
+    def apply(self, updated, deleted):
+        """
+        Updates the table. Only the rows of updated files, and rows that move up because a file was
+        deleted (their spreadsheet formulas refer to their row number), are re-made; new files are
+        added at the end.
+
+        :param updated: dict of {filename: record} for new or modified files
+        :param deleted: iterable of deleted filenames
+        :return: number of rows re-made
+        """
+        deleted = set(fname for fname in deleted if fname in self.records)
+        first_moved = len(self.fnames)
+        if deleted:
+            first_moved = min(idx for idx, fname in enumerate(self.fnames) if fname in deleted)
+            keep = [idx for idx, fname in enumerate(self.fnames) if fname not in deleted]
+            self.fnames = [self.fnames[idx] for idx in keep]
+            self.rows = [self.rows[idx] for idx in keep]
+            for fname in deleted:
+                del self.records[fname]
+        for fname, record in updated.items():
+            if fname not in self.records:
+                self.fnames.append(fname)
+                self.rows.append(None)
+            self.records[fname] = record
+        remake = [idx for idx, fname in enumerate(self.fnames) if idx >= first_moved or fname in updated]
+        self._make_rows(remake)
+        return len(remake)
+
+    def write(self, filesavename, csv_format=False):
+        """
+        Writes the table, replacing the file in one step so that it's never seen half-written.
+
+        :return: True if the file was written; False if it couldn't be replaced (e.g., it's open in
+            Excel), in which case it's written with the next update
+        """
+        with open(filesavename + '.tmp', 'w') as fout:
+            write_rows(fout, self.rows, csv_format)
+        try:
+            os.replace(filesavename + '.tmp', filesavename)
+        except PermissionError:
+            print(f'Could not replace {filesavename} (is it open?); will retry after the next change')
+            return False
+        return True
+
+
+def watch(data_directory, output_dir=None, jobs=1, use_cache=True, csv_format=False, poll=False):
+    """
+    Writes the output file for a directory and keeps it up to date: when project.txt files are
+    created, modified, or deleted, only those files are parsed and the file is re-written from the
+    table in memory. Runs until interrupted (Ctrl-C).
+
+    :param data_directory: directory to parse and watch
+    :param poll: if True, poll the directory instead of using file-system notifications (for
+        network shares; see dir_watch.py)
+    """
+    filesavename = output_filename(data_directory, output_dir, csv_format, 'Watch_')
+    # Snapshot before parsing, so files that change during the first parse are picked up
+    watcher = TreeWatcher(data_directory, ('*project.txt',), skip_unpublished=SKIP_UNPUBLISHED, poll=poll)
+    table = ProjectTable(load_calibration(), load_polar_motion())
+    table.load(iter_projects(data_directory, jobs, use_cache))
+    table.write(filesavename, csv_format)
+    print(f'Output file written: {filesavename} ({len(table.fnames)} rows). Watching for changes...')
+    cache = ParseCache() if use_cache else None
+    try:
+        for changed, deleted in watcher.batches():
+            changed = sorted(changed)
+            records = cache.read_many(changed) if cache else read_project_txts(changed)
+            n = table.apply(dict(zip(changed, records)), deleted)
+            for fname in changed:
+                print(f'{strftime("%H:%M:%S")} updated: {os.path.basename(fname)}')
+            for fname in deleted:
+                print(f'{strftime("%H:%M:%S")} deleted: {os.path.basename(fname)}')
+            if table.write(filesavename, csv_format):
+                print(f'{n} rows re-made, {filesavename} updated')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if cache:
+            cache.close()
 
 
 if __name__ == "__main__":
     print(sys.argv)
-    if len(sys.argv) == 1:
+    arg_parser = argparse.ArgumentParser(description='Parse project.txt files to a tab-delimited file.')
+    arg_parser.add_argument('directory', nargs='?', help='directory to parse (a dialog is shown if omitted)')
+    arg_parser.add_argument('--jobs', type=int, default=1, help='number of processes used to parse files')
+    arg_parser.add_argument('--no-cache', action='store_true', help='re-parse every file, ignoring the parse cache')
+    arg_parser.add_argument('--csv', action='store_true', help='write a comma-separated file instead of tab-delimited')
+    arg_parser.add_argument('--store', metavar='DIR',
+                            help='also add the parsed occupations to a Parquet measurement store in DIR')
+    arg_parser.add_argument('--delta', action='store_true',
+                            help='only write occupations added, modified, or deleted since the last export')
+    arg_parser.add_argument('--watch', action='store_true',
+                            help='keep the output file up to date as project.txt files change (Ctrl-C to stop)')
+    arg_parser.add_argument('--poll', action='store_true',
+                            help='with --watch, poll for changes instead of using file-system notifications '
+                                 '(for network shares)')
+    args = arg_parser.parse_args()
+    if args.watch:
+        directory = args.directory if args.directory else launch_gui()
+        watch(directory, output_dir=directory, jobs=args.jobs, use_cache=not args.no_cache,
+              csv_format=args.csv, poll=args.poll)
+    elif args.directory is None:
         directory = launch_gui()
+        parse_data(directory, output_dir=directory, jobs=args.jobs, use_cache=not args.no_cache,
+                   csv_format=args.csv, store_dir=args.store, delta=args.delta)
     else:
-        directory = sys.argv[1]
-    parse_data(directory, output_dir=directory)
+        parse_data(args.directory, output_dir=args.directory, jobs=args.jobs, use_cache=not args.no_cache,
+                   csv_format=args.csv, store_dir=args.store, delta=args.delta)
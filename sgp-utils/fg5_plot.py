@@ -2,6 +2,8 @@
 # fg5_plot.py
 #
 # Takes output file from Parse_A10 (.txt) and generates time-series plots.
+# Alternatively, give a measurement store (see measurement_store.py), or a directory
+# of project.txt files; only the station name, date, and gravity are read from each file.
 #
 # Plots are not automatically saved. They can be saved by using the save
 # button in the figure window, or by
@@ -27,6 +29,11 @@ import matplotlib.ticker as tkr
 import configparser
 import datetime
 import sys
+import os
+from parse_cache import ParseCache
+from dir_scan import scan_tree
+from measurement_store import is_store, read_columns
+from project_txt import MISSING
 
 config = configparser.ConfigParser()
 config.read(r"\\Igswztwwgszona\Gravity Data Archive\sgp-utils\sgp-utils\fg5_plot.ini")
@@ -43,6 +50,9 @@ XRIGHT = parser.parse(xr)
 YTOP = int(config.get('Parameters', 'YTOP'))
 YBOTTOM = int(config.get('Parameters', 'YBOTTOM'))
 
+# Fields read from project.txt files; the rest of each file isn't parsed
+PLOT_FIELDS = {'stationname', 'date', 'gravity'}
+
 
 # ALTFMT = config.get('Parameters', 'ALTFMT')
 
@@ -110,38 +120,49 @@ def launch_gui():
     return data_file
 
 
+def read_project_files(data_directory):
+    """
+    Reads station, date, and gravity from the project.txt files in a directory. Files without a
+    date or gravity value are skipped.
+
+    :return: list of (station, date, gravity) tuples
+    """
+    rows = []
+    with ParseCache() as cache:
+        for fname in scan_tree(data_directory, ('*project.txt',)):
+            record = cache.read(fname, PLOT_FIELDS)
+            if MISSING in (record['date'], record['gravity']):
+                print('No date or gravity value in {}'.format(fname))
+                continue
+            # using the dateutil parser we can plot dates directly
+            rows.append((record['stationname'], parser.parse(record['date']), record['gravity']))
+    return rows
+
+
 def plot_g(data_file):
+    """
+    :param data_file: file written by fg5_parse.py, a measurement store, or a directory of project.txt files
+    """
     plt.ion()
-    stations = []
-
-    # Get station list and column numbers
-    with open(data_file) as fp:
-        a = fp.readline()
-        tags = a.split("\t")
-        date_col = tags.index("Date")
-        sta_col = tags.index("Station Name")
-        grav_col = tags.index("Gravity")
-        for line in fp:
-            a = line.split("\t")
-            stations.append(a[sta_col])
-    stations = [s.upper() for s in stations]
-    stations = list(set(stations))
+
+    if is_store(data_file) or not os.path.isdir(data_file):
+        columns = read_columns(data_file, ('stationname', 'date', 'gravity'))
+        rows = list(zip(columns['stationname'], columns['date'], columns['gravity']))
+    else:
+        rows = read_project_files(data_file)
+
+    # Get station list
+    stations = list(set(row[0].upper() for row in rows))
 
     # Initialize blank array to hold data. First array of each list element is date, second is gravity.
     data = [[[], []]]
     for i in range(len(stations) - 1):
         data.append([[], []])
 
-    # Get data from input file
-    with open(data_file) as fp:
-        a = fp.readline()
-        for line in fp:
-            a = line.split("\t")
-            sta = a[sta_col].upper()
-            sta_index = stations.index(sta)
-            # using the dateutil parser we can plot dates directly
-            data[sta_index][0].append(parser.parse(a[date_col]))
-            data[sta_index][1].append(float(a[grav_col]))
+    for sta, date, grav in rows:
+        sta_index = stations.index(sta.upper())
+        data[sta_index][0].append(date)
+        data[sta_index][1].append(float(grav))
 
     if YAXIS_FT_OF_WATER:
         for d in data:
@@ -2,13 +2,49 @@
 """
 Script to cleanup the mess after running fg5_update to update project.txt files with laser-calibration correction.
 If Final Data files are modified/reprocessed after running the update, it can get messy.
+
+The directory tree is listed once (see dir_scan.py), and each *.original.txt file
+is paired with its *.project.txt file. Each pair is read and compared field by
+field in a thread pool: the gravity value, the correction comment blocks written
+by fg5_update (see corrections.py), and everything else. The result is a restore
+plan, one action per pair:
+
+    restore     project.txt differs from the original only by corrections; the original
+                content is written back to project.txt (and, with a HARD reset, the
+                original.txt file is deleted)
+    keep        project.txt has no corrections (unchanged, or reprocessed after the
+                update); with a HARD reset the obsolete original.txt file is deleted
+    check       needs a look: project.txt has corrections but was also edited or
+                reprocessed, or one of the files is missing or unreadable
+
+The plan is printed, and (unless dry_run) applied atomically with a journal, so the
+whole reset can be undone (see batch_rewrite.py).
+
+Usage:
+    python fg5_reset_directory.py [directory]
+
+Jeff Kennedy
+USGS
 """
 import os
-import shutil
 import sys
 from tkinter import filedialog
+from concurrent.futures import ThreadPoolExecutor
+from dir_scan import scan_tree
+from project_document import ProjectDocument, ADJUSTED_PREFIX, NOT_ADJUSTED_PREFIX
+from corrections import LaserDriftCorrection, SoilMoistureCorrection
+from batch_rewrite import BatchRewriter, DEFAULT_JOBS
 
+# 'HARD' deletes the .original.txt files after the project.txt files are restored (or kept); 'SOFT'
+# leaves them in place
 reset = 'HARD'
+dry_run = False  # Print the restore plan without changing any files
+
+PROJECT_SUFFIX = 'project.txt'
+ORIGINAL_SUFFIX = 'original.txt'
+# Starts of the comment lines written by fg5_update and fg5_update_laser
+CORRECTION_PREFIXES = ((ADJUSTED_PREFIX, NOT_ADJUSTED_PREFIX) + LaserDriftCorrection.comment_prefixes +
+                       SoilMoistureCorrection.comment_prefixes)
 
 
 def launch_gui():
@@ -19,45 +55,198 @@ def launch_gui():
     return data_directory
 
 
+def is_correction_comment(line):
+    return line.strip().startswith(CORRECTION_PREFIXES)
+
+
+class FileDiff(object):
+    """
+    Field-level differences between an original.txt file and its project.txt file.
+
+    :param original: ProjectDocument of the original.txt file
+    :param project: ProjectDocument of the project.txt file
+    """
+
+    def __init__(self, original, project):
+        self.gravity = (original.gravity, project.gravity)
+        original_corrections = original.corrections()
+        # {description: delta-g} of the corrections in project.txt that aren't in the original
+        self.corrections = {description: delta_g for description, delta_g in project.corrections().items()
+                            if original_corrections.get(description) != delta_g}
+        self.correction_lines = len(project.find(is_correction_comment)) - len(original.find(is_correction_comment))
+        # Everything but the Gravity line, correction comments, and blank lines
+        self.other_changes = self._content(original) != self._content(project)
+
+    @staticmethod
+    def _content(doc):
+        return [line.strip() for idx, line in enumerate(doc.lines)
+                if idx != doc.gravity_index and line.strip() and not is_correction_comment(line)]
+
+    @property
+    def corrected(self):
+        return bool(self.corrections) or self.correction_lines > 0
+
+    @property
+    def delta_g(self):
+        if None in self.gravity:
+            return None
+        return self.gravity[1] - self.gravity[0]
+
+    def summary(self):
+        parts = []
+        if self.delta_g:
+            parts.append('gravity {:0.2f} -> {:0.2f} ({:+0.2f})'.format(self.gravity[0], self.gravity[1],
+                                                                         self.delta_g))
+        parts += ['{} {:0.2f}'.format(description, delta_g) for description, delta_g in self.corrections.items()]
+        if self.correction_lines > 0 and not self.corrections:
+            parts.append('{} correction comment lines'.format(self.correction_lines))
+        if self.other_changes:
+            parts.append('other fields changed')
+        return '; '.join(parts) if parts else 'identical'
+
+
+class RestoreAction(object):
+    """
+    Planned action for one original.txt/project.txt pair.
+
+    :param project_fname: path to the project.txt file (it may not exist)
+    :param original_fname: path to the original.txt file (or None)
+    :param action: 'restore', 'keep', or 'check'
+    :param reason: description of the differences
+    :param original_data: content of the original.txt file (bytes), written back on restore
+    """
+
+    def __init__(self, project_fname, original_fname, action, reason, original_data=None):
+        self.project_fname = project_fname
+        self.original_fname = original_fname
+        self.action = action
+        self.reason = reason
+        self.original_data = original_data
+
+
+def _read_document(fname):
+    """
+    :return: (content as bytes, ProjectDocument)
+    """
+    with open(fname, 'rb') as fin:
+        data = fin.read()
+    return data, ProjectDocument(fname, data.decode('utf-8', errors='replace'))
+
+
+def pair_files(directory):
+    """
+    Lists a directory tree once and pairs each original.txt file with its project.txt file.
+
+    :return: list of (project.txt path, original.txt path) tuples; project.txt files that have
+        correction comments but no original.txt are included with original path None (they're
+        checked by plan_pair()), and original.txt files without a project.txt file are included too
+    """
+    projects, originals = set(), []
+    for fname in scan_tree(directory, ('*.' + PROJECT_SUFFIX, '*.' + ORIGINAL_SUFFIX), skip_unpublished=False):
+        if fname.endswith(ORIGINAL_SUFFIX):
+            originals.append(fname)
+        else:
+            projects.add(fname)
+    pairs = []
+    for original_fname in originals:
+        project_fname = original_fname[:-len(ORIGINAL_SUFFIX)] + PROJECT_SUFFIX
+        pairs.append((project_fname, original_fname))
+        projects.discard(project_fname)
+    pairs += [(project_fname, None) for project_fname in sorted(projects)]
+    return pairs
+
+
+def plan_pair(pair):
+    """
+    Reads and compares one pair of files.
+
+    :param pair: (project.txt path, original.txt path or None), from pair_files()
+    :return: RestoreAction, or None for a project.txt file without an original and without corrections
+    """
+    project_fname, original_fname = pair
+    try:
+        if original_fname is None:
+            data, project = _read_document(project_fname)
+            if not project.find(is_correction_comment):
+                return None
+            return RestoreAction(project_fname, None, 'check', 'corrected, but there is no original.txt file')
+        original_data, original = _read_document(original_fname)
+        if not os.path.exists(project_fname):
+            return RestoreAction(project_fname, original_fname, 'check', 'no project.txt file')
+        data, project = _read_document(project_fname)
+    except (OSError, IndexError, ValueError) as e:
+        return RestoreAction(project_fname, original_fname, 'check', 'can\'t be read: {}'.format(e))
+
+    diff = FileDiff(original, project)
+    if data == original_data or not diff.corrected:
+        return RestoreAction(project_fname, original_fname, 'keep', diff.summary())
+    if diff.other_changes:
+        return RestoreAction(project_fname, original_fname, 'check', diff.summary())
+    return RestoreAction(project_fname, original_fname, 'restore', diff.summary(), original_data)
+
+
+def plan_reset(directory, jobs=DEFAULT_JOBS):
+    """
+    Builds the restore plan for a directory tree; no files are changed.
+
+    :param directory: top directory, e.g. the Final Data directory
+    :param jobs: number of threads used to read files
+    :return: list of RestoreAction
+    """
+    pairs = pair_files(directory)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        actions = list(executor.map(plan_pair, pairs))
+    return [action for action in actions if action is not None]
+
+
+def plan_report(actions):
+    """
+    :return: tab-separated table of the restore plan, one line per pair
+    """
+    lines = ['Action\tFile\tDifferences']
+    for action in actions:
+        lines.append('{}\t{}\t{}'.format(action.action, action.project_fname, action.reason))
+    return '\n'.join(lines)
+
+
+def apply_plan(actions, hard=True, rewriter=None):
+    """
+    Applies a restore plan: project.txt files are restored atomically from original.txt, then (if
+    hard) the original.txt files of the restored and kept pairs are deleted. 'check' actions are
+    skipped. Everything is recorded in one journal, so the reset can be rolled back.
+
+    :param actions: list of RestoreAction returned by plan_reset()
+    :param hard: if True, delete the original.txt files
+    :param rewriter: batch_rewrite.BatchRewriter; default is one with a new journal
+    :return: (list of restored project.txt paths, list of deleted original.txt paths)
+    """
+    if rewriter is None:
+        rewriter = BatchRewriter()
+    restores = [action for action in actions if action.action == 'restore']
+    restored, failed = rewriter.rewrite((action.project_fname, action.original_data, None) for action in restores)
+    restored = set(restored)
+    deleted = []
+    if hard:
+        # An original is deleted only once its project.txt file has been restored
+        obsolete = [action.original_fname for action in actions
+                    if action.action == 'keep' or action.project_fname in restored]
+        deleted, failed = rewriter.rewrite((fname, None, None) for fname in obsolete)
+    if rewriter.journal_dir:
+        print('Journal: {} (undo with: python batch_rewrite.py rollback "{}")'.format(
+            rewriter.journal_dir, rewriter.journal_dir))
+    return [action.project_fname for action in restores if action.project_fname in restored], deleted
+
+
 def reset_directory(directory):
-    # Loop over directory
-    no_original_but_prj_updated = []
-    original_copied_to_prj = []
-    kept_prj_deleted_original = []
-    no_original_did_nothing = []
-
-    for dirname, dirnames, filenames in os.walk(directory):
-
-
-        for fn1 in filenames:
-            if '.original.txt' in fn1:
-                prj_file = str.replace(fn1, 'original.txt', 'project.txt')
-                if os.path.exists(prj_file):
-                    if os.path.getmtime(os.path.join(dirname, fn1)) < os.path.getmtime(os.path.join(dirname, prj_file)):
-                        UPDATED = False
-                        with open(prj_file, 'r') as fid:
-                            for line in fid:
-                                if 'Gravity value adjusted by' in line:
-                                    UPDATED = True
-                        if UPDATED:
-                            shutil.move(os.path.join(dirname, fn1), os.path.join(dirname, prj_file))
-                            original_copied_to_prj.append(prj_file)
-                        else:
-                            shutil.remove(os.path.join(dirname, str.replace(fn1)))
-                            kept_prj_deleted_original.append(prj_file)
-                    else:
-
-                        jeff = 1
-                # try:
-                #     shutil.move(fn1, os.path.join(dirname, str.replace(fn1, 'original.txt', 'project.txt')))
-
-        # If hard reset:
-        # Delete .project.txt file
-        # Copy .original.txt file to .project.txt file
-        # Delete .original.txt file
-    # If project.txt file is newer
-
-        # and project.txt has "Laser updated by..."
+    actions = plan_reset(directory)
+    print(plan_report(actions))
+    counts = {name: sum(1 for action in actions if action.action == name) for name in ('restore', 'keep', 'check')}
+    print('{restore} to restore, {keep} to keep, {check} to check'.format(**counts))
+    if dry_run:
+        return actions
+    restored, deleted = apply_plan(actions, hard=(reset == 'HARD'))
+    print('{} project.txt files restored, {} original.txt files deleted'.format(len(restored), len(deleted)))
+    return actions
 
 
 if __name__ == "__main__":
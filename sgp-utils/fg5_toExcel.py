@@ -11,8 +11,8 @@ USGS
 
 from tkinter import filedialog
 import xlsxwriter
-from dateutil import parser
-from nwis import nwis_get_data
+from nwis import nwis_get_batch
+from measurement_store import read_columns
 
 # User-specified options
 
@@ -32,21 +32,9 @@ output_file = str.replace(output_file, '.txt', '.xlsx')
 workbook = xlsxwriter.Workbook(output_file)
 fmt = workbook.add_format({'num_format': 'yyyy-mm-dd'})
 
-stations = []
-# Get station list and column numbers
-with open(data_file) as fp:
-    a = fp.readline()
-    tags = str.split(a, "\t")
-    tags = [str.strip(t) for t in tags]
-    date_col = tags.index("Date")
-    sta_col = tags.index("Station Name")
-    grav_col = tags.index("Gravity")
-    unc_col = tags.index("Set Scatter")
-
-    for line in fp:
-        a = line.split("\t")
-        stations.append(a[sta_col])
-stations = [s.upper() for s in stations]
+# Get station list (from a fg5_parse output file or a measurement store)
+columns = read_columns(data_file, ('stationname', 'date', 'gravity', 'setscatter'))
+stations = [s.upper() for s in columns['stationname']]
 stations = list(set(stations))
 
 # Initialize blank array to hold data. First array of each list element is date, second is gravity.
@@ -55,16 +43,11 @@ for i in range(len(stations) - 1):
     data.append([[], [], []])
 
 # Get data from input file
-with open(data_file) as fp:
-    a = fp.readline()
-    for line in fp:
-        a = line.split("\t")
-        sta = a[sta_col].upper()
-        sta_index = stations.index(sta)
-        # using the dateutil parser we can plot dates directly
-        data[sta_index][0].append(parser.parse(a[date_col]))
-        data[sta_index][1].append(float(a[grav_col]))
-        data[sta_index][2].append(float(a[unc_col]))
+for sta, date, grav, unc in zip(columns['stationname'], columns['date'], columns['gravity'], columns['setscatter']):
+    sta_index = stations.index(sta.upper())
+    data[sta_index][0].append(date)
+    data[sta_index][1].append(grav)
+    data[sta_index][2].append(unc)
 
 offset_data = []
 offset_datum = []
@@ -78,6 +61,10 @@ for d in data:
 
 data = offset_data
 
+if IMPORT_WLS:
+    # Retrieve all stations at once, in a few site-batched requests
+    nwis_by_station = nwis_get_batch(cross_ref_file, stations)
+
 for idx1, station_data in enumerate(data):
     worksheet = workbook.add_worksheet(stations[idx1])
     worksheet_idx = 1
@@ -116,7 +103,7 @@ for idx1, station_data in enumerate(data):
     # import WLs from NWIS
     if IMPORT_WLS:
         print("importing from NWIS:" + stations[idx1])
-        nwis_data = (nwis_get_data(cross_ref_file, stations[idx1]))
+        nwis_data = nwis_by_station[stations[idx1]]
 
         if nwis_data != 0:
             # Truncate tape-down times so VLOOKUP works correctly
@@ -7,7 +7,7 @@
 # .project.txt file is updated, and a comment added that describes the magnitude of the correction. The original
 # .project.txt file is copied to a new file, where 'project.txt' in the filename is replaced with 'original.txt'.
 # 
-# Laser drift corrections are taken from an Excel workbook, specified as a parameter in the script.
+# Laser drift corrections are taken from the calibration workbook for the instrument (see calibration.py).
 # 
 # Soil moisture corrections are taken from a text file downloaded from the
 # ORNL DAAC. 2017. Soil Moisture Visualizer. ORNL DAAC, Oak Ridge, Tennessee, USA.
@@ -17,6 +17,9 @@
 # represent the mean value of a 9 x 9km grid; all points within a cell have the same soil moisture time series.
 # 
 # A csv-file summary of the corrections is written, with the filename "Corrections_YYYY-MM-DD.csv"
+#
+# Corrections are applied by corrections.CorrectionPipeline: each file is rewritten once with all of the
+# corrections, and corrections that are already in a file (with the same value) aren't applied again.
 # 
 # Written for Python 2.7, updated for compatibility with Python 3.5 in 2018
 # 
@@ -31,23 +34,24 @@
 # it only applied the correction to previously uncorrected project.txt files.
 # 
 
-import string
 import os
 from tkinter import filedialog
 from tkinter import *
-import datetime
-import pandas as pd
 from time import strftime
+from dir_scan import scan_tree
+from calibration import CalibrationRegistry
+from corrections import CorrectionPipeline, LaserDriftCorrection, SoilMoistureCorrection, plan_report
+from correction_ledger import CorrectionLedger
 
 # User-specified options
 update_laser = True
-laser_cal_file = "\\\\Igswztwwgszona\\Gravity Data Archive\\Absolute Data\\A-10\\Instrument Maintenance\\Calibrations\\A10-008 clock and laser calibrations.xlsx"
-laser_cal_worksheet = "DRIFT LOOKUP TABLE"
+instrument = 'A10-008'  # calibration workbook is listed in calibration.WORKBOOKS
 
 update_SM = False
 if update_SM:
     sm_file = "BCnw_daily-smap-ORNL-DAAC-1s19jW.txt"
 write_corrections_to_file = True
+dry_run = False  # if True, print the planned changes without modifying any files
 
 # Either use a specified directory, or show a GUI for the user to decide
 pwd = os.getcwd()
@@ -57,132 +61,24 @@ data_directory = filedialog.askdirectory(
     parent=root,initialdir=pwd)
 # data_directory = u'\\\\Igswztwwgszona\\Gravity Data Archive\\Absolute Data\\A-10\\Final Data\\Big Chino'
 
-laser_corr, drift_rate, elapsed_days = -999, -999, -999
-sm_at_time_of_g, sm, sm_corr = -999, -999, -999
-
+corrections = []
 if update_laser:
-    xl = pd.ExcelFile(laser_cal_file)
-    df_drift = xl.parse(laser_cal_worksheet)
-
+    corrections.append(LaserDriftCorrection(CalibrationRegistry().get(instrument)))
 if update_SM:
-    df_sm = pd.read_csv(sm_file, header=4)
-    sm_date = df_sm["time"]
-    sm = df_sm["SMAP_rootzone"]
-else:
-    sm_corr = -999
-    sm_at_time_of_g
-    sm = pd.DataFrame([-999])
-
-if write_corrections_to_file:
-    # File save name is directory plus time and date
-    fid = open('.\working_dir\Corrections_' + strftime("%Y%m%d-%H%M") + '.csv', 'w')
-    fid.write('Station,Date,Drift_corr,Drift_rate,Elapsed_days_since_cal,SM_corr,SM,SM_mean\n')
+    corrections.append(SoilMoistureCorrection(sm_file))
+ledger = CorrectionLedger()  # corrections applied to each file; see correction_ledger.py
+pipeline = CorrectionPipeline(corrections, ledger)
 
-# For each file in the data_directory and subdirectories
-for dirname, dirnames, filenames in os.walk(data_directory):
-    for filename in filenames:
-        fname = os.path.join(dirname, filename)
-        # If the file name ends in "project.txt"
-        if fname.find('project.txt') != -1:
-            orig_fn = fname.replace('project', 'original')
-            if os.path.isfile(orig_fn):
-                print('Already performed laser update: ' + fname)
-                continue
-            else:
-                os.system('cp "' + fname + '" "' + fname.replace('project.txt', 'original.txt') + '"')
-                print(fname)
-                with open('temp.txt', "w") as fout:
-                    correct_for_laser_drift = False  # set to true if valid correction is found
-                    correct_for_sm = False           # set to true if valid correction is found
-                    with open(fname) as project_file:
-                        for line in project_file:
-                            line_elements = line.split(" ")
-                            # To deal with station names with spaces
-                            if line_elements[0] == "Name:":
-                                try:
-                                    name = ''
-                                    name += line_elements[1].strip()
-                                    if len(line_elements) > 2:
-                                        for idx, item in enumerate(line_elements):
-                                            if idx > 1:
-                                                name += '_'
-                                                name += item.strip()
-                                except:
-                                    name = 'NAME_ERROR'
-                                station = name
-                            if line_elements[0] == "Date:":
-                                date_str = line_elements[-1]
-                                dt = datetime.datetime.strptime(date_str.strip(), "%m/%d/%y")
-                            if line_elements[0] == "Gravity:":
-                                if update_laser:
-                                    for idx, row in df_drift.iterrows():
-                                        if dt > row["BEGIN"]:
-                                            if dt < row["END"]:
-                                                drift_rate = row["MPD"]
-                                                correct_for_laser_drift = True
-                                                elapsed_days = dt - row["BEGIN"].to_pydatetime()
-                                                elapsed_days = float(elapsed_days.days)
-                                                laser_corr = elapsed_days * drift_rate
-                                                break
-                                if update_SM:
-                                    for idx, row in df_sm.iterrows():
-                                        if dt >= datetime.datetime.strptime(row.time, "%Y-%m-%d"):
-                                            try:
-                                                if dt < datetime.datetime.strptime(df_sm.loc[idx+1, "time"],"%Y-%m-%d"):
-                                                    sm_at_time_of_g = row["SMAP_rootzone"]
-                                                    correct_for_sm = True
-                                                    sm_diff = sm_at_time_of_g - sm.mean()
-                                                    sm_corr = sm_diff*0.42
-                                                    break
-                                            except:
-                                                # at end of dataframe
-                                                continue
-                                g = float(line_elements[-2])
-                                microGal_symbol = line_elements[-1]
-                                if correct_for_laser_drift and correct_for_sm:
-                                    corr_g = g - laser_corr - sm_corr
-                                    fout.write('Gravity: ' + '{:9.2f}'.format(corr_g) + ' '
-                                               + microGal_symbol)
-                                elif correct_for_laser_drift:
-                                    corr_g = g - laser_corr
-                                    fout.write('Gravity: ' + '{:9.2f}'.format(corr_g) + ' '
-                                               + microGal_symbol)
-                                elif correct_for_sm:
-                                    corr_g = g - sm_corr
-                                    fout.write('Gravity: ' + '{:9.2f}'.format(corr_g) + ' '
-                                               + microGal_symbol)
-                                else:
-                                    fout.write(line)
-                            else:
-                                fout.write(line)
-
-                    if update_laser and correct_for_laser_drift:
-                        fout.write('Gravity value adjusted by ' +
-                                   '{:0.2f}'.format(laser_corr * -1) +
-                                   ' uGal for laser drift correction\n')
-                        fout.write('Drift rate was ' +
-                                   '{:0.4f}'.format(drift_rate) +
-                                   ' microGal/day\n')
-                        fout.write('Previous calibration was ' +
-                                   '{:.0f}'.format(elapsed_days) +
-                                   ' days prior to measurement\n\n')
-
-                    if update_SM and correct_for_sm:
-                        fout.write('Gravity value adjusted by ' +
-                                   '{:0.2f}'.format(sm_corr * -1) +
-                                   ' uGal for soil moisture correction\n')
-                        fout.write('Soil moisture in the root zone (0-100 cm) was ' +
-                                   '{:0.2f}'.format(sm_at_time_of_g) +
-                                   '; the mean value was ' +
-                                   '{:0.2f}'.format(sm.mean()) + '\n\n')
-                    if update_SM or update_laser:
-                        if write_corrections_to_file:
-                            fid.write(station +
-                                      ',' + dt.strftime("%Y-%m-%d") +
-                                      ',' + '{:0.2f}'.format(laser_corr * -1) +
-                                      ',' + '{:0.4f}'.format(drift_rate) +
-                                      ',' + '{:.0f}'.format(elapsed_days) + '\n')
-
-                os.system('cp temp.txt "' + fname + '"')
-                os.system('rm temp.txt')
-fid.close()
+# All corrections for every file in the data_directory and subdirectories are computed at once, and
+# each file that changes is rewritten once
+updates = pipeline.plan(list(scan_tree(data_directory, ('*project.txt',), skip_unpublished=False)))
+print(plan_report(updates))
+if dry_run:
+    print('Dry run: {} files would be updated'.format(len(updates)))
+else:
+    updates = pipeline.apply(updates)
+    if write_corrections_to_file:
+        # File save name is directory plus time and date
+        with open('.\\working_dir\\Corrections_' + strftime("%Y%m%d-%H%M") + '.csv', 'w') as fid:
+            pipeline.write_csv(fid, updates)
+ledger.close()
@@ -0,0 +1,285 @@
+"""
+Columnar store of parsed occupations (one row per project.txt file).
+
+The store is a directory of Parquet files, partitioned by study area and station:
+
+    <store>/study_area=TAMA/station=RM109/part-0.parquet
+
+Each row holds the typed fields of one project.txt file (see project_txt.FIELDS),
+plus the file path, g version, comments, and a 'dtime' timestamp. Rows are keyed
+by file path: re-parsing a file replaces its row (upsert), and new files are
+appended. Reads are a single Arrow read of the requested columns and partitions,
+e.g. every occupation in one study area, instead of re-parsing text files.
+
+Written by fg5_parse.py (--store). Read by fg5_plot.py, fg5_WL_plot.py,
+fg5_SY_plot.py, and fg5_toExcel.py via read_columns(), which also accepts the
+tab-delimited files written by fg5_parse.
+
+Requires pyarrow.
+
+Jeff Kennedy
+USGS
+"""
+import os
+import numpy as np
+from urllib.parse import quote
+from dateutil import parser
+from project_txt import MISSING, FIELDS, FLOAT_FIELDS, INT_FIELDS, ProjectRecord
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+PART_FILE = 'part-0.parquet'
+
+# Column names used in fg5_parse output files
+PARSE_OUTPUT_COLUMNS = {'stationname': 'Station Name', 'date': 'Date', 'time': 'Time',
+                        'gravity': 'Gravity', 'setscatter': 'Set Scatter', 'precision': 'Precision',
+                        'uncertainty': 'Uncertainty', 'setupht': 'Setup Height',
+                        'transferht': 'Transfer Height', 'actualht': 'Actual Height', 'gradient': 'Gradient',
+                        'nominalAP': 'NominalAP', 'barprescorr': 'Baro corr', 'transferhtcorr': 'Transfer ht corr',
+                        'elev': 'Elev', 'admittance': 'Admittance'}
+
+
+def _field_type(field):
+    if field in FLOAT_FIELDS:
+        return pa.float64()
+    if field in INT_FIELDS:
+        return pa.int32()
+    if field == 'date':
+        return pa.date32()
+    if field == 'time':
+        return pa.time32('s')
+    return pa.string()
+
+
+def schema():
+    """
+    :return: pyarrow schema of the Parquet files (the partition columns, study_area and station,
+        are added on read)
+    """
+    return pa.schema([('path', pa.string())] +
+                     [(field, _field_type(field)) for field in FIELDS] +
+                     [('version', pa.float64()), ('comments', pa.string()), ('dtime', pa.timestamp('s'))])
+
+
+def study_area(fname):
+    """
+    Study area of a project.txt file, from its location in the Gravity Data Archive (the same
+    path component used in the fg5_parse QC_MODE output).
+
+    :param fname: path to a project.txt file
+    """
+    parts = os.path.normpath(os.path.dirname(fname)).split(os.path.sep)
+    return parts[4] if len(parts) > 4 else MISSING
+
+
+def _station(record):
+    return record['stationname'] if record['stationname'] else MISSING
+
+
+def _row(fname, record):
+    """
+    Converts a parsed record to a dict of typed values, with the schema() column names.
+    """
+    occupation = ProjectRecord(record)
+    try:
+        dtime = occupation.dtime
+    except (AttributeError, IndexError, ValueError):
+        dtime = None
+    row = {'path': os.path.abspath(fname)}
+    for field in FIELDS:
+        value = getattr(occupation, field)
+        if value == MISSING:
+            value = None
+        row[field] = value
+    row['date'] = dtime.date() if dtime else None
+    row['time'] = dtime.time() if dtime else None
+    row['version'] = occupation.version
+    row['comments'] = occupation.comments
+    row['dtime'] = dtime
+    return row
+
+
+class MeasurementStore(object):
+    """
+    Parquet store of parsed occupations, partitioned by study area and station.
+
+    :param root: store directory; created if it doesn't exist
+    """
+
+    def __init__(self, root):
+        if pa is None:
+            raise ImportError('pyarrow is required for the measurement store (pip install pyarrow)')
+        if not os.path.exists(root):
+            os.makedirs(root)
+        self.root = root
+        self.partitioning = ds.partitioning(pa.schema([('study_area', pa.string()), ('station', pa.string())]),
+                                            flavor='hive')
+
+    def _partition_file(self, area, station):
+        return os.path.join(self.root,
+                            'study_area=' + quote(area, safe=''),
+                            'station=' + quote(station, safe=''),
+                            PART_FILE)
+
+    def _part_files(self):
+        return [os.path.join(dirpath, PART_FILE) for dirpath, dirnames, filenames in os.walk(self.root)
+                if PART_FILE in filenames]
+
+    def read(self, study_area=None, station=None, columns=None):
+        """
+        Reads occupations from the store. Only the requested partitions and columns are read; files
+        are memory-mapped, so the returned columns aren't copied.
+
+        :param study_area: optional study area to read
+        :param station: optional station to read
+        :param columns: optional list of columns, e.g. ['stationname', 'dtime', 'gravity']
+        :return: pyarrow.Table, with 'study_area' and 'station' columns from the partitioning
+        """
+        if not self._part_files():
+            table = schema().empty_table()
+            table = table.append_column('study_area', pa.array([], pa.string()))
+            table = table.append_column('station', pa.array([], pa.string()))
+            return table.select(columns) if columns else table
+        filters = []
+        if study_area is not None:
+            filters.append(('study_area', '=', study_area))
+        if station is not None:
+            filters.append(('station', '=', station))
+        return pq.read_table(self.root, columns=columns, filters=filters or None,
+                             partitioning=self.partitioning, memory_map=True)
+
+    def upsert(self, items):
+        """
+        Adds parsed occupations to the store, replacing any existing rows for the same files. Each
+        affected partition is rewritten once.
+
+        :param items: iterable of (filename, record) tuples, e.g. from fg5_parse.iter_projects()
+        :return: number of occupations added or replaced
+        """
+        partitions = {}
+        for fname, record in items:
+            row = _row(fname, record)
+            partitions.setdefault((study_area(fname), _station(record)), []).append(row)
+        if not partitions:
+            return 0
+        new_paths = pa.array([row['path'] for rows in partitions.values() for row in rows], pa.string())
+
+        # A file whose station name (or location) changed has to be removed from its old partition
+        existing = self.read(columns=['path', 'study_area', 'station'])
+        moved = existing.filter(pc.is_in(existing['path'], value_set=new_paths))
+        affected = set(partitions) | set(zip(moved['study_area'].to_pylist(), moved['station'].to_pylist()))
+
+        for key in affected:
+            new_table = pa.Table.from_pylist(partitions.get(key, []), schema=schema())
+            self._write_partition(key, new_table, new_paths)
+        return len(new_paths)
+
+    def delete(self, paths):
+        """
+        Removes the rows for files from the store (e.g., project.txt files that were deleted).
+
+        :param paths: list of project.txt paths
+        :return: number of rows removed
+        """
+        paths = pa.array([os.path.abspath(path) for path in paths], pa.string())
+        existing = self.read(columns=['path', 'study_area', 'station'])
+        found = existing.filter(pc.is_in(existing['path'], value_set=paths))
+        for key in set(zip(found['study_area'].to_pylist(), found['station'].to_pylist())):
+            self._write_partition(key, schema().empty_table(), paths)
+        return found.num_rows
+
+    def _write_partition(self, key, new_table, replaced_paths):
+        """
+        Rewrites one partition file: existing rows minus replaced_paths, plus new_table. The file is
+        replaced atomically, so readers never see a partial file.
+        """
+        part_file = self._partition_file(*key)
+        if os.path.exists(part_file):
+            old_table = pq.read_table(part_file, schema=schema())
+            keep = pc.invert(pc.is_in(old_table['path'], value_set=replaced_paths))
+            new_table = pa.concat_tables([old_table.filter(keep), new_table])
+        if new_table.num_rows == 0:
+            if os.path.exists(part_file):
+                os.remove(part_file)
+                os.rmdir(os.path.dirname(part_file))
+            return 0
+        os.makedirs(os.path.dirname(part_file), exist_ok=True)
+        new_table = new_table.sort_by([('dtime', 'ascending')])
+        pq.write_table(new_table, part_file + '.tmp')
+        os.replace(part_file + '.tmp', part_file)
+        return new_table.num_rows
+
+
+def is_store(path):
+    """
+    :return: True if path is a measurement store directory (or a Parquet file in one)
+    """
+    if os.path.isdir(path):
+        return any(name.startswith('study_area=') for name in os.listdir(path))
+    return path.endswith('.parquet')
+
+
+def float_array(values):
+    """
+    :param values: list of numbers, e.g. a numeric column from read_columns()
+    :return: float NumPy array; missing values (None or MISSING) are NaN
+    """
+    missing = float(MISSING)
+    return np.array([np.nan if value is None or value == missing else value for value in values], dtype=float)
+
+
+def read_columns(data_file, columns=('stationname', 'date', 'gravity')):
+    """
+    Reads columns of gravity data from a measurement store or from a file written by fg5_parse.py.
+
+    Dates are returned as datetime.datetime (as dateutil.parser returns them), numeric fields as
+    float, and other fields as strings. Missing values are the same for both sources: -999.0 for
+    numeric fields and '-999' (project_txt.MISSING) for other fields; occupations without a date or
+    gravity value (if those columns are read) are left out.
+
+    :param data_file: store directory, a Parquet file in a store (one station), or a tab-delimited
+        file from fg5_parse.py
+    :param columns: fields to read (see project_txt.FIELDS)
+    :return: dict of lists, keyed by field
+    """
+    missing_number = float(MISSING)
+    data = {column: [] for column in columns}
+    if is_store(data_file):
+        if os.path.isdir(data_file):
+            table = MeasurementStore(data_file).read(columns=list(columns))
+        else:
+            table = pq.read_table(data_file, columns=list(columns), memory_map=True)
+        for column in columns:
+            values = table[column]
+            if column == 'date':
+                values = pc.cast(values, pa.timestamp('s'))
+            placeholder = missing_number if column in FLOAT_FIELDS else MISSING
+            data[column] = [placeholder if value is None else value for value in values.to_pylist()]
+    else:
+        with open(data_file) as fp:
+            tags = [tag.strip() for tag in fp.readline().split("\t")]
+            cols = [tags.index(PARSE_OUTPUT_COLUMNS[column]) for column in columns]
+            for line in fp:
+                a = line.split("\t")
+                for column, col in zip(columns, cols):
+                    value = a[col]
+                    if column == 'date':
+                        # using the dateutil parser we can plot dates directly
+                        value = MISSING if value.strip() == MISSING else parser.parse(value)
+                    elif column in FLOAT_FIELDS:
+                        value = float(value)
+                    data[column].append(value)
+
+    # Occupations without a date or gravity value can't be plotted or compared
+    keep = [idx for idx in range(len(data[columns[0]])) if
+            ('date' not in data or data['date'][idx] != MISSING) and
+            ('gravity' not in data or data['gravity'][idx] != missing_number)]
+    if len(keep) < len(data[columns[0]]):
+        data = {column: [values[idx] for idx in keep] for column, values in data.items()}
+    return data
@@ -1,16 +1,46 @@
 """get_nwis_data Retrieve groundwater-level data from the USGS National Water Information System.
 
+Retrieved series are cached locally, one file per site (see NwisCache), with the
+date of the last retrieval. Later calls request only the data since then (with a
+few weeks of overlap, as recent values are provisional and can be revised), and
+sites retrieved within the last day aren't requested at all. If NWIS can't be
+reached, the cached data are used.
+
+nwis_get_batch() retrieves every station in the cross-ref file (or a list of
+stations) with a few site-batched requests to the NWIS web services (see usgs.py)
+instead of one or two requests per station.
+
+Jeff Kennedy
+USGS
 """
+import io
+import os
 from dateutil import parser
 import requests
+import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
 import datetime
 import string
+from batch_rewrite import write_atomic
+from usgs import nwis, nwisError
+
+NWIS_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.sgp-utils', 'nwis')
+BEGIN_DATE = '1999-10-01'  # start of the first retrieval for a site
+REFRESH_DAYS = np.timedelta64(1, 'D')  # sites retrieved more recently than this aren't requested again
+OVERLAP_DAYS = np.timedelta64(30, 'D')  # re-requested before the watermark, to pick up revised values
+SITE_BATCH_SIZE = 100  # sites per request in nwis_get_batch()
+WATER_LEVEL_PARAMETER = '72019'  # depth to water level, feet below land surface
+DAILY_MEAN = '00003'
+SERIES_KEYS = ('continuous_x', 'continuous_y', 'discrete_x', 'discrete_y')
 
 def plot_wells(cross_ref_file, site_IDs):
     fig, ax = plt.subplots()
+    all_data = nwis_get_batch(cross_ref_file, site_IDs)
     for well in site_IDs:
-        well_data = nwis_get_data(cross_ref_file, well)
+        well_data = all_data[well]
+        if not well_data:
+            continue
 
         if well_data['continuous_x']:
             ydata_meters = [x * 0.3048 for x in well_data['continuous_y']]
@@ -31,49 +61,50 @@ def plot_wells(cross_ref_file, site_IDs):
     input()
     
 
-def nwis_get_data(cross_ref_file, gravity_station_ID):
-    """Gets NWIS groundwater-level data via REST API
-    
+def read_cross_ref(cross_ref_file):
+    """
     :param cross_ref_file: csv-separated file with [gravitystation name], [USGS 15-digit ID]
-    :param gravity_station_ID: gravity station name (e.g., RM109)
-    :return: Dictionary with fields 'continuous_x', 'continuous_y', 'discrete_x', and 'discrete 'y'
+    :return: list of (gravity station name, NWIS ID) tuples, in file order
+    """
+    pairs = []
+    with open(cross_ref_file, 'r') as fid:
+        for line in fid:
+            if not line.strip():
+                continue
+            grav_ID, nwis_ID = line.strip().split(',')
+            pairs.append((grav_ID, nwis_ID))
+    return pairs
+
+
+def nwis_site_ID(cross_ref_file, gravity_station_ID, cross_ref=None):
+    """
+    :param gravity_station_ID: gravity station name (e.g., RM109), or a 15-digit NWIS ID
+    :param cross_ref: list returned by read_cross_ref(), if the file has already been read
+    :return: 15-digit NWIS ID, or 0 if the station isn't in the cross-ref file
     """
     if gravity_station_ID.isnumeric() and len(gravity_station_ID) == 15:
-        nwis_ID = gravity_station_ID
-        grav_ID = gravity_station_ID
-    else:
-        with open(cross_ref_file, 'r') as fid:
-            for line in fid:
-
-                grav_ID, nwis_ID = line.strip().split(',')
-                if grav_ID.upper() == gravity_station_ID.upper():
-                    if len(nwis_ID) != 15:
-                        print('Invalid 15-digit ID for site {}'.format(gravity_station_ID))
-                        return 0
-                    else:
-                        break
-            else:
-                print('Gravity Site-ID {} not found in cross-ref file'.format(gravity_station_ID))
+        return gravity_station_ID
+    if cross_ref is None:
+        cross_ref = read_cross_ref(cross_ref_file)
+    for grav_ID, nwis_ID in cross_ref:
+        if grav_ID.upper() == gravity_station_ID.upper():
+            if len(nwis_ID) != 15:
+                print('Invalid 15-digit ID for site {}'.format(gravity_station_ID))
                 return 0
+            return nwis_ID
+    print('Gravity Site-ID {} not found in cross-ref file'.format(gravity_station_ID))
+    return 0
+
+
+def parse_rdb(text):
+    """
+    Parses an NWIS rdb_meas response.
 
+    :return: dict of lists 'continuous_x', 'continuous_y', 'discrete_x', and 'discrete_y'
+    """
     discrete_x, discrete_y = [], []
     continuous_x, continuous_y = [], []
-    out_dic = dict()
-    # rdb_meas retrieval is preferred, it returns both discrete and continuous measurements.
-    nwis_URL = 'http://nwis.waterdata.usgs.gov/nwis/dv?cb_72019=on&format=rdb_meas' + \
-               f'&site_no={nwis_ID}' + \
-               '&referred_module=gw&period=&begin_date=1999-10-01&end_date=2021-03-01'
-    print('Retrieving rdb data for {} from {}'.format(grav_ID, nwis_URL))
-    r = requests.get(nwis_URL)
-    # If there is continuous data, it will start with '# ----... WARNING ---...'
-    if r.text[:5] != '# ---':
-    # if no continuous data, retrieve discrete data
-        nwis_URL: str = f'https://nwis.waterdata.usgs.gov/nwis/gwlevels/?site_no={nwis_ID}' + \
-                   '&format=rdb_meas'
-        print('No continuous data for {}. Retrieving discrete data from {}'.format(grav_ID, nwis_URL))
-        r = requests.get(nwis_URL)
-    nwis_data = r.text.split('\n')
-    for nwis_line in nwis_data:
+    for nwis_line in text.split('\n'):
         line_elems = nwis_line.split('\t')
         # Need to test for null strings because it's possible for there to be a date without a measurement.
         try:  # the rdb format has changed; parsing by '\t' barely works with the fixed-width fields
@@ -90,15 +121,306 @@ def nwis_get_data(cross_ref_file, gravity_station_ID):
                     continuous_y.append(float(line_elems[4]))
         except Exception as e:
             continue
-    out_dic['continuous_x'] = continuous_x
-    out_dic['continuous_y'] = continuous_y
-    out_dic['discrete_x'] = discrete_x
-    out_dic['discrete_y'] = discrete_y
-    if not out_dic:
+    return {'continuous_x': continuous_x, 'continuous_y': continuous_y,
+            'discrete_x': discrete_x, 'discrete_y': discrete_y}
+
+
+def _fetch_rdb(nwis_ID, grav_ID, begin_date, end_date, continuous=None):
+    """
+    Retrieves water levels for one site.
+
+    :param begin_date: first date, 'YYYY-MM-DD'
+    :param end_date: last date, 'YYYY-MM-DD'
+    :param continuous: True if the site is known to have continuous data, or None to find out (the
+        discrete data are requested if the daily-value request returns no continuous data)
+    :return: (dict of lists, see parse_rdb(); True if the site has continuous data)
+    :raises requests.HTTPError: if a request fails, so that an error page isn't read as "no data"
+    """
+    dates = f'&begin_date={begin_date}&end_date={end_date}'
+    # rdb_meas retrieval is preferred, it returns both discrete and continuous measurements.
+    nwis_URL = 'http://nwis.waterdata.usgs.gov/nwis/dv?cb_72019=on&format=rdb_meas' + \
+               f'&site_no={nwis_ID}' + \
+               '&referred_module=gw&period=' + dates
+    print('Retrieving rdb data for {} from {}'.format(grav_ID, nwis_URL))
+    r = requests.get(nwis_URL)
+    r.raise_for_status()
+    # If there is continuous data, it will start with '# ----... WARNING ---...'
+    if continuous or r.text[:5] == '# ---':
+        return parse_rdb(r.text), True
+    # if no continuous data, retrieve discrete data
+    nwis_URL: str = f'https://nwis.waterdata.usgs.gov/nwis/gwlevels/?site_no={nwis_ID}' + \
+                    '&format=rdb_meas' + dates
+    print('No continuous data for {}. Retrieving discrete data from {}'.format(grav_ID, nwis_URL))
+    r = requests.get(nwis_URL)
+    r.raise_for_status()
+    return parse_rdb(r.text), False
+
+
+class NwisCache(object):
+    """
+    Local cache of the water-level series of each NWIS site: one .npz file per site, with the
+    dates (datetime64) and values (float) of the continuous and discrete series, whether the site
+    has continuous data, and the date the site was last fetched (the watermark).
+
+    The rdb files (nwis_get_data()) and the web services (nwis_get_batch()) don't return the same
+    series (e.g., all continuous values vs. daily means), so each source has its own files; a series
+    is only ever topped up with data from the source it was retrieved from.
+
+    :param cache_dir: cache directory; created if it doesn't exist
+    :param source: 'rdb' or 'json'
+    """
+
+    def __init__(self, cache_dir=NWIS_CACHE_DIR, source='rdb'):
+        self.cache_dir = cache_dir
+        self.source = source
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _file(self, nwis_ID):
+        return os.path.join(self.cache_dir, '{}.{}.npz'.format(nwis_ID, self.source))
+
+    def load(self, nwis_ID):
+        """
+        :return: dict of arrays 'continuous_x', 'continuous_y', 'discrete_x', and 'discrete_y', plus
+            'continuous' (bool) and 'fetched' (datetime64[D]); or None if the site isn't cached
+        """
+        try:
+            with np.load(self._file(nwis_ID)) as npz:
+                series = {key: npz[key] for key in SERIES_KEYS}
+                series['continuous'] = bool(npz['continuous'])
+                series['fetched'] = npz['fetched'][()]
+        except (OSError, KeyError, ValueError):
+            return None
+        return series
+
+    def save(self, nwis_ID, series):
+        buffer = io.BytesIO()
+        np.savez(buffer, continuous=np.array(series['continuous']), fetched=np.array(series['fetched']),
+                 **{key: series[key] for key in SERIES_KEYS})
+        write_atomic(self._file(nwis_ID), buffer.getvalue())
+
+
+def to_arrays(data):
+    """
+    :param data: dict of lists (see parse_rdb())
+    :return: dict of arrays, dates as datetime64[s], values as float
+    """
+    series = {}
+    for kind in ('continuous', 'discrete'):
+        series[kind + '_x'] = np.array(data[kind + '_x'], dtype='datetime64[s]')
+        series[kind + '_y'] = np.array(data[kind + '_y'], dtype=float)
+    return series
+
+
+def to_lists(series):
+    """
+    :param series: dict of arrays (see to_arrays())
+    :return: dict of lists 'continuous_x', 'continuous_y', 'discrete_x', and 'discrete_y'; dates
+        are datetime.datetime
+    """
+    return {key: series[key].tolist() for key in SERIES_KEYS}
+
+
+def merge_series(cached, new, begin):
+    """
+    Replaces the cached values from begin onward with a newly retrieved series.
+
+    :param cached: dict of arrays (see to_arrays())
+    :param new: dict of arrays retrieved from begin onward
+    :param begin: datetime64 start of the new retrieval
+    :return: dict of arrays, sorted by date
+    """
+    merged = {}
+    for kind in ('continuous', 'discrete'):
+        x, y = cached[kind + '_x'], cached[kind + '_y']
+        keep = x < begin
+        x = np.concatenate([x[keep], new[kind + '_x']])
+        y = np.concatenate([y[keep], new[kind + '_y']])
+        order = np.argsort(x, kind='stable')
+        merged[kind + '_x'], merged[kind + '_y'] = x[order], y[order]
+    return merged
+
+
+def _refresh(cache, nwis_ID, grav_ID):
+    """
+    Brings the cached series for a site up to date, requesting only the data after the watermark.
+
+    :return: dict of arrays (see to_arrays())
+    """
+    today = np.datetime64(datetime.date.today(), 'D')
+    cached = cache.load(nwis_ID) if cache else None
+    if cached is not None and today - cached['fetched'] < REFRESH_DAYS:
+        return cached
+    if cached is None:
+        begin, continuous = np.datetime64(BEGIN_DATE, 'D'), None
+    else:
+        # A site without continuous data is checked again on each top-up, as the full retrieval does
+        begin, continuous = cached['fetched'] - OVERLAP_DAYS, (True if cached['continuous'] else None)
+    try:
+        data, continuous = _fetch_rdb(nwis_ID, grav_ID, str(begin), str(today), continuous)
+    except requests.RequestException as e:
+        # Includes HTTP errors; the cached series and its watermark are kept as they are
+        if cached is None:
+            raise
+        print('NWIS can\'t be reached ({}); using the cached data for {}'.format(e, grav_ID))
+        return cached
+    return _update(cache, nwis_ID, cached, to_arrays(data), begin, continuous, today)
+
+
+def _update(cache, nwis_ID, cached, series, begin, continuous, today):
+    """
+    Merges a newly retrieved series into the cached one and saves it.
+
+    :param cached: cached series (see NwisCache.load()), or None
+    :param series: dict of arrays retrieved from begin onward (see to_arrays())
+    :return: merged series
+    """
+    if cached is not None:
+        series = merge_series(cached, series, begin.astype('datetime64[s]'))
+    series['continuous'] = continuous
+    series['fetched'] = today
+    if cache:
+        cache.save(nwis_ID, series)
+    return series
+
+
+def nwis_get_data(cross_ref_file, gravity_station_ID, cache_dir=NWIS_CACHE_DIR):
+    """Gets NWIS groundwater-level data via REST API
+
+    Data are kept in a local cache (see NwisCache); after the first retrieval, only the data since
+    the last retrieval are requested.
+
+    :param cross_ref_file: csv-separated file with [gravitystation name], [USGS 15-digit ID]
+    :param gravity_station_ID: gravity station name (e.g., RM109)
+    :param cache_dir: cache directory, or None to retrieve the full record without caching
+    :return: Dictionary with fields 'continuous_x', 'continuous_y', 'discrete_x', and 'discrete 'y'
+    """
+    nwis_ID = nwis_site_ID(cross_ref_file, gravity_station_ID)
+    if not nwis_ID:
+        return 0
+    cache = NwisCache(cache_dir) if cache_dir else None
+    out_dic = to_lists(_refresh(cache, nwis_ID, gravity_station_ID))
+    if not (out_dic['continuous_x'] or out_dic['discrete_x']):
         print('No NWIS data found for site {}'.format(gravity_station_ID))
     return out_dic
 
 
+def _fetch_service(service, nwis_IDs, begin_date, end_date, **kwargs):
+    """
+    Retrieves depth to water for several sites in one request to an NWIS web service (see usgs.nwis).
+
+    :param service: 'dv' (daily values, from continuous records) or 'gwlevels' (discrete measurements)
+    :param nwis_IDs: list of 15-digit NWIS IDs
+    :return: dict of {NWIS ID: (datetime64[s] array, float array)}, for the sites with data
+    :raises nwisError: if the request fails for any reason other than there being no data
+    """
+    print('Retrieving {} data for {} sites ({} to {})'.format(service, len(nwis_IDs), begin_date, end_date))
+    try:
+        data = nwis(service, nwis_IDs, 'sites', parameterCd=WATER_LEVEL_PARAMETER, startDT=begin_date,
+                    endDT=end_date, **kwargs).data
+    except nwisError as e:
+        if e.status_code != 404:  # only 404 means none of the sites have data in the period
+            raise
+        print('No {} data: {}'.format(service, e.error_message))
+        return {}
+    if data is None:
+        return {}
+    # One site: a 'site_no' column; several sites: a (site_no, datetime) index
+    groups = data.groupby('site_no') if 'site_no' in data.columns else data.groupby(level='site_no')
+    result = {}
+    for nwis_ID, df in groups:
+        times = pd.DatetimeIndex(df.index.get_level_values(-1))
+        if times.tz is not None:
+            times = times.tz_localize(None)  # keep the local time, as in the rdb files
+        values = df['value'].values.astype(float)
+        keep = ~np.isnan(values)
+        result[nwis_ID] = (times.values.astype('datetime64[s]')[keep], values[keep])
+    return result
+
+
+def _fetch_sites(nwis_IDs, begin_date, end_date):
+    """
+    Retrieves continuous (daily mean) and discrete water levels for several sites: two requests,
+    whatever the number of sites.
+
+    :return: dict of {NWIS ID: dict of arrays} (see to_arrays())
+    """
+    continuous = _fetch_service('dv', nwis_IDs, begin_date, end_date, statCd=DAILY_MEAN)
+    discrete = _fetch_service('gwlevels', nwis_IDs, begin_date, end_date)
+    empty = (np.array([], dtype='datetime64[s]'), np.array([], dtype=float))
+    series = {}
+    for nwis_ID in nwis_IDs:
+        series[nwis_ID] = {}
+        series[nwis_ID]['continuous_x'], series[nwis_ID]['continuous_y'] = continuous.get(nwis_ID, empty)
+        series[nwis_ID]['discrete_x'], series[nwis_ID]['discrete_y'] = discrete.get(nwis_ID, empty)
+    return series
+
+
+def nwis_get_batch(cross_ref_file, stations=None, cache_dir=NWIS_CACHE_DIR, batch_size=SITE_BATCH_SIZE):
+    """Gets NWIS groundwater-level data for many gravity stations, in site-batched requests
+
+    Sites are requested batch_size at a time (two requests per batch, see _fetch_sites()), through
+    a local cache like that of nwis_get_data() (kept apart from it, see NwisCache): sites retrieved
+    within the last day aren't requested, and only the data since the last retrieval are requested
+    for the others.
+
+    :param cross_ref_file: csv-separated file with [gravitystation name], [USGS 15-digit ID]
+    :param stations: gravity station names (or NWIS IDs); default is every station in cross_ref_file
+    :param cache_dir: cache directory, or None to retrieve the full record without caching
+    :param batch_size: maximum number of sites per request
+    :return: dict of {station: dictionary with fields 'station', 'continuous_x', 'continuous_y',
+        'discrete_x', and 'discrete_y'}; 0 for stations that aren't in the cross-ref file
+    :raises requests.RequestException, usgs.nwisError: if a request fails and a site in the batch
+        isn't cached
+    """
+    cross_ref = read_cross_ref(cross_ref_file)
+    if stations is None:
+        stations = [grav_ID for grav_ID, nwis_ID in cross_ref]
+    site_IDs = {station: nwis_site_ID(cross_ref_file, station, cross_ref) for station in stations}
+
+    cache = NwisCache(cache_dir, source='json') if cache_dir else None
+    today = np.datetime64(datetime.date.today(), 'D')
+    cached, series, stale = {}, {}, {}
+    for nwis_ID in sorted(set(nwis_ID for nwis_ID in site_IDs.values() if nwis_ID)):
+        cached[nwis_ID] = cache.load(nwis_ID) if cache else None
+        if cached[nwis_ID] is not None and today - cached[nwis_ID]['fetched'] < REFRESH_DAYS:
+            series[nwis_ID] = cached[nwis_ID]
+            continue
+        # Sites are grouped by the start of their retrieval; most share a watermark
+        begin = np.datetime64(BEGIN_DATE, 'D') if cached[nwis_ID] is None else \
+            cached[nwis_ID]['fetched'] - OVERLAP_DAYS
+        stale.setdefault(begin, []).append(nwis_ID)
+
+    for begin, nwis_IDs in sorted(stale.items()):
+        for idx in range(0, len(nwis_IDs), batch_size):
+            batch = nwis_IDs[idx:idx + batch_size]
+            try:
+                new = _fetch_sites(batch, str(begin), str(today))
+            except (requests.RequestException, nwisError) as e:
+                # As in _refresh(): the cached series and their watermarks are kept as they are, and
+                # the error is raised if a site has nothing cached (rather than returning no data)
+                if any(cached[nwis_ID] is None for nwis_ID in batch):
+                    raise
+                print('NWIS request failed ({}); using the cached data'.format(getattr(e, 'error_message', e)))
+                for nwis_ID in batch:
+                    series[nwis_ID] = cached[nwis_ID]
+                continue
+            for nwis_ID in batch:
+                old = cached[nwis_ID]
+                continuous = len(new[nwis_ID]['continuous_x']) > 0 or (old is not None and old['continuous'])
+                series[nwis_ID] = _update(cache, nwis_ID, old, new[nwis_ID], begin, continuous, today)
+
+    out = {}
+    for station, nwis_ID in site_IDs.items():
+        if not nwis_ID:
+            out[station] = 0
+            continue
+        out[station] = to_lists(series[nwis_ID])
+        out[station]['station'] = station
+        if not (out[station]['continuous_x'] or out[station]['discrete_x']):
+            print('No NWIS data found for site {}'.format(station))
+    return out
+
 
 if __name__ == "__main__":
     plot_wells('SiteIDcrossref.csv', ['T2-S2','AAC-17','PK-1','T1-S5','324421114482101'])
\ No newline at end of file
@@ -0,0 +1,194 @@
+"""
+Persistent cache of parsed project.txt files.
+
+Parsed records are stored in an SQLite database, keyed by file path and checked
+against the file modification time and size. Only new or modified files are
+parsed again, so re-running a tool over an unchanged archive only needs a stat()
+of each file.
+
+The same cache file is used by fg5_parse, fg5_summarize, fg5_update_laser, and
+Ingestor.
+
+The database also remembers what fg5_parse exported from each directory (a hash
+of each parsed record), for delta exports (fg5_parse.py --delta).
+
+Example:
+    with ParseCache() as cache:
+        record = cache.read(fname)
+
+Jeff Kennedy
+USGS
+"""
+import os
+import json
+import sqlite3
+import hashlib
+from project_txt import PARSER_VERSION, ProjectParser, read_project_txt, read_project_txts
+
+DEFAULT_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.sgp-utils', 'project_txt_cache.sqlite')
+
+
+def record_hash(record, fields=None):
+    """
+    :param fields: optional fields to hash, e.g. the fields of a record exported by an older parser
+        version, so that fields added to the parser since then don't count as changes
+    :return: hash of the parsed content of a project.txt file; changes if any field or comment changes
+    """
+    if fields is not None:
+        record = {field: record[field] for field in fields if field in record}
+    return hashlib.sha1(json.dumps(record, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ParseCache(object):
+    """
+    SQLite-backed cache of project_txt records.
+
+    :param cache_file: path to the SQLite database; created if it doesn't exist
+    """
+
+    def __init__(self, cache_file=DEFAULT_CACHE_FILE):
+        cache_dir = os.path.dirname(cache_file)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.cache_file = cache_file
+        self.conn = sqlite3.connect(cache_file)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS project_files ('
+                          'path TEXT PRIMARY KEY, '
+                          'mtime INTEGER, '
+                          'size INTEGER, '
+                          'parser INTEGER, '
+                          'record TEXT)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS exports ('
+                          'directory TEXT, '
+                          'path TEXT, '
+                          'hash TEXT, '
+                          'record TEXT, '
+                          'PRIMARY KEY (directory, path))')
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    @staticmethod
+    def _key(fname):
+        st = os.stat(fname)
+        return st.st_mtime_ns, st.st_size
+
+    def lookup(self, fname, key=None):
+        """
+        Returns the cached record for a file, or None if it isn't cached or the file has changed.
+
+        :param fname: path to a project.txt file
+        :param key: (mtime_ns, size) tuple, if already known
+        """
+        if key is None:
+            key = self._key(fname)
+        row = self.conn.execute('SELECT mtime, size, parser, record FROM project_files WHERE path = ?',
+                                (os.path.abspath(fname),)).fetchone()
+        if row is None or (row[0], row[1]) != key or row[2] != PARSER_VERSION:
+            return None
+        return json.loads(row[3])
+
+    def store(self, fname, record, key=None):
+        if key is None:
+            key = self._key(fname)
+        self.conn.execute('INSERT OR REPLACE INTO project_files VALUES (?, ?, ?, ?, ?)',
+                          (os.path.abspath(fname), key[0], key[1], PARSER_VERSION, json.dumps(record)))
+
+    def read(self, fname, fields=None):
+        """
+        Returns the record for a file, parsing it only if it's new or modified.
+
+        :param fname: path to a project.txt file
+        :param fields: optional set of needed fields. If the file isn't cached, only these fields
+            are parsed (see project_txt.parse_project_lines()) and the partial record isn't stored.
+        :return: dict, see project_txt.parse_project_lines()
+        """
+        if fields is None:
+            return self.read_many([fname])[0]
+        record = self.lookup(fname)
+        if record is None:
+            record = read_project_txt(fname, fields)
+        return record
+
+    def read_if(self, fname, fields, predicate):
+        """
+        Reads a file only as far as needed to decide whether it's wanted, then (if it is) the rest
+        of it, in one pass over the file. E.g., Ingestor reads station name, date, and time to check
+        the date range, and reads the full record only for occupations in the range.
+
+        :param fname: path to a project.txt file
+        :param fields: set of fields needed by predicate (see project_txt.ProjectParser.parse())
+        :param predicate: function of a record; True if the file is wanted
+        :return: full record if predicate is True, otherwise None. Full records are stored in
+            the cache; a cached record is used without opening the file.
+        """
+        key = self._key(fname)
+        record = self.lookup(fname, key)
+        if record is not None:
+            return record if predicate(record) else None
+        with open(fname) as project_file:
+            parser = ProjectParser(project_file)
+            if not predicate(parser.parse(fields)):
+                return None
+            record = parser.parse()
+        self.store(fname, record, key)
+        self.conn.commit()
+        return record
+
+    def read_many(self, fnames, jobs=1, executor=None):
+        """
+        Returns the records for several files. Files that aren't in the cache (or have changed)
+        are parsed, in a process pool if jobs > 1.
+
+        :param fnames: list of paths
+        :param jobs: number of worker processes used to parse new or modified files
+        :param executor: concurrent.futures executor to use instead of starting a new pool
+        :return: list of dicts, in the same order as fnames
+        """
+        keys = [self._key(fname) for fname in fnames]
+        records = [self.lookup(fname, key) for fname, key in zip(fnames, keys)]
+        stale = [idx for idx, record in enumerate(records) if record is None]
+        if stale:
+            parsed = read_project_txts([fnames[idx] for idx in stale], jobs, executor)
+            for idx, record in zip(stale, parsed):
+                records[idx] = record
+                self.store(fnames[idx], record, keys[idx])
+            self.conn.commit()
+        return records
+
+    def remove(self, fname):
+        self.conn.execute('DELETE FROM project_files WHERE path = ?', (os.path.abspath(fname),))
+        self.conn.commit()
+
+    def exported(self, directory):
+        """
+        Returns what was exported from a directory the last time (see set_exported()).
+
+        :param directory: directory that was parsed
+        :return: dict of {path: (hash, record)}
+        """
+        rows = self.conn.execute('SELECT path, hash, record FROM exports WHERE directory = ?',
+                                 (os.path.abspath(directory),))
+        return {path: (digest, json.loads(record)) for path, digest, record in rows}
+
+    def set_exported(self, directory, records):
+        """
+        Replaces the record of what was exported from a directory.
+
+        :param directory: directory that was parsed
+        :param records: dict of {path: record} for every file that was exported
+        """
+        directory = os.path.abspath(directory)
+        self.conn.execute('DELETE FROM exports WHERE directory = ?', (directory,))
+        self.conn.executemany('INSERT INTO exports VALUES (?, ?, ?, ?)',
+                              ((directory, os.path.abspath(path), record_hash(record), json.dumps(record))
+                               for path, record in records.items()))
+        self.conn.commit()
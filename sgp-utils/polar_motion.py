@@ -0,0 +1,141 @@
+"""
+Polar motion (Earth orientation) from the IERS finals.data file.
+
+finals.data (https://datacenter.iers.org/) is a fixed-width file with one line per
+day (0h UTC): MJD in columns 8-15 and the IERS Bulletin A pole coordinates x and y
+(arcseconds) in columns 19-27 and 38-46. Days beyond the predictions have blank
+coordinates and are skipped.
+
+The file is parsed once into a binary cache (an .npy array of MJD, x, y), which is
+rebuilt when finals.data is newer than the cache. Pole coordinates for any number
+of measurement times are linearly interpolated in one call.
+
+Example:
+    pm = PolarMotion.from_finals()
+    x, y = pm.interpolate(mjd(dates, times))
+
+Jeff Kennedy
+USGS
+"""
+import os
+import datetime as dt
+import numpy as np
+
+FINALS_DATA = r"\\Igswztwwgszona\Gravity Data Archive\QAQC\finals.data"
+DEFAULT_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.sgp-utils', 'finals.data.npy')
+
+# Columns (0-based slices) in finals.data
+MJD_COLS = slice(7, 15)
+X_COLS = slice(18, 27)
+Y_COLS = slice(37, 46)
+
+MJD_EPOCH = np.datetime64('1858-11-17T00:00:00', 's')
+
+
+def read_finals(filename=FINALS_DATA):
+    """
+    Parses an IERS finals.data file.
+
+    :param filename: path to finals.data (or finals2000A.data, same format)
+    :return: (n, 3) float array of MJD, x, y (arcsec), sorted by MJD
+    """
+    mjd, x, y = [], [], []
+    with open(filename) as fp:
+        for line in fp:
+            x_value, y_value = line[X_COLS].strip(), line[Y_COLS].strip()
+            if not x_value or not y_value:
+                continue
+            mjd.append(line[MJD_COLS])
+            x.append(x_value)
+            y.append(y_value)
+    table = np.column_stack((np.array(mjd, dtype=float), np.array(x, dtype=float), np.array(y, dtype=float)))
+    return table[np.argsort(table[:, 0], kind='stable')] if len(table) else np.empty((0, 3))
+
+
+def load_finals(filename=FINALS_DATA, cache_file=DEFAULT_CACHE_FILE):
+    """
+    Reads finals.data through the .npy cache; the cache is rebuilt if finals.data is newer. If
+    finals.data can't be reached (e.g., the network share is down), the cached copy is used.
+
+    :return: (n, 3) float array of MJD, x, y (see read_finals())
+    """
+    cached = cache_file and os.path.exists(cache_file)
+    try:
+        source_mtime = os.path.getmtime(filename)
+    except OSError:
+        if not cached:
+            raise FileNotFoundError('{} can\'t be reached and isn\'t cached'.format(filename))
+        print('{} can\'t be reached; using the cached copy'.format(filename))
+        return np.load(cache_file)
+    if cached and os.path.getmtime(cache_file) >= source_mtime:
+        return np.load(cache_file)
+    table = read_finals(filename)
+    if cache_file:
+        cache_dir = os.path.dirname(cache_file)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        tmp_file = cache_file + '.tmp.npy'
+        np.save(tmp_file, table)
+        os.replace(tmp_file, cache_file)
+    return table
+
+
+def mjd(dates, times=None):
+    """
+    Modified Julian Date of measurement times.
+
+    :param dates: sequence of project.txt dates (mm/dd/yy) or datetime.datetime
+    :param times: optional sequence of project.txt times (hh:mm:ss, UTC); default 0h
+    :return: float array; NaN where the date or time can't be read
+    """
+    if times is None:
+        times = [None] * len(dates)
+    values = []
+    for date, time in zip(dates, times):
+        try:
+            if isinstance(date, str):
+                date = dt.datetime.strptime(date, '%m/%d/%y')
+            if time:
+                hms = dt.datetime.strptime(time, '%H:%M:%S')
+                date = date.replace(hour=hms.hour, minute=hms.minute, second=hms.second)
+        except (TypeError, ValueError):
+            date = None
+        values.append(date)
+    times = np.array(values, dtype='datetime64[s]')
+    result = (times - MJD_EPOCH).astype(float) / 86400.
+    result[np.isnat(times)] = np.nan
+    return result
+
+
+class PolarMotion(object):
+    """
+    Daily pole coordinates, interpolated to measurement times.
+
+    :param table: (n, 3) array of MJD, x, y sorted by MJD (see read_finals())
+    """
+
+    def __init__(self, table):
+        table = np.asarray(table, dtype=float)
+        self.mjd = table[:, 0]
+        self.x = table[:, 1]
+        self.y = table[:, 2]
+
+    @classmethod
+    def from_finals(cls, filename=FINALS_DATA, cache_file=DEFAULT_CACHE_FILE):
+        """
+        :param filename: path to finals.data
+        :param cache_file: path to the .npy cache, or None to always parse finals.data
+        """
+        return cls(load_finals(filename, cache_file))
+
+    def interpolate(self, mjds):
+        """
+        :param mjds: array of Modified Julian Dates (see mjd())
+        :return: (x, y) arrays in arcsec; NaN outside the range of the table
+        """
+        mjds = np.asarray(mjds, dtype=float)
+        if not len(self.mjd):
+            return np.full(mjds.shape, np.nan), np.full(mjds.shape, np.nan)
+        x = np.interp(mjds, self.mjd, self.x, left=np.nan, right=np.nan)
+        y = np.interp(mjds, self.mjd, self.y, left=np.nan, right=np.nan)
+        return x, y
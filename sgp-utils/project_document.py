@@ -0,0 +1,146 @@
+"""
+In-memory model of one project.txt file, for tools that edit the file (e.g., the
+correction pipeline in corrections.py).
+
+The file is read once; the parsed fields (station name, date, ...), the Gravity
+line, and the correction comments written by fg5_update are all taken from that
+one read. Edits (a new gravity value, removed or appended comment lines) are made
+in memory and the file is written once, with text() or save().
+
+Example:
+    doc = ProjectDocument.from_file(fname)
+    if doc.status == 'update':
+        doc.set_gravity(doc.gravity + 1.5)
+        doc.append(['Gravity value adjusted by 1.50 uGal for laser drift correction'])
+        doc.save()
+
+Jeff Kennedy
+USGS
+"""
+import hashlib
+from project_txt import parse_project_lines
+
+ADJUSTED_PREFIX = 'Gravity value adjusted by'
+NOT_ADJUSTED_PREFIX = 'Gravity value not adjusted'
+
+
+def content_hash(text):
+    """
+    :return: hash of the content of a file (str)
+    """
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class ProjectDocument(object):
+    """
+    :param fname: path to the project.txt file
+    :param text: content of the file
+    """
+
+    def __init__(self, fname, text):
+        self.fname = fname
+        self.hash = content_hash(text)  # of the file as read
+        self.lines = text.splitlines()
+        self.record = parse_project_lines(self.lines)
+        self.modified = False
+        self.gravity_index = None  # index of the 'Gravity:' line in lines
+        for idx, line in enumerate(self.lines):
+            line_elements = line.split()
+            if line_elements and line_elements[0] == 'Gravity:':
+                self.gravity_index = idx
+                break
+
+    @classmethod
+    def from_file(cls, fname):
+        with open(fname, 'r') as fin:
+            return cls(fname, fin.read())
+
+    @property
+    def station(self):
+        return self.record['stationname']
+
+    @property
+    def date(self):
+        return self.record['date']
+
+    @property
+    def gravity(self):
+        """
+        :return: gravity value on the Gravity line (float), or None if there isn't one
+        """
+        if self.gravity_index is None:
+            return None
+        return float(self.lines[self.gravity_index].split()[-2])
+
+    def set_gravity(self, value):
+        line_elements = self.lines[self.gravity_index].split()
+        self.lines[self.gravity_index] = 'Gravity: {:9.2f} {}'.format(value, line_elements[-1])
+        self.modified = True
+
+    def find(self, predicate):
+        """
+        :param predicate: function of a (stripped) line
+        :return: list of indexes of the lines for which predicate is True
+        """
+        return [idx for idx, line in enumerate(self.lines) if predicate(line.strip())]
+
+    def corrections(self):
+        """
+        :return: dict of {description: delta-g} for the 'Gravity value adjusted by X uGal for
+            <description>' comments in the file
+        """
+        corrections = {}
+        for idx in self.find(lambda line: line.startswith(ADJUSTED_PREFIX)):
+            line_elements = self.lines[idx].split()
+            corrections[' '.join(line_elements[7:])] = float(line_elements[4])
+        return corrections
+
+    @property
+    def status(self):
+        """
+        :return: 'done' if a correction has been applied, 'check' if a correction comment says the
+            gravity value wasn't adjusted, or 'update' if there are no correction comments
+        """
+        if self.find(lambda line: line.startswith(ADJUSTED_PREFIX)):
+            return 'done'
+        if self.find(lambda line: line.startswith(NOT_ADJUSTED_PREFIX)):
+            return 'check'
+        return 'update'
+
+    def remove(self, indexes):
+        """
+        Removes lines, and the blank line that follows a removed line (the end of a comment block).
+
+        :param indexes: indexes of the lines to remove
+        """
+        indexes = set(indexes)
+        if not indexes:
+            return
+        lines, gravity_index = [], None
+        for idx, line in enumerate(self.lines):
+            if idx in indexes or (idx - 1 in indexes and not line.strip()):
+                continue
+            if idx == self.gravity_index:
+                gravity_index = len(lines)
+            lines.append(line)
+        self.lines, self.gravity_index = lines, gravity_index
+        self.modified = True
+
+    def append(self, lines):
+        """
+        :param lines: lines to add at the end of the file (without line endings)
+        """
+        self.lines += lines
+        self.modified = True
+
+    def text(self):
+        return ''.join(line + '\n' for line in self.lines)
+
+    def save(self):
+        """
+        Writes the file, if it was modified. See batch_rewrite.py for writing many files atomically.
+        """
+        if self.modified:
+            with open(self.fname, 'w') as fout:
+                fout.write(self.text())
+            self.modified = False
@@ -0,0 +1,306 @@
+"""
+Shared parser for the .project.txt files written by Micro-g LaCoste 'g' software.
+
+Each line is matched once against a single precompiled alternation of the known
+labels ("Gravity:", "Set Scatter:", "Lat:", ...). The matched label is looked up
+in a table that maps it to one (or, for Lat/Long/Elev and polar motion, several)
+record fields. The g version is detected once, from the "Version" line near the
+top of the file, and selects the label table: files written by g versions before
+5 don't have setup/transfer/actual heights, time offset, or the transfer-height
+correction.
+
+Fields that aren't found in a file are returned as '-999', the same placeholder
+used in fg5_parse output.
+
+Should work with g8 and g9.
+
+Jeff Kennedy
+USGS
+"""
+import re
+import datetime as dt
+from concurrent.futures import ProcessPoolExecutor
+
+MISSING = '-999'
+
+# Increment when the parsed fields change; records cached by parse_cache.py with an older version are re-parsed
+PARSER_VERSION = 2
+
+# Tabular fields, in fg5_parse column order. Parsed records also have 'version' and 'comments'.
+FIELDS = ('created', 'project', 'stationname', 'lat', 'long', 'elev',
+          'setupht', 'transferht', 'actualht', 'gradient', 'nominalAP',
+          'polarx', 'polary', 'dffile', 'olfile', 'clock', 'blue', 'red',
+          'date', 'time', 'timeoffset', 'gravity', 'setscatter', 'precision',
+          'uncertainty', 'collected', 'processed', 'barprescorr', 'transferhtcorr', 'admittance')
+
+# Fields added after the fg5_parse column layout was set; they're written after the Comments column,
+# so the column letters used by the spreadsheet formulas don't move
+APPENDED_FIELDS = ('admittance',)
+
+# These keep the entire value (station names and filenames can have spaces); all
+# other fields keep the first token of the value.
+TEXT_FIELDS = frozenset(('project', 'stationname', 'dffile', 'olfile'))
+
+# Numeric fields, converted once by ProjectRecord
+FLOAT_FIELDS = frozenset(('lat', 'long', 'elev', 'setupht', 'transferht', 'actualht', 'gradient',
+                          'nominalAP', 'polarx', 'polary', 'clock', 'blue', 'red', 'gravity',
+                          'setscatter', 'precision', 'uncertainty', 'barprescorr', 'transferhtcorr',
+                          'admittance'))
+INT_FIELDS = frozenset(('collected', 'processed'))
+
+# Labels in the header, station, instrument, and results part of the file (g5 and later)
+_LABELS = {
+    'g Processing Version': 'version',
+    'Version': 'version',
+    'File Created': 'created',
+    'Project Name': 'project',
+    'Name': 'stationname',
+    'Lat': ('lat', 'long', 'elev'),  # three values on the same line
+    'Setup Height': 'setupht',
+    'Transfer Height': 'transferht',
+    'Actual Height': 'actualht',
+    'Gradient': 'gradient',
+    'Nominal Air Pressure': 'nominalAP',
+    'Barometric Admittance Factor': 'admittance',
+    'Polar Motion Coord': ('polarx', 'polary'),
+    'Delta Factor Filename': 'dffile',
+    'Ocean Load ON, Filename': 'olfile',
+    'Rubidium Frequency': 'clock',
+    'Blue Lock': 'blue',
+    'Red Lock': 'red',
+    'Date': 'date',
+    'Time': 'time',
+    'Time Offset (D h:m:s)': 'timeoffset',
+    'Gravity': 'gravity',
+    'Set Scatter': 'setscatter',
+    'Measurement Precision': 'precision',
+    'Total Uncertainty': 'uncertainty',
+    'Number of Sets Collected': 'collected',
+    'Number of Sets Processed': 'processed',
+}
+
+# Labels in the "Gravity Corrections" section
+_CORRECTION_LABELS = {
+    'Barometric Pressure': 'barprescorr',
+    'Transfer Height': 'transferhtcorr',
+}
+
+# Old g versions don't write these
+_NOT_IN_PRE5 = ('setupht', 'transferht', 'actualht', 'timeoffset', 'transferhtcorr')
+_LABELS_PRE5 = {k: v for k, v in _LABELS.items() if v not in _NOT_IN_PRE5}
+_CORRECTION_LABELS_PRE5 = {k: v for k, v in _CORRECTION_LABELS.items() if v not in _NOT_IN_PRE5}
+
+# Section headers. "Gradient:" is repeated in the Uncertainties section, so nothing is read there.
+_SECTIONS = ('Gravity Corrections', 'Uncertainties', 'Comments')
+
+# Label table for each section: {section: (g5 and later, pre-g5)}
+_TABLES = {
+    None: (_LABELS, _LABELS_PRE5),
+    'Gravity Corrections': (_CORRECTION_LABELS, _CORRECTION_LABELS_PRE5),
+    'Uncertainties': ({}, {}),
+}
+
+# One alternation for every label; longest first so e.g. 'Time Offset (D h:m:s)' wins over 'Time'
+_ALL_LABELS = sorted(set(_LABELS) | set(_CORRECTION_LABELS), key=len, reverse=True)
+_LABEL_RE = re.compile(r'(' + '|'.join(re.escape(label) for label in _ALL_LABELS) + r')\s*:\s*(.*)')
+_NUMBER_RE = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+
+def new_record():
+    """
+    Returns an empty record (dict), with every field set to the missing-value placeholder.
+    """
+    record = dict.fromkeys(FIELDS, MISSING)
+    record['version'] = 0.
+    record['comments'] = ''
+    return record
+
+
+class ProjectParser(object):
+    """
+    Single-pass parser of the lines of one project.txt file, which can stop and resume.
+
+    parse(fields) reads lines only until the requested fields are found; a later parse() continues
+    from the same line, so a file can be filtered on a few fields and then read to the end without
+    being reopened or re-read.
+
+    :param lines: iterable of lines (e.g., an open file)
+    """
+
+    def __init__(self, lines):
+        self.lines = iter(lines)
+        self.record = new_record()
+        self.found = set()  # names of the fields found so far
+        self.comments = []
+        self.section = None
+        self.pre5 = 0  # index into _TABLES entries; switched if the file is from g version < 5
+
+    def parse(self, fields=None):
+        """
+        :param fields: optional set of needed fields, e.g. {'stationname', 'date', 'time'}. Reading stops
+            as soon as all of them are found, so the rest of the file (uncertainties, corrections,
+            comments) isn't read. Other fields may be missing from the returned record. Requesting
+            'comments' means reading to the end of the file.
+        :return: dict with keys FIELDS, 'version' (float), and 'comments' (lines joined with ' | ')
+        """
+        record = self.record
+        remaining = None
+        if fields is not None and 'comments' not in fields:
+            remaining = set(fields)
+            remaining.discard('version')  # always read; it comes first and selects the label table
+            if not remaining:
+                remaining = None
+            else:
+                remaining -= self.found
+                if not remaining:
+                    return self._result()
+        for line in self.lines:
+            line = line.strip()
+            if self.section == 'Comments':
+                if line:
+                    self.comments.append(line)
+                continue
+            if not line:
+                continue
+            if line.rstrip(':') in _SECTIONS:
+                self.section = line.rstrip(':')
+                continue
+
+            match = _LABEL_RE.match(line)
+            if match is None:
+                continue
+            field = _TABLES[self.section][self.pre5].get(match.group(1))
+            names = field if isinstance(field, tuple) else (field,)
+            if field is None or names[0] in self.found:
+                continue
+            self.found.update(names)
+            value = match.group(2).strip()
+
+            if isinstance(field, tuple):
+                numbers = _NUMBER_RE.findall(value.replace(',', ''))
+                for name, number in zip(field, numbers):
+                    record[name] = number
+            elif field == 'version':
+                try:
+                    record['version'] = float(value.split()[0])
+                except (IndexError, ValueError):
+                    continue
+                self.pre5 = 1 if record['version'] < 5 else 0
+            elif field in TEXT_FIELDS:
+                record[field] = value
+            elif value:
+                record[field] = value.split()[0].replace(',', '')
+
+            if remaining is not None:
+                remaining.difference_update(names)
+                if not remaining:
+                    break
+        return self._result()
+
+    def _result(self):
+        record = dict(self.record)
+        record['comments'] = ' | '.join(self.comments)
+        return record
+
+
+def parse_project_lines(lines, fields=None):
+    """
+    Parses the lines of a project.txt file in a single pass.
+
+    :param lines: iterable of lines (e.g., an open file)
+    :param fields: optional set of needed fields; see ProjectParser.parse()
+    :return: dict with keys FIELDS, 'version' (float), and 'comments' (lines joined with ' | ')
+    """
+    return ProjectParser(lines).parse(fields)
+
+
+def read_project_txt(filename, fields=None):
+    """
+    Reads a project.txt file.
+
+    :param filename: path to a *.project.txt file
+    :param fields: optional set of needed fields; see parse_project_lines()
+    :return: dict, see parse_project_lines()
+    """
+    with open(filename) as project_file:
+        return parse_project_lines(project_file, fields)
+
+
+def read_project_txts(fnames, jobs=1, executor=None):
+    """
+    Reads several project.txt files.
+
+    :param fnames: list of paths
+    :param jobs: number of worker processes; if > 1, files are parsed in a process pool
+    :param executor: concurrent.futures executor to use instead of starting a new pool
+    :return: list of dicts, in the same order as fnames
+    """
+    if executor is not None:
+        return list(executor.map(read_project_txt, fnames, chunksize=16))
+    if jobs > 1 and len(fnames) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            return list(executor.map(read_project_txt, fnames, chunksize=16))
+    return [read_project_txt(fname) for fname in fnames]
+
+
+def to_number(value, number_type):
+    if value == MISSING:
+        return None
+    try:
+        return number_type(value)
+    except ValueError:
+        return None
+
+
+class ProjectRecord(object):
+    """
+    Compact, typed record of one occupation (one project.txt file).
+
+    Numeric fields (FLOAT_FIELDS, INT_FIELDS) are converted once when the record is
+    created; fields missing from the file are None. Other fields are strings. dtime
+    is computed on first access and cached.
+
+    :param record: dict returned by read_project_txt() or ParseCache.read()
+    """
+    __slots__ = FIELDS + ('version', 'comments', '_dtime')
+
+    def __init__(self, record=None):
+        for field in ProjectRecord.__slots__:
+            setattr(self, field, None)
+        if record:
+            self.update(record)
+
+    @classmethod
+    def from_file(cls, filename, cache=None, fields=None):
+        """
+        :param filename: path to a project.txt file
+        :param cache: parse_cache.ParseCache; if given, the file is only parsed if it has changed
+        :param fields: optional set of needed fields; other fields may be None
+        """
+        return cls(cache.read(filename, fields) if cache else read_project_txt(filename, fields))
+
+    def update(self, record):
+        for field in FIELDS:
+            value = record[field]
+            if field in FLOAT_FIELDS:
+                value = to_number(value, float)
+            elif field in INT_FIELDS:
+                value = to_number(value, int)
+            setattr(self, field, value)
+        self.version = record['version']
+        self.comments = record['comments']
+        self._dtime = None
+
+    @property
+    def dtime(self):
+        # convert strings to datetime, once
+        if self._dtime is None:
+            date_arr = self.date.split('/')
+            time_arr = self.time.split(':')
+            self._dtime = dt.datetime(2000 + int(date_arr[2]),
+                                      int(date_arr[0]),
+                                      int(date_arr[1]),
+                                      int(time_arr[0]),
+                                      int(time_arr[1]),
+                                      int(time_arr[2]))
+        return self._dtime
@@ -0,0 +1,151 @@
+"""
+Re-references absolute-gravity values to a common height, or to an updated
+vertical gradient, for every occupation in a parsed measurement table (a file
+written by fg5_parse.py or a measurement store; see measurement_store.py).
+
+g reports gravity at the transfer height, after moving it from the actual
+(effective measurement) height with the station gradient:
+
+    g(transfer) = g(actual) + gradient * (transfer height - actual height)
+
+The transfer-height correction is removed and gravity is moved to the requested
+height with the new gradient, for all occupations in one NumPy pass. Heights are
+in cm and gradients in microGal/cm, as in project.txt files. The uncertainty of
+the gradient is propagated as gradient error * |height - actual height| and added
+in quadrature to the total uncertainty.
+
+Usage:
+    python reference_height.py <data file> --height 100 [--gradients gradients.csv]
+        [--gradient-error 0.1] [--output rereferenced.txt]
+
+gradients.csv has a header line and columns Station, Gradient, and optionally
+Gradient error (e.g., from a new gradient survey).
+
+Jeff Kennedy
+USGS
+"""
+import sys
+import csv
+import argparse
+import numpy as np
+from measurement_store import read_columns, float_array
+
+COLUMNS = ('stationname', 'date', 'gravity', 'uncertainty', 'actualht', 'transferht', 'gradient',
+           'transferhtcorr')
+DEFAULT_GRADIENT_ERROR = 0.0  # microGal/cm
+
+
+def read_table(data_file):
+    """
+    Reads the columns needed to re-reference gravity.
+
+    :param data_file: file written by fg5_parse.py, or a measurement store
+    :return: dict of arrays, keyed by field (see COLUMNS); numeric fields are float arrays
+    """
+    data = read_columns(data_file, COLUMNS)
+    table = {'stationname': np.array(data['stationname'], dtype=object),
+             'date': np.array(data['date'], dtype=object)}
+    for column in COLUMNS[2:]:
+        table[column] = float_array(data[column])
+    return table
+
+
+def read_gradients(filename):
+    """
+    :param filename: csv file with a header line and columns Station, Gradient, and optionally
+        Gradient error
+    :return: (dict of {station: gradient}, dict of {station: gradient error})
+    """
+    gradients, errors = {}, {}
+    with open(filename, newline='') as fin:
+        reader = csv.reader(fin)
+        next(reader)
+        for row in reader:
+            if len(row) < 2:
+                continue
+            gradients[row[0].strip()] = float(row[1])
+            if len(row) > 2 and row[2].strip():
+                errors[row[0].strip()] = float(row[2])
+    return gradients, errors
+
+
+def _per_station(stations, values, default):
+    """
+    :param values: dict of {station: value}, or None
+    :param default: array (one value per occupation) or scalar used for stations not in values
+    :return: float array, one value per occupation
+    """
+    result = np.broadcast_to(np.asarray(default, dtype=float), stations.shape).copy()
+    if values:
+        for station, value in values.items():
+            result[stations == station] = value
+    return result
+
+
+def rereference(table, height=None, gradients=None, gradient_errors=None,
+                gradient_error=DEFAULT_GRADIENT_ERROR):
+    """
+    Recomputes gravity at a reference height and (or) with updated gradients.
+
+    :param table: dict of arrays (see read_table())
+    :param height: reference height, cm (scalar or one value per occupation); default is the
+        transfer height of each occupation
+    :param gradients: dict of {station: gradient, microGal/cm}; other stations keep their gradient
+    :param gradient_errors: dict of {station: gradient error, microGal/cm}
+    :param gradient_error: gradient error for stations not in gradient_errors, microGal/cm
+    :return: dict of arrays 'gravity', 'uncertainty', 'height', and 'gradient'. Occupations without
+        an actual height (g versions before 5) keep their gravity value at the transfer height.
+    """
+    stations = table['stationname']
+    actual = table['actualht']
+    transfer = table['transferht']
+    old_gradient = table['gradient']
+    new_gradient = _per_station(stations, gradients, old_gradient)
+    errors = _per_station(stations, gradient_errors, gradient_error)
+    height = transfer if height is None else np.broadcast_to(np.asarray(height, dtype=float), transfer.shape)
+
+    # Transfer-height correction that g applied; computed from the heights if it isn't in the file
+    applied = np.where(np.isnan(table['transferhtcorr']), old_gradient * (transfer - actual),
+                       table['transferhtcorr'])
+    g_actual = table['gravity'] - applied
+    gravity = g_actual + new_gradient * (height - actual)
+    uncertainty = np.sqrt(table['uncertainty'] ** 2 + (errors * np.abs(height - actual)) ** 2)
+
+    no_heights = np.isnan(actual)
+    gravity[no_heights] = table['gravity'][no_heights]
+    uncertainty[no_heights] = table['uncertainty'][no_heights]
+    height = np.where(no_heights, transfer, height)
+    return {'gravity': gravity, 'uncertainty': uncertainty, 'height': height, 'gradient': new_gradient}
+
+
+def write_table(fout, table, result):
+    """
+    Writes re-referenced gravity, tab-delimited.
+    """
+    fout.write('Station Name\tDate\tGravity\tUncertainty\tReference Height\tGradient\tOriginal Gravity\n')
+    for idx in range(len(result['gravity'])):
+        fout.write('{}\t{}\t{:0.2f}\t{:0.2f}\t{:0.2f}\t{:0.3f}\t{:0.2f}\n'.format(
+            table['stationname'][idx], table['date'][idx].strftime('%Y-%m-%d'), result['gravity'][idx],
+            result['uncertainty'][idx], result['height'][idx], result['gradient'][idx], table['gravity'][idx]))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Re-reference gravity to a common height and (or) '
+                                                     'updated gradients.')
+    arg_parser.add_argument('data_file', help='fg5_parse.py output file, or a measurement store directory')
+    arg_parser.add_argument('--height', type=float, help='reference height, cm (default: transfer height)')
+    arg_parser.add_argument('--gradients', help='csv file of Station, Gradient[, Gradient error]')
+    arg_parser.add_argument('--gradient-error', type=float, default=DEFAULT_GRADIENT_ERROR,
+                            help='gradient error, microGal/cm, for stations without one in --gradients')
+    arg_parser.add_argument('--output', help='output file (default: standard output)')
+    args = arg_parser.parse_args()
+
+    gradients, gradient_errors = read_gradients(args.gradients) if args.gradients else (None, None)
+    table = read_table(args.data_file)
+    result = rereference(table, args.height, gradients, gradient_errors, args.gradient_error)
+    if args.output:
+        with open(args.output, 'w') as fout:
+            write_table(fout, table, result)
+        print('Output file written: {}'.format(args.output))
+    else:
+        write_table(sys.stdout, table, result)
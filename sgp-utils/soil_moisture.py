@@ -0,0 +1,78 @@
+"""
+Soil-moisture correction for absolute-gravity measurements.
+
+A root-zone soil-moisture time series for a point (e.g., SMAP, downloaded from the
+ORNL DAAC Soil Moisture Visualizer, http://dx.doi.org/10.3334/ORNLDAAC/1366) is
+loaded once into sorted datetime64 and float arrays. The value at each measurement
+date, and the correction relative to the mean of the series, are found for all
+measurements in one np.searchsorted call:
+
+    correction (microGal) = (soil moisture - mean soil moisture) * admittance
+
+Example:
+    series = SoilMoistureSeries.from_smap_file(sm_file)
+    sm, sm_corr = series.correction(dates)
+
+Jeff Kennedy
+USGS
+"""
+import numpy as np
+import pandas as pd
+from calibration import to_datetime64
+
+ADMITTANCE = 0.42  # microGal per unit of soil moisture
+SMAP_HEADER_ROW = 4  # header line in the ORNL DAAC csv files
+SMAP_TIME_COLUMN = 'time'
+SMAP_VALUE_COLUMN = 'SMAP_rootzone'
+
+
+class SoilMoistureSeries(object):
+    """
+    Soil-moisture time series; each value applies from its time until the next one (one day for
+    the last value).
+
+    :param times: sequence of dates (datetime64 or datetime)
+    :param values: soil moisture at each time
+    """
+
+    def __init__(self, times, values):
+        times = np.asarray(times, dtype='datetime64[s]')
+        values = np.asarray(values, dtype=float)
+        order = np.argsort(times, kind='stable')
+        self.times = times[order]
+        self.values = values[order]
+        self.ends = np.append(self.times[1:], self.times[-1:] + np.timedelta64(1, 'D'))
+        self.mean = np.nanmean(self.values) if len(self.values) else np.nan
+
+    @classmethod
+    def from_smap_file(cls, sm_file):
+        """
+        :param sm_file: csv file from the ORNL DAAC Soil Moisture Visualizer, with 'time'
+            (YYYY-MM-DD) and 'SMAP_rootzone' columns
+        """
+        df_sm = pd.read_csv(sm_file, header=SMAP_HEADER_ROW)
+        times = pd.to_datetime(df_sm[SMAP_TIME_COLUMN], format='%Y-%m-%d').values
+        return cls(times, df_sm[SMAP_VALUE_COLUMN].values)
+
+    def value_at(self, dates):
+        """
+        :param dates: sequence of dates (see calibration.to_datetime64())
+        :return: soil moisture at each date; NaN outside the series (or for dates that can't be read)
+        """
+        dates = to_datetime64(dates)
+        if not len(self.times):
+            return np.full(len(dates), np.nan)
+        idx = np.searchsorted(self.times, dates, side='right') - 1
+        valid = (idx >= 0) & ~np.isnat(dates)
+        idx = np.where(valid, idx, 0)
+        valid &= dates < self.ends[idx]
+        return np.where(valid, self.values[idx], np.nan)
+
+    def correction(self, dates, admittance=ADMITTANCE):
+        """
+        :param dates: sequence of dates (see calibration.to_datetime64())
+        :param admittance: microGal per unit of soil moisture
+        :return: (soil moisture, correction in microGal) arrays; NaN where there's no data
+        """
+        sm = self.value_at(dates)
+        return sm, (sm - self.mean) * admittance
@@ -14,8 +14,9 @@ import requests
 
 
 class nwisError(Exception):
-    def __init__(self, error_message):
+    def __init__(self, error_message, status_code=None):
         self.error_message = error_message
+        self.status_code = status_code  # HTTP status of the response, if there was one
 
     def __str__(self):
         r""" This just returns one of the error messages listed in the checkresponse() function"""
@@ -63,17 +64,18 @@ class nwis(object):
             print('connection successful')
             return response
         elif response.status_code == 403:
-            raise nwisError('The USGS has blocked your Internet Protocol (IP) address')
+            raise nwisError('The USGS has blocked your Internet Protocol (IP) address', response.status_code)
         elif response.status_code == 400:
-            raise nwisError('URL arguments are inconsistent')
+            raise nwisError('URL arguments are inconsistent', response.status_code)
         elif response.status_code == 404:
-            raise nwisError('The query expresses a combination of elements where data do not exist.')
+            raise nwisError('The query expresses a combination of elements where data do not exist.',
+                            response.status_code)
         elif response.status_code == 500:
-            raise nwisError('There is a problem with the web service')
+            raise nwisError('There is a problem with the web service', response.status_code)
         elif response.status_code == 503:
-            raise nwisError('This application is down at the moment')
+            raise nwisError('This application is down at the moment', response.status_code)
         else:
-            raise nwisError('Something went wrong.')
+            raise nwisError('Something went wrong.', response.status_code)
 
     def get_response(self, **kwargs):
         """ Returns a dictionary of data requested by each function.
@@ -99,7 +101,7 @@ class nwis(object):
             try:
                 response_ob.json()
             except:
-                raise nwisError("Could not decode response from {:} ".format(response_ob.url))
+                raise nwisError("Could not decode response from {:} ".format(response_ob.url), response_ob.status_code)
 
         return self._checkresponse(response_ob)
 
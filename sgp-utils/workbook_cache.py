@@ -0,0 +1,117 @@
+"""
+Local cache of worksheets from Excel workbooks on the network share (e.g., the
+instrument calibration workbooks read by calibration.py).
+
+Reading a workbook over VPN takes seconds. Each worksheet that's read is saved to
+a local columnar file (Parquet if pyarrow is installed, otherwise a pickle),
+together with the modification time and size of the workbook. The cached copy is
+used as long as the workbook hasn't changed; if the workbook can't be reached, the
+cached copy is used regardless, so work can continue offline.
+
+Example:
+    sheets = read_sheets(workbook, ['calibrations', 'DRIFT LOOKUP TABLE'])
+
+Jeff Kennedy
+USGS
+"""
+import os
+import json
+import hashlib
+import pandas as pd  # reading .xlsx files also requires openpyxl (or xlrd for .xls)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.sgp-utils', 'workbooks')
+
+
+def _cache_files(workbook, sheet, cache_dir):
+    """
+    :return: (metadata file, Parquet file, pickle file) paths for a worksheet
+    """
+    key = hashlib.sha1('{}|{}'.format(os.path.abspath(workbook), sheet).encode('utf-8')).hexdigest()[:16]
+    base = os.path.join(cache_dir, key)
+    return base + '.json', base + '.parquet', base + '.pkl'
+
+
+def _source_key(workbook):
+    """
+    :return: [mtime_ns, size] of the workbook, or None if it can't be reached
+    """
+    try:
+        st = os.stat(workbook)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _load_cached(workbook, sheet, cache_dir, source_key):
+    """
+    :param source_key: see _source_key(); if None, any cached copy is returned
+    :return: DataFrame, or None if the sheet isn't cached (or is out of date)
+    """
+    meta_file, parquet_file, pickle_file = _cache_files(workbook, sheet, cache_dir)
+    try:
+        with open(meta_file) as fin:
+            meta = json.load(fin)
+    except (OSError, ValueError):
+        return None
+    if source_key is not None and meta.get('source_key') != source_key:
+        return None
+    if meta.get('format') == 'parquet':
+        return pd.read_parquet(parquet_file)
+    return pd.read_pickle(pickle_file)
+
+
+def _store(workbook, sheet, cache_dir, source_key, df):
+    meta_file, parquet_file, pickle_file = _cache_files(workbook, sheet, cache_dir)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    try:
+        df.to_parquet(parquet_file + '.tmp')
+        os.replace(parquet_file + '.tmp', parquet_file)
+        file_format = 'parquet'
+    except (ImportError, ValueError, TypeError):
+        # No pyarrow, or columns of mixed types that Parquet can't store
+        df.to_pickle(pickle_file + '.tmp')
+        os.replace(pickle_file + '.tmp', pickle_file)
+        file_format = 'pickle'
+    with open(meta_file + '.tmp', 'w') as fout:
+        json.dump({'workbook': os.path.abspath(workbook), 'sheet': sheet, 'source_key': source_key,
+                   'format': file_format}, fout)
+    os.replace(meta_file + '.tmp', meta_file)
+
+
+def read_sheets(workbook, sheets, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Reads worksheets from a workbook, through the local cache. The workbook is opened only if a
+    sheet isn't cached or the workbook has changed since it was cached.
+
+    :param workbook: path to an Excel workbook
+    :param sheets: list of worksheet names
+    :param cache_dir: directory for the cached worksheets
+    :return: dict of {sheet name: DataFrame}
+    """
+    source_key = _source_key(workbook)
+    result = {}
+    for sheet in sheets:
+        df = _load_cached(workbook, sheet, cache_dir, source_key)
+        if df is not None:
+            result[sheet] = df
+    missing = [sheet for sheet in sheets if sheet not in result]
+    if missing:
+        if source_key is None:
+            raise FileNotFoundError('{} can\'t be reached and isn\'t cached'.format(workbook))
+        xl = pd.ExcelFile(workbook)
+        for sheet in missing:
+            result[sheet] = xl.parse(sheet)
+            _store(workbook, sheet, cache_dir, source_key, result[sheet])
+    elif source_key is None:
+        print('{} can\'t be reached; using the cached copy'.format(workbook))
+    return result
+
+
+def read_sheet(workbook, sheet, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Reads one worksheet; see read_sheets().
+
+    :return: DataFrame
+    """
+    return read_sheets(workbook, [sheet], cache_dir)[sheet]